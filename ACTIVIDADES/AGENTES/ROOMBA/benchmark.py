@@ -0,0 +1,253 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+# Directory of this script, the simulations are next to it
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Metrics compared against the baseline: (direction of better values, default
+# relative tolerance, default absolute floor). Timing and memory are noisy, so a
+# change is only a regression when it is over both the tolerance and the floor,
+# in the unit of the metric (for ticks_per_s, seconds of the run it implies).
+# The search and clean metrics are deterministic
+METRICS = {
+    "construction_s": ("lower", 0.25, 0.05),
+    "ticks_per_s": ("higher", 0.25, 0.05),
+    "slowest_tick_ms": ("lower", 0.5, 50.0),
+    "expansions_per_tick": ("lower", 0.0, 0.0),
+    "peak_memory_mb": ("lower", 0.15, 5.0),
+    "steps_to_clean": ("lower", 0.0, 0.0),
+}
+
+def scenario(simulation, width, num_agents=1, rate_obstacles=0.1, rate_trash=0.2, ticks=3000, **params):
+    """
+    Describe a benchmark scenario.
+    Args:
+        simulation: "simulacion1" (single roomba) or "simulacion2" (multi roomba)
+        width: Side of the square map
+        ticks: Ticks run at most (the run also ends when all the trash is collected)
+        params: Other parameters of RandomModel
+    """
+    params = {
+        "width": width, "height": width, "rate_obstacles": rate_obstacles, "rate_trash": rate_trash,
+        "max_steps": ticks, "seed": 42, **params,
+    }
+    name = f"{simulation}-{width}x{width}-r{rate_obstacles}-t{rate_trash}"
+    if simulation == "simulacion2":
+        params.update(num_agents=num_agents, verbose=False, empty_agents=False)
+        name += f"-n{num_agents}"
+        for flag in ("coordinated", "cooperative", "incremental"):
+            if params.get(flag):
+                name += f"-{flag}"
+        if params.get("pathfinding", "a_star") != "a_star":
+            name += f"-{params['pathfinding']}"
+        if params.get("search_budget") is not None:
+            name += f"-b{params['search_budget']}"
+    return {"name": name, "simulation": simulation, "params": params, "ticks": ticks}
+
+SUITES = {
+    # A few seconds, for every change
+    "quick": [
+        scenario("simulacion1", 28),
+        scenario("simulacion2", 28, num_agents=4),
+        scenario("simulacion2", 50, num_agents=10, rate_obstacles=0.2),
+        scenario("simulacion2", 50, num_agents=10, rate_obstacles=0.2, pathfinding="jps"),
+        scenario("simulacion2", 50, num_agents=10, rate_obstacles=0.2, incremental=True),
+        scenario("simulacion2", 50, num_agents=10, rate_obstacles=0.2, search_budget=64),
+        scenario("simulacion2", 40, num_agents=8, cooperative=True),
+        scenario("simulacion2", 40, num_agents=8, coordinated=True),
+    ],
+    # Map sizes up to 1000x1000 and fleets up to 200 roombas, large maps run a fixed number of ticks
+    "full": [
+        *(scenario("simulacion1", width, rate_obstacles=rates[0], rate_trash=rates[1], ticks=ticks)
+          for width, ticks in ((28, 3000), (100, 3000), (250, 500), (500, 200), (1000, 100))
+          for rates in ((0.1, 0.2), (0.3, 0.05))),
+        *(scenario("simulacion2", width, num_agents=agents, rate_obstacles=rates[0], rate_trash=rates[1], ticks=ticks)
+          for width, agents, ticks in (
+              (28, 1, 3000), (28, 4, 3000), (100, 10, 3000), (100, 50, 3000),
+              (250, 50, 500), (500, 100, 200), (1000, 200, 100),
+          )
+          for rates in ((0.1, 0.2), (0.3, 0.05))),
+        scenario("simulacion2", 100, num_agents=50, cooperative=True),
+        scenario("simulacion2", 100, num_agents=50, coordinated=True),
+        *(scenario("simulacion2", width, num_agents=agents, rate_obstacles=0.3, rate_trash=0.05, ticks=ticks, pathfinding="hpa")
+          for width, agents, ticks in ((500, 100, 200), (1000, 200, 100))),
+        *(scenario("simulacion2", width, num_agents=agents, rate_obstacles=0.3, rate_trash=0.05, ticks=ticks, search_budget=256)
+          for width, agents, ticks in ((250, 50, 500), (1000, 200, 100))),
+    ],
+}
+
+
+class ExpansionCounter:
+    """Receives the nodes expanded by the searches of the model, without timing anything."""
+    def __init__(self):
+        self.nodes = 0
+
+    def expanded(self, nodes):
+        self.nodes += nodes
+
+
+def peakMemoryMb():
+    """Peak resident memory of this process."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # Bytes on macOS, KiB on Linux
+
+def runScenario(scenario):
+    """Run a scenario in this process, the simulation directory must be the working directory."""
+    sys.path.insert(0, os.getcwd())
+    from random_agents.model import RandomModel
+    from random_agents.agent import TrashAgent
+
+    # The models print their final stats
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        model = RandomModel(**scenario["params"])
+        construction = time.perf_counter() - start
+
+        counter = model.profiler = ExpansionCounter()
+        slowest = 0
+        start = time.perf_counter()
+        while model.running and model.steps < scenario["ticks"]:
+            tick = time.perf_counter()
+            model.step()
+            slowest = max(slowest, time.perf_counter() - tick)
+        elapsed = time.perf_counter() - start
+
+    trash_left = len(model.agents_by_type[TrashAgent])
+    return {
+        "construction_s": construction,
+        "ticks": model.steps,
+        "run_s": elapsed,
+        "ticks_per_s": model.steps / elapsed if elapsed > 0 else None,
+        "slowest_tick_ms": slowest * 1000,
+        "expansions": counter.nodes,
+        "expansions_per_tick": counter.nodes / model.steps if model.steps > 0 else 0,
+        "peak_memory_mb": peakMemoryMb(),
+        "steps_to_clean": model.steps if trash_left == 0 else None,
+        "trash_left": trash_left,
+    }
+
+def measure(scenario, repeat=3, timeout=None):
+    """
+    Run a scenario in fresh processes, so the simulations and their peak memory do not mix.
+
+    The best time and memory of the repetitions are kept, the rest of the
+    metrics are the same in every repetition.
+    """
+    best = None
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(scenario)],
+            cwd=os.path.join(ROOT, scenario["simulation"]), capture_output=True, text=True, timeout=timeout,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"{scenario['name']} failed:\n{process.stderr}")
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        if best is None:
+            best = result
+        else:
+            best["construction_s"] = min(best["construction_s"], result["construction_s"])
+            best["run_s"] = min(best["run_s"], result["run_s"])
+            best["ticks_per_s"] = max(best["ticks_per_s"] or 0, result["ticks_per_s"] or 0)
+            best["slowest_tick_ms"] = min(best["slowest_tick_ms"], result["slowest_tick_ms"])
+            best["peak_memory_mb"] = min(best["peak_memory_mb"], result["peak_memory_mb"])
+    return {"name": scenario["name"], "simulation": scenario["simulation"], "params": scenario["params"], **best}
+
+def compare(results, baseline, tolerances, floors=None):
+    """
+    Compare results with a baseline of the same scenarios.
+    Args:
+        results, baseline: Lists of results of measure()
+        tolerances: Dictionary metric -> relative change allowed before it is a regression
+        floors: Dictionary metric -> absolute change ignored as noise (default: the ones of METRICS)
+    Returns a list of (scenario, metric, baseline value, value, relative change, regression).
+    """
+    previous = {result["name"]: result for result in baseline}
+    rows = []
+    for result in results:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+        for metric, (better, _, _) in METRICS.items():
+            before, after = old.get(metric), result.get(metric)
+            if before is None or after is None:
+                # A run that stopped cleaning everything is a regression
+                regression = metric == "steps_to_clean" and before is not None
+                rows.append((result["name"], metric, before, after, None, regression))
+                continue
+            change = (after - before) / before if before else 0.0
+            worse = change > 0 if better == "lower" else change < 0
+            if metric == "ticks_per_s":
+                difference = abs(result["ticks"] / after - old["ticks"] / before) if before and after else 0.0
+            else:
+                difference = abs(after - before)
+            noise = difference <= (floors or {}).get(metric, METRICS[metric][2])
+            rows.append((result["name"], metric, before, after, change, worse and abs(change) > tolerances[metric] and not noise))
+    return rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark suite of the Roomba simulations")
+    parser.add_argument("--suite", choices=list(SUITES), default="quick")
+    parser.add_argument("--only", default=None, help="Only the scenarios whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each scenario, the best time is kept")
+    parser.add_argument("--timeout", type=float, default=None, help="Seconds allowed for each run")
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--baseline", default=None, help="Results of a previous run to compare with")
+    for metric, (_, tolerance, floor) in METRICS.items():
+        parser.add_argument(f"--tolerance-{metric.replace('_', '-')}", type=float, default=tolerance,
+                            dest=f"tolerance_{metric}", help=f"Relative change of {metric} allowed")
+        parser.add_argument(f"--floor-{metric.replace('_', '-')}", type=float, default=floor,
+                            dest=f"floor_{metric}", help=f"Absolute change of {metric} ignored as noise")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # Child process of measure()
+    if args.worker is not None:
+        print(json.dumps(runScenario(json.loads(args.worker))))
+        sys.exit(0)
+
+    scenarios = [s for s in SUITES[args.suite] if args.only is None or args.only in s["name"]]
+    results = []
+    for s in scenarios:
+        result = measure(s, args.repeat, args.timeout)
+        results.append(result)
+        print(f"{s['name']}: built in {result['construction_s']:.3f}s, {result['ticks_per_s']:.1f} ticks/s, "
+              f"slowest tick {result['slowest_tick_ms']:.1f} ms, "
+              f"{result['expansions_per_tick']:.1f} expansions/tick, {result['peak_memory_mb']:.1f} MB, "
+              f"clean at {result['steps_to_clean']}")
+
+    with open(args.out, "w") as file:
+        json.dump({
+            "suite": args.suite,
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "results": results,
+        }, file, indent=2)
+    print(f"Results written to {args.out}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        tolerances = {metric: getattr(args, f"tolerance_{metric}") for metric in METRICS}
+        floors = {metric: getattr(args, f"floor_{metric}") for metric in METRICS}
+        regressions = 0
+        for name, metric, before, after, change, regression in compare(results, baseline, tolerances, floors):
+            if change is None and not regression:
+                continue
+            mark = "REGRESSION" if regression else ""
+            shown = f"{change:+.1%}" if change is not None else "n/a"
+            print(f"{name:<50} {metric:<20} {before!s:>12.10} -> {after!s:<12.10} {shown:>8} {mark}")
+            regressions += regression
+        print(f"{regressions} regressions against {args.baseline}")
+        sys.exit(1 if regressions else 0)
@@ -2,6 +2,8 @@ from mesa.discrete_space import CellAgent, FixedAgent
 from collections import deque
 import heapq
 
+from .spatial import TrashIndex
+
 class Roomba(CellAgent):
     """
     Agent that moves randomly.
@@ -22,12 +24,13 @@ class Roomba(CellAgent):
         self.stationCell = self.cell
 
         self.visited_cells = set(self.cell.coordinate)
-        self.trash_known_cells = set()
+        self.trash_known_cells = TrashIndex()
 
         self.path_back_to_station = []
         self.distance_to_station = 0
         self.steps = 0
         self.hasBattery = True
+        self.dormant = False #Dormant roombas are skipped by the model scheduler
 
     # Action methods that allow the agent to check its environment and change its state
 
@@ -50,6 +53,10 @@ class Roomba(CellAgent):
             (obj for obj in self.cell.agents if isinstance(obj, TrashAgent)), None
         )
 
+        # Forget known trash that is no longer here (e.g. cleaned by another roomba)
+        if trash_cell is None:
+            self.trash_known_cells.discard(self.cell.coordinate)
+
         # Add trash cell to known trash cells for future reference
         if (self.state == "returning") and trash_cell is not None:
             self.trash_known_cells.add(self.cell.coordinate)
@@ -166,6 +173,9 @@ class Roomba(CellAgent):
                         # Add to stack
                         heapq.heappush(stack, (f_value, neighbor))
 
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(len(visited))
+
         # Reconstruct path
         if goal in fathers:
             path = []
@@ -206,6 +216,7 @@ class Roomba(CellAgent):
     def clean(self, trash_cell):
         """Clean the trash cell that is in the current cell."""
         trash_cell.with_trash = False
+        self.trash_known_cells.discard(trash_cell.cell.coordinate)
         trash_cell.remove()
         self.state = "idle"  #change state to idle after cleaning
 
@@ -240,6 +251,8 @@ class Roomba(CellAgent):
 
             #if the cell has not been visited yet, return path to it
             if cell.coordinate not in self.visited_cells and not any(isinstance(a, ObstacleAgent) for a in cell.agents):
+                if self.model.profiler is not None:
+                    self.model.profiler.expanded(len(visited))
                 return self.a_star(start, cell.coordinate)
     
             #explore neighbors
@@ -257,16 +270,76 @@ class Roomba(CellAgent):
                     visited.add(neighbor)
                     queue.append(neighbor)
         
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(len(visited))
+
         #if no unvisited cell found, return empty path
         return []
     
     def pathToNearestKnownTrash(self):
-        """Find the nearest known trash cell for the roomba to move to."""
+        """
+        Find the path to the nearest known trash cell.
+
+        Multi-goal A* that uses the Chebyshev distance to the nearest known
+        trash (from the spatial index) as heuristic, and stops at the first
+        known trash cell reached.
+        """
         if not self.trash_known_cells: #If no known trash cells, return empty path, just in case
             return []
 
-        trash_cell = self.trash_known_cells.pop() #get the last known trash cell
-        return self.a_star(self.cell.coordinate, trash_cell)
+        grid = self.model.grid
+        start = self.cell.coordinate
+        stack = [] # Stack of nodes to explore
+        c_list = {}  # g values
+        visited = set()  # visited nodes
+        fathers = {}
+        goal = None
+
+        heapq.heappush(stack, (self.trash_known_cells.nearest(start)[0], start))
+        c_list[start] = 0
+
+        while len(stack) > 0:
+            _, current = heapq.heappop(stack)
+
+            if current in visited:
+                continue
+            visited.add(current)
+
+            # Stop at the first known trash reached, it is the nearest by path
+            if current in self.trash_known_cells:
+                goal = current
+                break
+
+            valid_neighbors = grid[current].neighborhood.select(
+                lambda cell: not any(isinstance(a, ObstacleAgent) for a in cell.agents)
+            )
+
+            for neighbor_cell in valid_neighbors:
+                neighbor = neighbor_cell.coordinate
+                actual_c = c_list[current] + 1 # Cost between nodes is 1
+
+                if (actual_c < c_list.get(neighbor, float('inf'))):
+                    c_list[neighbor] = actual_c
+                    fathers[neighbor] = current
+                    f_value = actual_c + self.trash_known_cells.nearest(neighbor)[0]
+                    heapq.heappush(stack, (f_value, neighbor))
+
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(len(visited))
+
+        # None of the known trash can be reached from here, forget it
+        if goal is None:
+            self.trash_known_cells.clear()
+            return []
+
+        # Reconstruct path
+        path = []
+        current = goal
+        while current != start:
+            path.append(current)
+            current = fathers[current]
+        path.reverse()
+        return path
     
     def distanceToStation(self):
         """Calculate the distance to the nearest station using Chebyshev distance."""
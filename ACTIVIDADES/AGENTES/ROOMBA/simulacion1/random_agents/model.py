@@ -24,8 +24,14 @@ class RandomModel(Model):
         self.width = width
         self.height = height
 
+        # Only these agent types have behavior in step, the rest are static
+        self.active_types = [Roomba]
+
+        # Optional receiver of the nodes expanded by the searches (e.g. a benchmark counter)
+        self.profiler = None
+
         # Initialize grid
-        self.grid = OrthogonalMooreGrid([width, height], torus=False)
+        self.grid = OrthogonalMooreGrid([width, height], torus=False, random=self.random)
 
         # Setup data collection
         model_reporters = {
@@ -74,7 +80,11 @@ class RandomModel(Model):
         if not self.running:
             return
 
-        self.agents.shuffle_do("step")
+        # Activate only the agent types with behavior, skipping dormant agents
+        for agent_type in self.active_types:
+            self.agents_by_type[agent_type].select(
+                lambda agent: not agent.dormant
+            ).shuffle_do("step")
         
         # Collect data
         self.datacollector.collect(self)
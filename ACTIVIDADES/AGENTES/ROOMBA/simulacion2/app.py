@@ -1,4 +1,4 @@
-from random_agents.agent import Roomba, ObstacleAgent, TrashAgent, StationAgent, EmptyAgent
+from random_agents.agent import Roomba
 from random_agents.model import RandomModel
 
 from matplotlib.figure import Figure
@@ -8,53 +8,24 @@ from mesa.visualization import (
     CommandConsole,
     Slider,
     SolaraViz,
-    SpaceRenderer,
     make_plot_component,
 )
 
 from mesa.visualization.components import AgentPortrayalStyle
 
+from renderer import LayeredRenderer
+
 def random_portrayal(agent):
-    if agent is None:
+    """Portrayal of the roombas, the rest of the map is drawn as image layers."""
+    if not isinstance(agent, Roomba):
         return
 
-    portrayal = AgentPortrayalStyle(
-        size=50,
+    return AgentPortrayalStyle(
+        color="#007AFF",
         marker="o",
+        size=60,
     )
 
-    if isinstance(agent, Roomba):
-        portrayal.color = "#007AFF"
-        portrayal.marker = "o"
-        portrayal.size = 60
-
-    elif isinstance(agent, StationAgent):
-        portrayal.color = "#FFC107"
-        portrayal.marker = "v"
-        portrayal.size = 55
-
-    elif isinstance(agent, ObstacleAgent):
-        portrayal.color = "#8C8888"
-        portrayal.marker = "s"
-        portrayal.size = 50
-
-    elif isinstance(agent, TrashAgent):
-        portrayal.color = "#FF0000"
-        portrayal.marker = "x"
-        portrayal.size = 35
-
-    elif isinstance(agent, EmptyAgent):
-        if agent.visited:
-            portrayal.color = "lightgray"
-            portrayal.marker = "."
-            portrayal.size = 50
-        else:
-            portrayal.color = "white"
-            portrayal.marker = "."
-            portrayal.size = 0.0001
-
-    return portrayal
-
 
 model_params = {
     "seed": {
@@ -67,11 +38,22 @@ model_params = {
         "value": 3000,
         "label": "Maximum Steps",
     },
+    "coordinated": {
+        "type": "Checkbox",
+        "value": False,
+        "label": "Coordinated Roombas",
+    },
+    "cooperative": {
+        "type": "Checkbox",
+        "value": False,
+        "label": "Cooperative Pathfinding",
+    },
     "num_agents": Slider("Number of Roombas", 2, 1, 10),
     "width": Slider("Grid width", 28, 1, 50),
     "height": Slider("Grid height", 28, 1, 50),
     "rate_obstacles": Slider("Obstacle Rate", 0.1, 0, 0.9, 0.05),
     "rate_trash": Slider("Trash Rate", 0.2, 0, 0.9, 0.05),
+    "empty_agents": False,  # Visited cells are drawn from the model layer
 }
 
 # Create the model using the initial parameters from the settings
@@ -83,6 +65,9 @@ model = RandomModel(
     height=model_params["height"].value,
     rate_obstacles=model_params["rate_obstacles"].value,
     rate_trash=model_params["rate_trash"].value,
+    coordinated=model_params["coordinated"]["value"],
+    cooperative=model_params["cooperative"]["value"],
+    empty_agents=model_params["empty_agents"],
 )
 
 def post_process(ax):
@@ -96,7 +81,7 @@ lineplot_component = make_plot_component(
     post_process=post_process_lines,
 )
 
-renderer = SpaceRenderer(
+renderer = LayeredRenderer(
     model,
     backend="matplotlib",
 )
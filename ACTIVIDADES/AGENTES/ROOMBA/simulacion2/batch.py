@@ -0,0 +1,71 @@
+import argparse
+
+from random_agents.sweep import adaptiveSweep, sweep
+
+# Strategies of the roombas that can be compared in a sweep
+STRATEGIES = {
+    "default": {"coordinated": False, "cooperative": False},
+    "coordinated": {"coordinated": True, "cooperative": False},
+    "cooperative": {"coordinated": False, "cooperative": True},
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless parameter sweep of the Roomba simulation")
+    parser.add_argument("--num-agents", type=int, nargs="+", default=[2])
+    parser.add_argument("--rate-obstacles", type=float, nargs="+", default=[0.1])
+    parser.add_argument("--rate-trash", type=float, nargs="+", default=[0.2])
+    parser.add_argument("--width", type=int, nargs="+", default=[28])
+    parser.add_argument("--height", type=int, nargs="+", default=[28])
+    parser.add_argument("--max-steps", type=int, default=3000)
+    parser.add_argument("--strategy", choices=list(STRATEGIES), nargs="+", default=["default"])
+    parser.add_argument("--replications", type=int, default=10,
+                        help="Runs of each configuration (minimum runs with --adaptive)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Add replications in waves until the results are precise")
+    parser.add_argument("--max-replications", type=int, default=50)
+    parser.add_argument("--relative-width", type=float, default=0.05,
+                        help="Confidence interval width, relative to the mean, that stops a configuration")
+    parser.add_argument("--no-prune", action="store_true", help="Do not stop dominated configurations")
+    parser.add_argument("--seed", type=int, default=42, help="Base seed of the streams of all runs")
+    parser.add_argument("--world-seed", type=int, nargs="+", default=None,
+                        help="Fixed maps shared by all runs (default: a new map in every run)")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="sweep.csv")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # One grid per strategy, so flags of different strategies are not combined
+    grid = [
+        {
+            "num_agents": args.num_agents,
+            "rate_obstacles": args.rate_obstacles,
+            "rate_trash": args.rate_trash,
+            "width": args.width,
+            "height": args.height,
+            "max_steps": [args.max_steps],
+            "coordinated": [STRATEGIES[name]["coordinated"]],
+            "cooperative": [STRATEGIES[name]["cooperative"]],
+        }
+        for name in args.strategy
+    ]
+    if args.world_seed is not None:
+        for subgrid in grid:
+            subgrid["world_seed"] = args.world_seed
+
+    if args.adaptive:
+        summary = adaptiveSweep(
+            grid, relative_width=args.relative_width, min_replications=args.replications,
+            max_replications=args.max_replications, prune=not args.no_prune,
+            base_seed=args.seed, workers=args.workers, out=args.out
+        )
+        print(summary.to_string(index=False))
+    else:
+        results = sweep(grid, args.replications, args.seed, args.workers, args.out)
+
+        # Summary of each configuration
+        summary = results.groupby(["num_agents", "rate_obstacles", "rate_trash", "width", "height", "coordinated", "cooperative"])[
+            ["Steps to Clean", "Trash Collected %", "Roombas Alive", "Battery %"]
+        ].mean()
+        print(summary)
@@ -0,0 +1,23 @@
+# pytest puts the directory of this file on sys.path, so the tests import
+# random_agents the same way the apps and scripts of this simulation do
+import pytest
+
+from random_agents.model import RandomModel
+
+
+@pytest.fixture
+def make_model():
+    """Build a quiet RandomModel, the keyword arguments replace the defaults."""
+    def make(**params):
+        defaults = {"num_agents": 4, "width": 20, "height": 20, "seed": 1, "verbose": False, "empty_agents": False}
+        return RandomModel(**{**defaults, **params})
+    return make
+
+
+def run(model, ticks=None):
+    """Step a model until it stops, or for a number of ticks."""
+    steps = 0
+    while model.running and (ticks is None or steps < ticks):
+        model.step()
+        steps += 1
+    return model
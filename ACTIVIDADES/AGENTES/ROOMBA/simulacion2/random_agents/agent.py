@@ -1,6 +1,12 @@
 from mesa.discrete_space import CellAgent, FixedAgent
 from collections import deque
+import bisect
 import heapq
+import math
+
+from .knowledge import KnowledgeMap
+from .pathfinding import DIRECTIONS, AnytimeSearch, DStarLite, LazyPath, heuristicFunction, jumpPointSearch
+from .spatial import TrashIndex
 
 class Roomba(CellAgent):
     """
@@ -18,14 +24,25 @@ class Roomba(CellAgent):
         super().__init__(model)
         self.cell = cell
         self.state = "idle"
+
+        # Battery and steps are properties that keep the model metrics updated
+        self._battery = 0
+        self._steps = 0
+        self.model.metrics.roombas_alive += 1
         self.battery = 100  
         self.stationCells = [self.cell.coordinate]
+        self.station = None  # Station where the roomba is queued to recharge
         self.trash_cleaned = 0 
 
-        self.visited_cells =  {self.cell.coordinate}
-        self.trash_known_cells = set()
+        self.visited_cells = KnowledgeMap(model.width, model.height, [self.cell.coordinate])
+        self.partner_versions = {}  # Version of each partner's knowledge already received
+        self.trash_known_cells = TrashIndex()
+        self.frontier = TrashIndex()  # Unvisited cells next to visited ones, indexed like the trash
+        self.frontier_version = 0  # Visited cells already added to the frontier
 
         self.path_back_to_station = []
+        self.planner = None  # D* Lite search of the return path, when the model is incremental
+        self.search = None  # Last budgeted search of a_star, it goes on while the roomba follows it
         self.distance_to_station = 0
         
         self.hasInfo = False
@@ -33,6 +50,63 @@ class Roomba(CellAgent):
         self.steps = 0
         self.hasBattery = True
 
+        # Target given by the model coordinator, if any
+        self.assigned_target = None
+        self.assigned_path = []
+        self.dormant = False #Dormant roombas are skipped by the model scheduler
+
+    @property
+    def cell(self):
+        """Cell where the roomba is."""
+        return self._mesa_cell
+
+    @cell.setter
+    def cell(self, cell):
+        """Move the roomba to a cell, keeping the model position index updated."""
+        positions = self.model.roomba_positions
+        if self._mesa_cell is not None:
+            roombas = positions[self._mesa_cell.coordinate]
+            roombas.remove(self)
+            if not roombas:
+                del positions[self._mesa_cell.coordinate]
+        if cell is not None:
+            positions.setdefault(cell.coordinate, []).append(self)
+        CellAgent.cell.fset(self, cell)
+
+    @property
+    def battery(self):
+        """Battery percentage of the roomba."""
+        return self._battery
+
+    @battery.setter
+    def battery(self, value):
+        """Set the battery, keeping the model running total updated."""
+        self.model.metrics.battery_total += value - self._battery
+        self._battery = value
+
+    @property
+    def steps(self):
+        """Number of cells the roomba has moved."""
+        return self._steps
+
+    @steps.setter
+    def steps(self, value):
+        """Set the steps, keeping the model running total updated."""
+        self.model.metrics.steps_total += value - self._steps
+        self._steps = value
+
+    def remove(self):
+        """Remove the roomba from the model, the running metrics and the event log."""
+        if self.model.events is not None:
+            self.model.events.death(self, self.model.steps)
+        if self.model.changes is not None:
+            self.model.changes.death(self)
+        metrics = self.model.metrics
+        metrics.roombas_alive -= 1
+        metrics.battery_total -= self._battery
+        metrics.steps_total -= self._steps
+        super().remove()
+
     # Action methods that allow the agent to check its environment and change its state
 
     def checkBattery(self):
@@ -46,11 +120,25 @@ class Roomba(CellAgent):
         if self.battery <= total_distance:
             self.hasBattery = False
             self.state = "returning" #change state to returning to station if battery is low
+
+            # Enqueue at a station as soon as the roomba starts returning
+            if self.model.reservations is None and self.station is None:
+                self.reserveStation()
         else:
             self.state = "ready" #change state to ready if battery is sufficient
 
     def checkStation(self):
         """Check if an agent is at the station."""
+        # Woken up by the station queue, go take the slot
+        if self.model.reservations is None:
+            self.state = "returning"
+            return
+
+        # A planned wait is over, keep following the reserved path
+        if self.path_back_to_station:
+            self.state = "returning"
+            return
+
         station_cell = next(
             (cell for cell in self.cell.neighborhood
              if any(isinstance(obj, StationAgent) for obj in cell.agents)), None
@@ -62,6 +150,8 @@ class Roomba(CellAgent):
                 self.move(station_cell)
             else:
                 self.state = "waiting" #change state to waiting if station is occupied
+        else:
+            self.state = "returning" #parked away from the stations, plan the return again
 
 
     def checkTrash(self):
@@ -70,6 +160,10 @@ class Roomba(CellAgent):
             (obj for obj in self.cell.agents if isinstance(obj, TrashAgent)), None
         )
 
+        # Forget known trash that is no longer here (e.g. cleaned by another roomba)
+        if trash_cell is None:
+            self.trash_known_cells.discard(self.cell.coordinate)
+
         # Add trash cell to known trash cells for future reference
         if (self.state == "returning") and trash_cell is not None:
             self.trash_known_cells.add(self.cell.coordinate)
@@ -99,9 +193,11 @@ class Roomba(CellAgent):
             lambda cell: cell.coordinate not in self.visited_cells
         )
 
-        # Prioritize cells with trash, then unvisited cells, then any valid neighbor
+        # Prioritize cells with trash, then the assigned target, then unvisited cells, then any valid neighbor
         if trash_cells:
             next_cell = trash_cells.select_random_cell()
+        elif self.assigned_path and self.assigned_path[0] in {cell.coordinate for cell in valid_neighbors}:
+            next_cell = self.model.grid[self.assigned_path.pop(0)]
         elif unvisited_cells:
             next_cell = unvisited_cells.select_random_cell()
         else:
@@ -116,17 +212,49 @@ class Roomba(CellAgent):
             else: #If there are no known trash or unvisited cells, move randomly
                 next_cell = valid_neighbors.select_random_cell()
 
+        # In cooperative mode, do not step into cells reserved by other roombas
+        if self.model.reservations is not None:
+            next_cell = self.reserveNextCell(next_cell, valid_neighbors)
+            if next_cell is None:
+                self.state = "idle" #stay in place this step
+                return None
+
         self.state = "moving" #change state to moving after deciding next cell
         return next_cell
+
+    def reserveNextCell(self, next_cell, valid_neighbors):
+        """
+        Reserve the next cell in the shared reservation table.
+
+        If the chosen cell is taken by another roomba, a free neighbor is
+        chosen instead. Returns None if the roomba has to stay in place.
+        """
+        table = self.model.reservations
+        tick = self.model.steps + 1
+        origin = self.cell.coordinate
+        table.release(self.unique_id)
+
+        if not table.canMove(origin, next_cell.coordinate, tick, self.unique_id):
+            free_cells = valid_neighbors.select(
+                lambda cell: table.canMove(origin, cell.coordinate, tick, self.unique_id)
+            )
+            next_cell = free_cells.select_random_cell() if free_cells else None
+
+        if next_cell is None:
+            table.reserve(origin, tick, self.unique_id)
+            return None
+
+        table.reserve(next_cell.coordinate, tick, self.unique_id)
+        table.reserveMove(origin, next_cell.coordinate, tick, self.unique_id)
+        return next_cell
     
     def checkRoombas(self, roomba_cell):
         """Check if another roomba is in the cell."""
-        roomba_cells = roomba_cell.neighborhood.select(
-            lambda cell: any(isinstance(obj, Roomba) and obj != self for obj in cell.agents)
-        ) # Get neighboring cells with other roombas
+        positions = self.model.roomba_positions
         roomba_agent = next(
-            (obj for cell in roomba_cells for obj in cell.agents if isinstance(obj, Roomba) and obj != self), None
-        ) # Get the first roomba agent found that is not self
+            (obj for cell in roomba_cell.neighborhood
+             for obj in positions.get(cell.coordinate, ()) if obj != self), None
+        ) # Get the first neighboring roomba from the model position index
 
         #If another roomba is found, set hasInfo to true and start info timer
         if roomba_agent and not self.hasInfo:
@@ -135,20 +263,39 @@ class Roomba(CellAgent):
             self.state = "checkTrash"
         return roomba_agent
 
-    def a_star(self, start, goal):
+    def a_star(self, start, goal, heuristic=None, method=None):
         """
         A* pathfinding algorithm adapted for the grid in the model
 
         This algorithm was adapted from the one made in the advanced algorithm class
         with Lizbeth Peralta. Made by Diego Cordova, Aquiba Benarroch and me.
+        Args:
+            start, goal: Coordinates
+            heuristic: Name in pathfinding.HEURISTICS or function of two coordinates (default: the model heuristic)
+            method: "a_star", "jps" for Jump Point Search or "hpa" for the hierarchical search,
+                which returns a LazyPath on long queries (default: the model pathfinding)
+        With a model search budget, "a_star" runs anytimeSearch instead and may
+        return a partial path.
         """
+        # Goals in another connected component can not be reached, do not search for them
+        if not self.model.grid_map.connected(start, goal):
+            return []
 
-        # Calculate Manhattan distance
-        # We have to estimate heuristic using this distance
-        # since it is not given from the model
+        # Estimate of the distance to the goal
         # Ref: https://www.geeksforgeeks.org/dsa/a-search-algorithm/
-        def heuristic(a, b):
-            return abs(a[0] - b[0]) + abs(a[1] - b[1])
+        heuristic = heuristicFunction(heuristic or self.model.heuristic)
+
+        method = method or self.model.pathfinding
+        if method == "a_star" and self.model.search_budget is not None:
+            return self.anytimeSearch(start, goal, heuristic)
+        if method == "jps":
+            path, expanded = jumpPointSearch(self.model.grid_map, start, goal, heuristic)
+            self.expandedNodes(expanded)
+            return path
+        if method == "hpa":
+            path, expanded = self.model.hierarchy.findPath(start, goal, heuristic, self.expandedNodes)
+            self.expandedNodes(expanded)
+            return path
 
         # Initialize variables
         grid = self.model.grid
@@ -160,8 +307,8 @@ class Roomba(CellAgent):
         fathers = {}
 
         # Initialize stack with start node
-        # Heap already sorts by smallest f value
-        heapq.heappush(stack, (0, start))
+        # Heap already sorts by smallest f value, ties go to the node closest to the goal
+        heapq.heappush(stack, (0, 0, start))
         c_list[start] = 0
 
         # While the stack is not empty
@@ -169,9 +316,9 @@ class Roomba(CellAgent):
         while len(stack) > 0:
             
             # Get node with lowest f value
-            # This returns f, coordinate
+            # This returns f, h, coordinate
             # but we only need coordinate, so we use _
-            _, current = heapq.heappop(stack)
+            _, _, current = heapq.heappop(stack)
 
             # If the node hasnt been visited, process it
             if current not in visited:
@@ -198,10 +345,14 @@ class Roomba(CellAgent):
                     if (actual_c < c_list.get(neighbor, float('inf'))):
                         c_list[neighbor] = actual_c
                         fathers[neighbor] = current
-                        f_value = actual_c + heuristic(neighbor, goal)
+                        h_value = heuristic(neighbor, goal)
+                        f_value = actual_c + h_value
 
                         # Add to stack
-                        heapq.heappush(stack, (f_value, neighbor))
+                        heapq.heappush(stack, (f_value, h_value, neighbor))
+
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(len(visited))
 
         # Reconstruct path
         if goal in fathers:
@@ -215,37 +366,149 @@ class Roomba(CellAgent):
         
         # If no path found, return empty list
         return []
-    
+
+    def anytimeSearch(self, start, goal, heuristic):
+        """
+        Budget-bounded weighted A*, kept between calls.
+
+        The search of the previous call goes on if it has the same goal and
+        heuristic and start is in its tree (the roomba followed its path),
+        otherwise a new one starts from start.
+        Returns the path to the goal, or to the most promising node found
+        while the goal is not reached.
+        """
+        search = self.search
+        if search is None or search.goal != goal or search.heuristic is not heuristic or start not in search:
+            search = self.search = AnytimeSearch(
+                self.model.grid_map, start, goal, heuristic, self.model.search_weight
+            )
+        self.expandedNodes(search.run(self.model.search_budget))
+        return search.path(start)
+
+    def expandedNodes(self, nodes):
+        """Report the nodes expanded by a search to the profiler, if there is one."""
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(nodes)
+
+    def cooperative_a_star(self, start, goal, hold=0, limit=None):
+        """
+        Windowed cooperative A* over space and time.
+
+        Searches (cell, tick) states against the shared reservation table,
+        waiting in place is allowed. The goal is only accepted when it is
+        free for `hold` more ticks after arrival (the charging slot).
+        If the goal is not reached inside the model horizon, the path to the
+        node closest to the goal is returned so the roomba can replan later.
+        With a `limit`, states that can not reach the goal in that many ticks
+        are not searched.
+        Returns the path (repeated coordinates are waits) and whether it
+        reaches the goal.
+        """
+        def heuristic(a):
+            # Chebyshev distance, exact on an empty 8-connected grid
+            return max(abs(a[0] - goal[0]), abs(a[1] - goal[1]))
+
+        grid = self.model.grid
+        table = self.model.reservations
+        tick = self.model.steps
+        horizon = self.model.horizon
+
+        stack = [(heuristic(start), 0, start)]
+        fathers = {(start, 0): None}
+        visited = set()
+        neighbors = {}  # Valid neighbors of each cell, the same cell is expanded at many ticks
+        best = (heuristic(start), 0, start) # Closest node to the goal found
+        end = None
+
+        while len(stack) > 0:
+            _, g, current = heapq.heappop(stack)
+
+            if (current, g) in visited:
+                continue
+            visited.add((current, g))
+
+            if (heuristic(current), g) < best[:2]:
+                best = (heuristic(current), g, current)
+
+            # The goal must also be free while charging
+            if current == goal and table.isFreeInterval(goal, tick + g, tick + g + hold, self.unique_id):
+                end = (current, g)
+                break
+
+            # Only plan inside the window
+            if g >= horizon:
+                continue
+
+            if current not in neighbors:
+                valid_neighbors = grid[current].neighborhood.select(
+                    lambda cell: not any(isinstance(a, ObstacleAgent) for a in cell.agents)
+                )
+                neighbors[current] = [cell.coordinate for cell in valid_neighbors]
+            options = neighbors[current] + [current]
+
+            for neighbor in options:
+                state = (neighbor, g + 1)
+                if state in fathers:
+                    continue
+                if limit is not None and g + 1 + heuristic(neighbor) > limit:
+                    continue
+                if not table.canMove(current, neighbor, tick + g + 1, self.unique_id):
+                    continue
+                fathers[state] = (current, g)
+                heapq.heappush(stack, (g + 1 + heuristic(neighbor), g + 1, neighbor))
+
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(len(visited))
+
+        reached = end is not None
+        if not reached:
+            end = (best[2], best[1])
+
+        # Reconstruct path, without the start state
+        path = []
+        state = end
+        while fathers[state] is not None:
+            path.append(state[0])
+            state = fathers[state]
+        path.reverse()
+        return path, reached
+
 
     def move(self, cell):
         """Move to a neighboring cell, prioritizing cells with trash."""
 
-        #If the cell is a station, and is occupied, wait
-        if cell.coordinate in self.stationCells and not self.hasBattery and self.stationOccupied(cell):
-            self.state = "waiting"
-            return
+        #If the cell is a station, and it can't be used now, wait
+        if cell.coordinate in self.stationCells and not self.hasBattery and not self.canCharge(cell):
+            if self.model.reservations is not None:
+                self.state = "waiting"
+                return
+            if self.model.stations[cell.coordinate] is self.station:
+                self.sleepUntilCalled() #Sleep next to our station until it is our turn
+                return
         
         # Move to the cell
+        if self.model.changes is not None:
+            self.model.changes.move(self, self.cell.coordinate, cell.coordinate)
         self.cell = cell
 
+        # Leaving the assigned path or reaching the target ends the assignment
+        if self.assigned_path and self.assigned_path[0] == cell.coordinate:
+            self.assigned_path.pop(0)
+        x, y = cell.coordinate
+        if cell.coordinate == self.assigned_target:
+            self.releaseAssignment()
+        elif self.assigned_path and max(abs(self.assigned_path[0][0] - x), abs(self.assigned_path[0][1] - y)) > 1:
+            self.releaseAssignment()
+
         #Add current cell to visited cells 
         self.visited_cells.add(cell.coordinate)
         self.steps += 1
 
-        visited_agent = next(
-            (obj for obj in cell.agents if isinstance(obj, EmptyAgent)), None
-        )
-        if visited_agent:
-            visited_agent.visited = True
+        self.model.visited[cell.coordinate] = True
 
         #For station, check if reached and recharge battery
-        if self.cell.coordinate in self.stationCells and not self.hasBattery:
-            occupied = self.stationOccupied(self.cell)
-            if not occupied:
-                self.state = "recharging"  #change state to recharging when at station
-                self.path_back_to_station = [] #clear path back to station
-            else:
-                self.state = "waiting"  #change state to waiting if station is occupied
+        if self.cell.coordinate in self.stationCells and not self.hasBattery and self.canCharge(self.cell):
+            self.startCharging(self.cell)  #change state to recharging when at station
         else:
             self.state = "idle"  #change state to idle after moving
             
@@ -253,30 +516,99 @@ class Roomba(CellAgent):
     def clean(self, trash_cell):
         """Clean the trash cell that is in the current cell."""
         trash_cell.with_trash = False
+        if self.model.events is not None:
+            self.model.events.clean(self, self.model.steps, trash_cell.cell.coordinate)
+        self.trash_known_cells.discard(trash_cell.cell.coordinate)
         trash_cell.remove()
+        if self.model.changes is not None:
+            self.model.changes.clean(self, self.cell.coordinate)
         self.trash_cleaned += 1
         self.state = "idle"  #change state to idle after cleaning
 
 
     def getNextReturnStep(self):
         """Get the next step to return to the station using A* algorithm."""
-        if not self.path_back_to_station:
-            self.calculateReturnPath() # Calculate path if not already done
+        if not self.path_back_to_station or self.searchingReturnPath():
+            self.calculateReturnPath() # Calculate path if not already done, or go on with a budgeted search
 
         if self.path_back_to_station:
             next_coord = self.path_back_to_station.pop(0) # Get next coordinate in path and remove it from the list
+
+            # A repeated coordinate is a wait planned in the reservation table
+            if next_coord == self.cell.coordinate:
+                self.state = "waiting"
+                return None
+
             next_cell = self.model.grid[next_coord]
             self.state = "moving"  #change state to moving when returning
             return next_cell
-        else:
+        elif self.state != "recharging":
             self.state = "idle"  #change state to idle if no path back to station
             return None
         
+    def searchingReturnPath(self):
+        """Whether the return path comes from a budgeted search that has not reached the station yet."""
+        search = self.search
+        return (
+            search is not None and not search.done and self.station is not None
+            and search.goal == self.station.cell.coordinate
+            and self.model.reservations is None and not self.model.incremental
+        )
+
+    def updateFrontier(self):
+        """
+        Add the free unvisited neighbors of the cells visited since the last
+        update to the frontier, and drop the cells visited since then.
+
+        Only the journal of the visited cells after the last update is read,
+        so each visited cell is looked at once.
+        """
+        grid_map = self.model.grid_map
+        visited = self.visited_cells
+        for index in visited.deltaSince(self.frontier_version):
+            x, y = visited.coordinate(index)
+            self.frontier.discard((x, y))
+            for dx, dy in DIRECTIONS:
+                neighbor = (x + dx, y + dy)
+                if grid_map.isFree(*neighbor) and neighbor not in visited:
+                    self.frontier.add(neighbor)
+        self.frontier_version = visited.version
+
+    def nearestUnvisited(self):
+        """
+        Nearest cell (by Chebyshev distance) of the frontier that this roomba
+        can reach, None if every reachable cell is visited.
+
+        Any unvisited cell in the component of the roomba has one of the
+        frontier on the way to it, so the frontier is enough to know whether
+        something is left to visit. Cells of another component are dropped
+        from it, the components only change with the map, and then the
+        frontier is built again.
+        """
+        self.updateFrontier()
+        start = self.cell.coordinate
+        while True:
+            _, target = self.frontier.nearest(start)
+            if target is None or self.model.grid_map.connected(start, target):
+                return target
+            self.frontier.discard(target)
+
     def pathToNearestUnvisited(self):
-        """Find the nearest unvisited cell for the roomba to move to."""
+        """
+        Find the nearest unvisited cell for the roomba to move to.
+
+        With a search budget, the nearest by Chebyshev distance is reached
+        with a_star, so a long search goes on in the next ticks.
+        """
         grid = self.model.grid
         start = self.cell.coordinate
 
+        target = self.nearestUnvisited()
+        if target is None:
+            return []
+        if self.model.search_budget is not None:
+            return self.a_star(start, target)
+
         visited = set(start)
         queue = deque([start]) 
 
@@ -287,6 +619,8 @@ class Roomba(CellAgent):
 
             #if the cell has not been visited yet, return path to it
             if cell.coordinate not in self.visited_cells and not any(isinstance(a, ObstacleAgent) for a in cell.agents):
+                if self.model.profiler is not None:
+                    self.model.profiler.expanded(len(visited))
                 return self.a_star(start, cell.coordinate)
     
             #explore neighbors
@@ -304,16 +638,92 @@ class Roomba(CellAgent):
                     visited.add(neighbor)
                     queue.append(neighbor)
         
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(len(visited))
+
         #if no unvisited cell found, return empty path
         return []
     
     def pathToNearestKnownTrash(self):
-        """Find the nearest known trash cell for the roomba to move to."""
-        if not self.trash_known_cells: #If no known trash cells, return empty path, just in case
+        """
+        Find the path to the nearest known trash cell.
+
+        Multi-goal A* that uses the Chebyshev distance to the nearest known
+        trash (from the spatial index) as heuristic, and stops at the first
+        known trash cell reached. With hierarchical pathfinding, trash that is
+        all farther than a cluster is reached with a_star instead, and so is
+        the nearest trash by Chebyshev distance with a search budget.
+        """
+        grid = self.model.grid
+        start = self.cell.coordinate
+
+        # Known trash in another connected component (cut off with setPassable) is forgotten
+        distance, target = self.trash_known_cells.nearest(start)
+        while target is not None and not self.model.grid_map.connected(start, target):
+            self.trash_known_cells.discard(target)
+            distance, target = self.trash_known_cells.nearest(start)
+        if target is None: #If no known trash cells, return empty path, just in case
             return []
 
-        trash_cell = self.trash_known_cells.pop() #get the last known trash cell
-        return self.a_star(self.cell.coordinate, trash_cell)
+        # With hierarchical pathfinding, known trash farther than a cluster is
+        # reached through the abstract graph, the nearest by Chebyshev distance
+        hierarchy = self.model.hierarchy
+        if self.model.search_budget is not None or (hierarchy is not None and distance > hierarchy.cluster_size):
+            path = self.a_star(start, target)
+            if not path:
+                self.trash_known_cells.discard(target)  # It can not be reached from here
+            return path
+        stack = [] # Stack of nodes to explore
+        c_list = {}  # g values
+        visited = set()  # visited nodes
+        fathers = {}
+        goal = None
+
+        heapq.heappush(stack, (self.trash_known_cells.nearest(start)[0], start))
+        c_list[start] = 0
+
+        while len(stack) > 0:
+            _, current = heapq.heappop(stack)
+
+            if current in visited:
+                continue
+            visited.add(current)
+
+            # Stop at the first known trash reached, it is the nearest by path
+            if current in self.trash_known_cells:
+                goal = current
+                break
+
+            valid_neighbors = grid[current].neighborhood.select(
+                lambda cell: not any(isinstance(a, ObstacleAgent) for a in cell.agents)
+            )
+
+            for neighbor_cell in valid_neighbors:
+                neighbor = neighbor_cell.coordinate
+                actual_c = c_list[current] + 1 # Cost between nodes is 1
+
+                if (actual_c < c_list.get(neighbor, float('inf'))):
+                    c_list[neighbor] = actual_c
+                    fathers[neighbor] = current
+                    f_value = actual_c + self.trash_known_cells.nearest(neighbor)[0]
+                    heapq.heappush(stack, (f_value, neighbor))
+
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(len(visited))
+
+        # None of the known trash can be reached from here, forget it
+        if goal is None:
+            self.trash_known_cells.clear()
+            return []
+
+        # Reconstruct path
+        path = []
+        current = goal
+        while current != start:
+            path.append(current)
+            current = fathers[current]
+        path.reverse()
+        return path
     
     def distanceToStation(self, stations=None):
         """Calculate the distance to the nearest station using Chebyshev distance."""
@@ -344,40 +754,227 @@ class Roomba(CellAgent):
 
     def calculateReturnPath(self):
         """Calculate the path back to the station using A* algorithm."""
+        if self.model.reservations is not None:
+            self.calculateCooperativeReturnPath()
+            return
+
         start = self.cell.coordinate
-        available_stations = [
-            coord for coord in self.stationCells
-            if not self.stationOccupied(self.model.grid[coord])
-        ]
-        if not available_stations: 
+        if self.station is None:
+            self.reserveStation()
+
+        if self.station is None:
             self.state = "waiting"
             self.path_back_to_station = []
             return
-        
-        goal = self.distanceToStation(available_stations) #Get nearest available station
 
-        if goal is None:
+        goal = self.station.cell.coordinate #Go to the station where we are queued
+        if self.model.incremental and self.model.grid_map.connected(start, goal):
+            # Keep the search, mapChanged repairs it when cells are blocked or opened
+            self.planner = DStarLite(self.model.grid_map, start, goal)
+            self.planner.computeShortestPath()
+            self.expandedNodes(self.planner.expanded)
+            path = self.planner.path()
+        elif self.model.incremental:
+            self.planner = None  # The station can not be reached, D* Lite would search the whole component
+            path = []
+        else:
+            path = self.a_star(start, goal)
+
+        if path:
+            self.path_back_to_station = path
+        else:
             self.state = "waiting"
             self.path_back_to_station = []
+
+    def releaseAssignment(self):
+        """End the assignment of the coordinator, so the roomba can bid again."""
+        if self.model.coordinator is not None:
+            self.model.coordinator.release(self)
+        else:
+            self.assigned_target = None
+            self.assigned_path = []
+
+    def mapChanged(self, coords):
+        """
+        Repair or drop the planned paths after the model blocked or opened cells.
+
+        The D* Lite planner of an incremental model repairs the return path
+        around the changed cells. Otherwise a return path (or an assigned
+        path) that goes through a blocked cell is dropped, and planned again
+        from scratch when it is needed. Hierarchical paths are always
+        dropped, their unrefined segments may no longer exist, and so are the
+        tree of the budgeted search and the frontier of unvisited cells.
+        Args:
+            coords: Coordinates of the changed cells
+        """
+        grid_map = self.model.grid_map
+        path = self.path_back_to_station
+        self.search = None
+        self.frontier = TrashIndex()
+        self.frontier_version = 0
+        if path and self.planner is not None and self.planner.goal == path[-1]:
+            self.planner.moveTo(self.cell.coordinate)
+            expanded = self.planner.expanded
+            self.planner.updateCells(coords)
+            self.expandedNodes(self.planner.expanded - expanded)
+            self.path_back_to_station = self.planner.path()
+        elif isinstance(path, LazyPath) or any(not grid_map.isFree(*coord) for coord in path):
+            self.path_back_to_station = []
+
+        if any(not grid_map.isFree(*coord) for coord in self.assigned_path):
+            self.assigned_path = []
+
+    def calculateCooperativeReturnPath(self, candidates=3, step_margin=5):
+        """
+        Plan a conflict free path to a charging slot at a station.
+
+        The nearest known stations are tried with cooperative A*, and the one
+        with the earliest arrival is kept. A station is only kept when its
+        moves plus the safety margin fit in the battery (waits do not use
+        battery), and each search stops at the arrival of the best so far.
+        The path and the station slot (arrival until the estimated end of
+        the recharge) are reserved. Without a slot the roomba only gets
+        closer while the battery can still reach the station, otherwise it
+        waits in place and plans again later.
+        """
+        table = self.model.reservations
+        tick = self.model.steps
+        start = self.cell.coordinate
+        table.release(self.unique_id)
+
+        def chebyshev(coord, origin=start):
+            return max(abs(coord[0] - origin[0]), abs(coord[1] - origin[1]))
+
+        def moves(path):
+            return sum(1 for a, b in zip([start] + path, path) if a != b)
+
+        stations = sorted(self.stationCells, key=chebyshev)[:candidates]
+        if not stations:
+            self.path_back_to_station = []
             return
-        
-        path = self.a_star(start, goal)
+
+        best = None
+        approach = None  # Partial path of the search to the nearest station
+        for station in stations:
+            # A slot can only be found for stations inside the window that the battery reaches
+            distance = chebyshev(station)
+            if distance > self.model.horizon or distance + step_margin > self.battery:
+                continue
+            limit = self.model.horizon if best is None else len(best[0]) - 1
+            if distance > limit:
+                continue  # Can not arrive before the best station
+
+            # Estimated ticks to recharge after arriving, 5% per tick
+            hold = math.ceil((100 - self.battery + distance) / 5)
+            path, reached = self.cooperative_a_star(start, station, hold, limit)
+            if station == stations[0]:
+                approach = path
+            if reached and moves(path) + step_margin <= self.battery:
+                best = (path, station, hold)
+
+        if best is None:
+            # No free slot inside the window, get closer and replan later
+            path = []
+            nearest = stations[0]
+            if approach is not None:
+                path = approach
+            elif chebyshev(nearest) + step_margin <= self.battery:
+                # Detours of up to half the window
+                path, _ = self.cooperative_a_star(start, nearest, limit=chebyshev(nearest) + self.model.horizon // 2)
+            if path and moves(path) + chebyshev(nearest, path[-1]) + step_margin > self.battery:
+                path = []  # The battery would not reach the station from there
+            if not path:
+                # Already as close as possible, park for a while
+                path = [start] * max(1, self.model.horizon // 4)
+            table.reservePath(self.unique_id, start, path, tick)
+            self.path_back_to_station = path
+            return
+
+        path, station, hold = best
+        table.reservePath(self.unique_id, start, path, tick)
+        arrival = tick + len(path)
+        table.reserveInterval(station, arrival, arrival + hold, self.unique_id)
 
         if path:
             self.path_back_to_station = path
         else:
-            self.state = "waiting"
+            # Already at the station and the slot is ours
             self.path_back_to_station = []
+            self.state = "recharging"
+
+    def reserveStation(self, step_margin=5):
+        """
+        Enqueue at the known station where the roomba can start recharging first.
+
+        Each station the battery can reach is scored by the latest of the
+        estimated arrival (Chebyshev distance) and the time the station is
+        estimated to be free. If none can be reached, the nearest is used.
+        """
+        now = self.model.steps
+        x, y = self.cell.coordinate
+        best = None
+
+        nearest = self.distanceToStation()
+        for coord in self.stationCells:
+            distance = max(abs(coord[0] - x), abs(coord[1] - y))
+            if coord != nearest and distance + step_margin > self.battery:
+                continue
+            station = self.model.stations[coord]
+            arrival = now + distance
+            start = max(arrival, station.freeAt(now))
+            if best is None or start < best[0]:
+                best = (start, arrival, station)
+
+        if best is not None:
+            _, arrival, station = best
+            station.enqueue(self, arrival)
+            self.station = station
+
+    def leaveStation(self):
+        """Leave the queue of the reserved station."""
+        if self.station is not None:
+            self.station.leave(self)
+            self.station = None
+
+    def sleepUntilCalled(self):
+        """Wait next to the station without being activated until it calls us."""
+        self.state = "waiting"
+        self.path_back_to_station = []
+        self.station.sleep(self)
+
+    def canCharge(self, station_cell):
+        """Whether the roomba can recharge at the station cell now."""
+        if self.model.reservations is not None:
+            return not self.stationOccupied(station_cell)
+        return self.model.stations[station_cell.coordinate].available(self)
+
+    def startCharging(self, station_cell):
+        """Start recharging at the station cell."""
+        self.state = "recharging"
+        self.path_back_to_station = [] #clear path back to station
+
+        if self.model.reservations is None:
+            station = self.model.stations[station_cell.coordinate]
+            if station is not self.station: #Recharge where we are, not where we queued
+                self.leaveStation()
+                self.station = station
+            station.startCharging(self)
 
     def exchangeInfo(self, other_roomba):
         """Exchange visited cells and known stations with another roomba."""
-        for cell in other_roomba.visited_cells:
-            if cell not in self.visited_cells:
-                self.visited_cells.add(cell)
+        if self.model.events is not None:
+            self.model.events.exchange(self, other_roomba, self.model.steps)
+
+        # Only receive the cells the other roomba learned since our last exchange
+        version = self.partner_versions.get(other_roomba.unique_id, 0)
+        self.visited_cells.merge(other_roomba.visited_cells.deltaSince(version))
+        self.partner_versions[other_roomba.unique_id] = other_roomba.visited_cells.version
 
+        known_stations = set(self.stationCells)
         for station_coord in other_roomba.stationCells:
-            if station_coord not in self.stationCells: #Add new station coordinates found by other roomba
-                self.stationCells.append(station_coord) 
+            if station_coord not in known_stations: #Add new station coordinates found by other roomba
+                self.stationCells.append(station_coord)
+                known_stations.add(station_coord)
 
         # Timer to limit how long the roomba keeps the info
         self.hasInfo = True
@@ -401,6 +998,14 @@ class Roomba(CellAgent):
             self.hasBattery = True
             self.state = "idle"  #change state to idle after recharging
 
+            # Free the rest of the charging slot
+            if self.model.reservations is not None:
+                self.model.reservations.release(self.unique_id)
+            else:
+                self.leaveStation()
+        if self.model.changes is not None:
+            self.model.changes.recharge(self)
+
     def step(self):
         """
         Determines the next action based on the current state of the agent.
@@ -448,8 +1053,15 @@ class Roomba(CellAgent):
         if self.state != "recharging" and self.state != "waiting": # Battery does not decrease while recharging or waiting
             self.battery -= 1
             if self.battery <= 0:
+                if self.model.reservations is not None:
+                    self.model.reservations.release(self.unique_id)
+                self.leaveStation()
                 self.remove()  # Remove agent if battery has died
 
+        # Report the battery and state this step ended with
+        if self.model.changes is not None:
+            self.model.changes.status(self)
+
 class TrashAgent(FixedAgent):
     @property
     def with_trash(self):
@@ -471,6 +1083,13 @@ class TrashAgent(FixedAgent):
         super().__init__(model)
         self.cell=cell
         self._with_trash = True
+        self.model.metrics.trash_left += 1
+
+    def remove(self):
+        """Remove the trash from the model, the running metrics and the trash layer."""
+        self.model.metrics.trash_left -= 1
+        self.model.trash[self.cell.coordinate] -= 1
+        super().remove()
 
 class ObstacleAgent(FixedAgent):
     """
@@ -486,23 +1105,89 @@ class ObstacleAgent(FixedAgent):
 class StationAgent(FixedAgent):
     """
     Station agent. Where the Roomba recharges.
+
+    Each station owns a reservation queue sorted by estimated arrival.
+    Roombas that arrive while the station is taken sleep (they are dormant
+    for the scheduler) until the station calls them.
     """
     def __init__(self, model, cell):
         super().__init__(model)
         self.cell=cell
+        self.charging = None  # Roomba recharging now
+        self.called = None  # Roomba woken up to take the station next
+        self.queue = []  # (estimated arrival, unique_id, roomba)
+        self.sleeping = set()
+
     def step(self):
         pass
 
+    def chargeTicks(self, battery):
+        """Ticks needed to recharge from a battery level, 5% per tick."""
+        return max(0, math.ceil((100 - battery) / 5))
+
+    def freeAt(self, now):
+        """Estimated tick at which the station is free for a new roomba."""
+        free = now
+        if self.charging is not None:
+            free += self.chargeTicks(self.charging.battery)
+
+        for arrival, _, roomba in self.queue:
+            # Battery is spent while the roomba travels to the station
+            battery = roomba.battery - max(0, arrival - now)
+            free = max(free, arrival) + self.chargeTicks(battery)
+        return free
+
+    def enqueue(self, roomba, arrival):
+        """Add a roomba to the queue with its estimated arrival."""
+        bisect.insort(self.queue, (arrival, roomba.unique_id, roomba), key=lambda entry: entry[:2])
+
+    def available(self, roomba):
+        """Whether the roomba can start recharging here now."""
+        return self.charging in (None, roomba) and self.called in (None, roomba)
+
+    def sleep(self, roomba):
+        """A queued roomba arrived while the station is taken."""
+        roomba.dormant = True
+        self.sleeping.add(roomba)
+
+    def startCharging(self, roomba):
+        """The roomba takes the station."""
+        self.queue = [entry for entry in self.queue if entry[2] is not roomba]
+        self.sleeping.discard(roomba)
+        self.called = None
+        self.charging = roomba
+
+    def leave(self, roomba):
+        """Remove a roomba from the station (recharged, died or moved elsewhere)."""
+        self.queue = [entry for entry in self.queue if entry[2] is not roomba]
+        self.sleeping.discard(roomba)
+        if self.charging is roomba:
+            self.charging = None
+        if self.called is roomba:
+            self.called = None
+        self.callNext()
+
+    def callNext(self):
+        """Wake up the first sleeping roomba of the queue if the station is free."""
+        if self.charging is not None or self.called is not None:
+            return
+        for _, _, roomba in self.queue:
+            if roomba in self.sleeping:
+                self.sleeping.remove(roomba)
+                roomba.dormant = False
+                self.called = roomba
+                return
+
 class EmptyAgent(FixedAgent):
     @property
     def visited(self):
         """Whether the cell has been visited by a Roomba."""
-        return self._visited
+        return bool(self.model.visited[self.cell.coordinate])
     
     @visited.setter
     def visited(self, value: bool) -> None:
         """Set visited state."""
-        self._visited = value
+        self.model.visited[self.cell.coordinate] = value
 
     def __init__(self, model, cell):
         """Create a new trash object
@@ -513,4 +1198,3 @@ class EmptyAgent(FixedAgent):
         """
         super().__init__(model)
         self.cell=cell
-        self._visited = False
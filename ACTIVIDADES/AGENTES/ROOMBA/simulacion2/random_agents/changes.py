@@ -0,0 +1,102 @@
+from .agent import Roomba
+
+
+class ChangeSet:
+    """
+    What changed in the model between two published ticks.
+
+    Attributes:
+        start: Tick of the previous change set
+        tick: Tick after the changes (more than start + 1 when idle ticks were skipped)
+        moves: (roomba, origin, destination) of every move
+        cleaned: Coordinates where a trash was removed
+        visited: Coordinates visited for the first time by any roomba
+        status: Roomba -> (battery, state) of the roombas where any of them changed
+        recharged: Roombas that finished recharging
+        deaths: Roombas removed after running out of battery
+        passability: Coordinate -> whether it is blocked, of the cells blocked or opened
+    """
+    def __init__(self, start):
+        self.start = start
+        self.tick = start
+        self.moves = []
+        self.cleaned = []
+        self.visited = []
+        self.status = {}
+        self.recharged = []
+        self.deaths = []
+        self.passability = {}
+
+    def __bool__(self):
+        """Whether anything changed."""
+        return bool(self.moves or self.cleaned or self.status or self.recharged or self.deaths or self.passability)
+
+
+class ChangeTracker:
+    """
+    Builds the change set of every tick from hooks in the roombas.
+
+    The roombas report moves, cleaned trash, recharges and deaths as they
+    happen, and their battery and state at the end of their step. The model
+    publishes the change set once per tick to the subscribers, so observers
+    do work proportional to the changes instead of rescanning the world.
+    """
+    def __init__(self, model):
+        """
+        Creates a tracker of the current state of the model.
+        Args:
+            model: Model whose roombas report to the tracker
+        """
+        self.model = model
+        self.subscribers = []
+        self.last_status = {roomba: (roomba.battery, roomba.state) for roomba in model.agents_by_type[Roomba]}
+        self.current = ChangeSet(model.steps)
+
+    def subscribe(self, callback):
+        """Call `callback(change_set)` after every published tick."""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Stop calling a subscriber."""
+        self.subscribers.remove(callback)
+
+    def move(self, roomba, origin, destination):
+        """A roomba moved, called before the visited layer is updated."""
+        self.current.moves.append((roomba, origin, destination))
+        if not self.model.visited[destination]:
+            self.current.visited.append(destination)
+
+    def clean(self, roomba, coordinate):
+        """A roomba removed a trash."""
+        self.current.cleaned.append(coordinate)
+
+    def recharge(self, roomba):
+        """A roomba recharged for one tick."""
+        if roomba.battery >= 100:
+            self.current.recharged.append(roomba)
+
+    def death(self, roomba):
+        """A roomba is removed from the model."""
+        self.current.deaths.append(roomba)
+        self.current.status.pop(roomba, None)
+        self.last_status.pop(roomba, None)
+
+    def passability(self, coords, passable):
+        """The model blocked or opened some cells."""
+        for coord in coords:
+            self.current.passability[coord] = not passable
+
+    def status(self, roomba):
+        """Record the battery and state of a roomba if they changed."""
+        status = (roomba.battery, roomba.state)
+        if roomba.cell is not None and self.last_status.get(roomba) != status:
+            self.last_status[roomba] = status
+            self.current.status[roomba] = status
+
+    def publish(self, tick):
+        """Send the changes up to a tick to the subscribers and start a new change set."""
+        changes = self.current
+        changes.tick = tick
+        self.current = ChangeSet(tick)
+        for callback in self.subscribers:
+            callback(changes)
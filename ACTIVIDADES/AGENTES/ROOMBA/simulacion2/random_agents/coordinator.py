@@ -0,0 +1,180 @@
+from collections import deque
+
+from .agent import Roomba, ObstacleAgent
+from .knowledge import KnowledgeMap
+
+
+class TaskCoordinator:
+    """
+    Centralized allocation of trash and frontier targets across roombas.
+
+    Each replanning round the coordinator gathers the knowledge of the whole
+    fleet (known trash and the frontier of visited cells), computes path
+    costs from every available roomba and assigns targets with a sequential
+    auction: the cheapest (roomba, target) pair wins, and both leave the
+    auction, until no roomba or affordable target is left.
+    """
+    def __init__(self, model, replan_interval=10, step_margin=10):
+        """
+        Creates a new coordinator.
+        Args:
+            model: Model reference for the coordinator
+            replan_interval: Steps between full reassignments of the fleet
+            step_margin: Battery margin kept to return to a station
+        """
+        self.model = model
+        self.replan_interval = replan_interval
+        self.step_margin = step_margin
+        self.assignments = {}  # roomba -> target coordinate
+        self.without_targets = set()  # roombas with nothing to do until next full round
+        self.visited = None  # Cells visited by the fleet alive, see fleetVisited
+        self.versions = {}  # roomba -> version of its visited cells already merged
+
+    def available(self, roomba):
+        """Whether the roomba can take a target (it is not going to charge)."""
+        return roomba.hasBattery and roomba.state in ("idle", "ready", "moving")
+
+    def step(self):
+        """Run a replanning round before the roombas are activated."""
+        roombas = list(self.model.agents_by_type[Roomba])
+
+        # Forget assignments of dead roombas, finished targets or roombas going to charge
+        for roomba in list(self.assignments):
+            if (roomba not in roombas or not self.available(roomba)
+                    or not roomba.assigned_path):
+                self.release(roomba)
+
+        # Full round every replan_interval steps, otherwise only idle roombas
+        if self.model.steps % self.replan_interval == 0:
+            for roomba in list(self.assignments):
+                self.release(roomba)
+            self.without_targets.clear()
+
+        bidders = [
+            roomba for roomba in roombas
+            if self.available(roomba) and roomba not in self.assignments
+            and roomba not in self.without_targets
+        ]
+        if bidders:
+            self.auction(bidders)
+
+    def skipTicks(self, first, last):
+        """Catch up with ticks the model skipped, after first until last."""
+        if last // self.replan_interval > first // self.replan_interval:
+            self.without_targets.clear()
+
+    def release(self, roomba):
+        """Remove the assignment of a roomba."""
+        self.assignments.pop(roomba, None)
+        roomba.assigned_target = None
+        roomba.assigned_path = []
+
+    def fleetVisited(self, roombas):
+        """
+        Cells visited by any of the roombas.
+
+        Only the cells each roomba learned since the previous auction are
+        merged. The map is built again when a roomba died, as its cells are
+        no longer known by the fleet.
+        """
+        alive = set(roombas)
+        if self.visited is None or any(roomba not in alive for roomba in self.versions):
+            self.visited = KnowledgeMap(self.model.width, self.model.height)
+            self.versions = {}
+        for roomba in roombas:
+            self.visited.merge(roomba.visited_cells.deltaSince(self.versions.get(roomba, 0)))
+            self.versions[roomba] = roomba.visited_cells.version
+        return self.visited
+
+    def auction(self, bidders):
+        """Assign targets to the bidders by increasing path cost."""
+        roombas = list(self.model.agents_by_type[Roomba])
+        visited = self.fleetVisited(roombas)
+        known_trash = set()
+        for roomba in roombas:
+            known_trash.update(roomba.trash_known_cells)
+        taken = set(self.assignments.values())
+
+        # Each bidder only needs as many candidates as there are bidders
+        bids = []
+        paths = {}
+        for roomba in bidders:
+            candidates = self.nearestTargets(roomba, visited, known_trash, taken, len(bidders))
+            if not candidates:
+                self.without_targets.add(roomba)
+            for target, path in candidates:
+                cost = len(path)
+                if target in known_trash:
+                    cost -= 0.5  # Trash wins ties against frontier cells
+                bids.append((cost, roomba.unique_id, target))
+                paths[(roomba, target)] = path
+
+        bids.sort(key=lambda bid: (bid[0], bid[1]))
+        by_id = {roomba.unique_id: roomba for roomba in bidders}
+        for _, unique_id, target in bids:
+            roomba = by_id[unique_id]
+            if roomba in self.assignments or target in taken:
+                continue
+            self.assignments[roomba] = target
+            taken.add(target)
+            roomba.assigned_target = target
+            roomba.assigned_path = paths[(roomba, target)]
+
+    def nearestTargets(self, roomba, visited, known_trash, taken, limit):
+        """
+        Find the nearest targets of a roomba that its battery can afford.
+
+        Breadth first search through the cells visited by the fleet. Unvisited
+        cells reached are frontier targets and are not expanded.
+        Returns a list of (target, path) pairs.
+        """
+        grid = self.model.grid
+        start = roomba.cell.coordinate
+        fathers = {start: None}
+        distance = {start: 0}
+        queue = deque([start])
+        targets = []
+
+        while len(queue) > 0 and len(targets) < limit:
+            current = queue.popleft()
+
+            is_target = current != start and (current in known_trash or current not in visited)
+            if is_target and current not in taken and self.affordable(roomba, current, distance[current]):
+                targets.append((current, self.path(fathers, current)))
+
+            # Frontier cells are not expanded
+            if current != start and current not in visited:
+                continue
+
+            valid_neighbors = grid[current].neighborhood.select(
+                lambda cell: not any(isinstance(a, ObstacleAgent) for a in cell.agents)
+            )
+            for neighbor_cell in valid_neighbors:
+                neighbor = neighbor_cell.coordinate
+                if neighbor not in fathers:
+                    fathers[neighbor] = current
+                    distance[neighbor] = distance[current] + 1
+                    queue.append(neighbor)
+
+        if self.model.profiler is not None:
+            self.model.profiler.expanded(len(fathers))
+        return targets
+
+    def affordable(self, roomba, target, distance):
+        """Whether the roomba can reach the target and still return to a station."""
+        tx, ty = target
+        to_station = min(
+            (max(abs(tx - sx), abs(ty - sy)) for sx, sy in roomba.stationCells),
+            default=float('inf')
+        )
+        return distance + to_station + self.step_margin < roomba.battery
+
+    def path(self, fathers, goal):
+        """Reconstruct the path to the goal, without the start cell."""
+        path = []
+        current = goal
+        while fathers[current] is not None:
+            path.append(current)
+            current = fathers[current]
+        path.reverse()
+        return path
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class KnowledgeMap:
+    """
+    Set of grid coordinates stored as a map-sized array of flags.
+
+    Each cell of the grid is one byte, so lookups and adds are O(1), and
+    merging what another roomba knows sets all its new cells with one
+    numpy indexing over the same bytes. Every new coordinate is also
+    written to a journal, and the length of the journal is the version of
+    the map: a partner that already received version v only needs the
+    coordinates learned after it.
+    """
+    def __init__(self, width, height, coords=()):
+        """
+        Creates a new knowledge map.
+        Args:
+            width, height: The size of the grid
+            coords: Initial coordinates
+        """
+        self.width = width
+        self.height = height
+        self.cells = bytearray(width * height)
+        self.flags = np.frombuffer(self.cells, dtype=np.uint8)  # Numpy view of the same bytes
+        self.journal = []  # Cell indexes in the order they were learned
+        for coord in coords:
+            self.add(coord)
+
+    def copy(self):
+        """Independent copy of the map."""
+        other = KnowledgeMap(self.width, self.height)
+        other.cells = bytearray(self.cells)
+        other.flags = np.frombuffer(other.cells, dtype=np.uint8)
+        other.journal = list(self.journal)
+        return other
+
+    @property
+    def version(self):
+        """Number of coordinates learned so far."""
+        return len(self.journal)
+
+    def index(self, coord):
+        """Return the cell index of a coordinate."""
+        return coord[0] * self.height + coord[1]
+
+    def coordinate(self, index):
+        """Return the coordinate of a cell index."""
+        return divmod(index, self.height)
+
+    def add(self, coord):
+        """Add a coordinate to the map."""
+        index = self.index(coord)
+        if not self.cells[index]:
+            self.cells[index] = 1
+            self.journal.append(index)
+
+    def deltaSince(self, version):
+        """Return the cell indexes learned after a version."""
+        return self.journal[version:]
+
+    def merge(self, indexes):
+        """
+        Merge cell indexes received from another map.
+        Args:
+            indexes: Distinct cell indexes, e.g. a delta of another map
+        Returns the number of coordinates that were new for this map.
+        """
+        if not indexes:
+            return 0
+        indexes = np.asarray(indexes, dtype=np.int64)
+        new = indexes[self.flags[indexes] == 0]
+        self.flags[new] = 1
+        self.journal.extend(new.tolist())
+        return len(new)
+
+    def __contains__(self, coord):
+        return self.cells[self.index(coord)] == 1
+
+    def __len__(self):
+        return len(self.journal)
+
+    def __iter__(self):
+        for index in self.journal:
+            yield self.coordinate(index)
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class MapLayers:
+    """
+    Image of the Roomba world as cached layers, without a plotting library.
+
+    The static layer (obstacles and stations) is rasterized once per map.
+    Visited cells and trash are painted over a copy of it once, and after
+    that only the cells in the change sets of the model are repainted.
+    """
+    def __init__(self, model, colors):
+        """
+        Args:
+            model: Model to draw
+            colors: Dictionary with the RGBA of "empty", "visited", "obstacle", "station" and "trash"
+        """
+        self.model = model
+        self.colors = {name: np.asarray(color, dtype=float) for name, color in colors.items()}
+        self.static_layer = None  # RGBA image of the static cells, (height, width, 4)
+        self.static_mask = None  # Cells painted in the static layer
+        self.map_image = None  # Static layer with visited cells and trash, kept up to date
+        model.subscribe(self.applyChanges)
+
+    def staticLayer(self):
+        """Rasterize the obstacles and stations once."""
+        if self.static_layer is None:
+            model = self.model
+            image = np.empty((model.width, model.height, 4))
+            image[:] = self.colors["empty"]
+
+            obstacles = model.grid_map.obstacles()
+            stations = np.zeros((model.width, model.height), dtype=bool)
+            for x, y in model.stations:
+                stations[x, y] = True
+            image[obstacles] = self.colors["obstacle"]
+            image[stations] = self.colors["station"]
+
+            # Images are indexed by row (y) and column (x)
+            self.static_layer = np.ascontiguousarray(image.transpose(1, 0, 2))
+            self.static_mask = np.ascontiguousarray((obstacles | stations).T)
+        return self.static_layer
+
+    def mapImage(self):
+        """Static layer with the visited cells and the trash of this frame."""
+        if self.map_image is None:
+            model = self.model
+            image = self.staticLayer().copy()
+            visited = model.visited.T & ~self.static_mask
+            image[visited] = self.colors["visited"]
+            image[model.trash.T > 0] = self.colors["trash"]
+            self.map_image = image
+        return self.map_image
+
+    def applyChanges(self, changes):
+        """Repaint the cells of a change set."""
+        if self.map_image is None:
+            return  # Painted in full on the first frame
+        if changes.passability:
+            # Cells were blocked or opened, rasterize the static layer again
+            self.static_layer = None
+            self.map_image = None
+            return
+        image = self.map_image
+        for x, y in changes.visited:
+            if not self.static_mask[y, x] and self.model.trash[x, y] == 0:
+                image[y, x] = self.colors["visited"]
+        for x, y in changes.cleaned:
+            if self.model.trash[x, y] > 0:
+                continue  # More trash left in the cell
+            if self.static_mask[y, x]:
+                image[y, x] = self.static_layer[y, x]
+            else:
+                image[y, x] = self.colors["visited" if self.model.visited[x, y] else "empty"]
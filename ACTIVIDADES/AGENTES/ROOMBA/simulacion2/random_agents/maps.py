@@ -0,0 +1,163 @@
+import os
+
+import numpy as np
+
+from .world import World
+
+try:
+    from PIL import Image
+except ImportError:  # Only needed for PNG maps
+    Image = None
+
+# Codes of a cell in the parsed map (and in its binary cache)
+FREE, OBSTACLE, TRASH, STATION, START = range(5)
+
+# Characters of ASCII maps
+ASCII_CODES = {".": FREE, " ": FREE, "#": OBSTACLE, "T": TRASH, "S": STATION, "R": START}
+
+# Gray levels of PNG/PGM maps, the nearest level gives the code of a pixel
+GRAY_LEVELS = {0: OBSTACLE, 64: STATION, 128: START, 192: TRASH, 255: FREE}
+
+CACHE_SUFFIX = ".world.npy"
+
+
+def cellsToLayer(rows):
+    """
+    Convert an array of map rows (first row at the top) to a (width, height)
+    layer indexed by grid coordinate, with y growing upwards.
+    """
+    return np.ascontiguousarray(rows[::-1].T)
+
+
+def parseAscii(path):
+    """
+    Parse an ASCII map, one character per cell and one line per row.
+
+    The file is memory mapped and decoded with a lookup table, so it is
+    never loaded as Python text.
+    Returns the (width, height) array of cell codes.
+    """
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    if data.size == 0:
+        raise ValueError(f"{path} is an empty map")
+
+    # Line ending of the file, "\r\n" or "\n"
+    first = int(np.argmax(data == ord("\n")))
+    ending = np.frombuffer(b"\r\n" if first > 0 and data[first - 1] == ord("\r") else b"\n", dtype=np.uint8)
+    if data[-1] != ord("\n"):
+        data = np.concatenate([data, ending])
+
+    stride = int(np.argmax(data == ord("\n"))) + 1
+    width = stride - ending.size
+    if data.size % stride != 0:
+        raise ValueError(f"all the lines of {path} must have the same length")
+    rows = data.reshape(-1, stride)
+    if (rows[:, width:] != ending).any():
+        raise ValueError(f"all the lines of {path} must have the same length")
+
+    table = np.full(256, 255, dtype=np.uint8)
+    for char, code in ASCII_CODES.items():
+        table[ord(char)] = code
+    codes = table[rows[:, :width]]
+    if (codes == 255).any():
+        row, column = np.argwhere(codes == 255)[0]
+        raise ValueError(f"unknown character {chr(rows[row, column])!r} in {path} at line {row + 1}")
+    return cellsToLayer(codes)
+
+
+def readPgm(path):
+    """
+    Read the gray levels of a PGM image (binary P5 or plain P2).
+
+    The pixels of binary images are memory mapped.
+    Returns a (rows, columns) array scaled to 0-255.
+    """
+    with open(path, "rb") as file:
+        magic = file.read(2)
+        if magic not in (b"P5", b"P2"):
+            raise ValueError(f"{path} is not a PGM image")
+
+        # Header: width, height and maximum value, with optional comments
+        fields = []
+        while len(fields) < 3:
+            line = file.readline()
+            if not line:
+                raise ValueError(f"{path} has an incomplete PGM header")
+            fields += line.split(b"#")[0].split()
+        columns, rows, maxval = (int(field) for field in fields[:3])
+        offset = file.tell()
+
+    if magic == b"P5":
+        dtype = np.uint8 if maxval < 256 else np.dtype(">u2")
+        pixels = np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(rows, columns))
+    else:
+        with open(path, "rb") as file:
+            file.seek(offset)
+            pixels = np.array(file.read().split(), dtype=np.int64).reshape(rows, columns)
+
+    if maxval == 255:
+        return pixels
+    return (pixels.astype(np.int64) * 255 // maxval).astype(np.uint8)
+
+
+def readPng(path):
+    """Read the gray levels of a PNG image (needs Pillow)."""
+    if Image is None:
+        raise ImportError("Pillow is required to load PNG maps: pip install pillow")
+    with Image.open(path) as image:
+        return np.asarray(image.convert("L"))
+
+
+def grayToCodes(pixels):
+    """Map every pixel to the code of its nearest gray level."""
+    levels = sorted(GRAY_LEVELS)
+    bounds = [(low + high) / 2 for low, high in zip(levels, levels[1:])]
+    codes = np.array([GRAY_LEVELS[level] for level in levels], dtype=np.uint8)
+    return cellsToLayer(codes[np.digitize(pixels, bounds)])
+
+
+def parseMap(path):
+    """Parse a map file by its extension, returns the (width, height) array of cell codes."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".pgm":
+        return grayToCodes(readPgm(path))
+    if extension == ".png":
+        return grayToCodes(readPng(path))
+    return parseAscii(path)
+
+
+def worldFromCodes(codes):
+    """Build a World from an array of cell codes."""
+    return World(
+        (codes == OBSTACLE).astype(np.uint8),
+        (codes == TRASH).astype(np.uint8),
+        stations=(codes == STATION).astype(np.uint8),
+        starts=(codes == START).astype(np.uint8),
+    )
+
+
+def loadWorld(path, cache=True):
+    """
+    Load a World from an ASCII, PGM or PNG map.
+
+    The parsed codes are cached next to the map as a .npy file of one byte
+    per cell, which later loads memory map instead of parsing again. The
+    cache is rebuilt when the map is newer.
+    Args:
+        path: Map file
+        cache: Whether to read and write the binary cache
+    """
+    cache_path = path + CACHE_SUFFIX
+    if cache and os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return worldFromCodes(np.load(cache_path, mmap_mode="r"))
+
+    codes = parseMap(path)
+    if cache:
+        try:
+            temporary = cache_path + ".tmp"
+            with open(temporary, "wb") as file:
+                np.save(file, codes)
+            os.replace(temporary, cache_path)
+        except OSError:
+            pass  # Read-only location, the map is parsed on every load
+    return worldFromCodes(codes)
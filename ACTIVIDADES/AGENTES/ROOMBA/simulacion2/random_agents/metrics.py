@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+
+
+class RunningMetrics:
+    """
+    Running aggregates of the simulation.
+
+    The roombas and the trash update these counters when something happens
+    (move, clean, battery change, death), so the reported metrics are O(1)
+    to read instead of a sum over every roomba on every tick.
+    """
+    def __init__(self, num_trash):
+        """
+        Creates empty counters.
+        Args:
+            num_trash: Number of trash objects placed at the start
+        """
+        self.num_trash = num_trash
+        self.trash_left = 0
+        self.roombas_alive = 0
+        self.battery_total = 0
+        self.steps_total = 0
+
+    def batteryPercent(self):
+        """Average battery of the roombas alive."""
+        return self.battery_total / self.roombas_alive if self.roombas_alive > 0 else 0
+
+    def trashPercent(self):
+        """Percentage of the trash that has been collected."""
+        return (self.num_trash - self.trash_left) / self.num_trash * 100 if self.num_trash > 0 else 100
+
+    def stepsAverage(self):
+        """Average steps moved by the roombas alive."""
+        return self.steps_total / self.roombas_alive if self.roombas_alive > 0 else 0
+
+
+class ArrayCollector:
+    """
+    Collects model metrics into preallocated NumPy columns.
+
+    Each reporter is an O(1) function of the model. A row is written every
+    `interval` ticks, and the columns grow by doubling when full, so the
+    cost of collecting does not depend on the size of the fleet.
+
+    With a sink, full columns are streamed to it instead of growing, and
+    only the rows not written yet are kept in memory. The DataFrame still
+    has every row, the streamed ones are read back from the sink.
+    """
+    def __init__(self, model_reporters, interval=1, capacity=1024, sink=None):
+        """
+        Creates a new collector.
+        Args:
+            model_reporters: Dictionary name -> (function of the model, dtype)
+            interval: Ticks between collected rows
+            capacity: Rows preallocated for each column
+            sink: Optional ColumnarWriter that receives the rows
+        """
+        self.model_reporters = model_reporters
+        self.interval = interval
+        self.sink = sink
+        self.rows = 0
+        self.last_tick = None
+        self.streamed = 0  # Rows already written to the sink
+        self.last_streamed = None  # Last row written to the sink, for lastRow
+        self.columns = {
+            name: np.empty(capacity, dtype=dtype)
+            for name, (_, dtype) in model_reporters.items()
+        }
+
+    def collect(self, model, force=False):
+        """Write a row with the current metrics if this tick is sampled (or forced)."""
+        if model.steps == self.last_tick:
+            return
+        if not force and model.steps % self.interval != 0:
+            return
+        self.reserve(1)
+        for name, (reporter, _) in self.model_reporters.items():
+            self.columns[name][self.rows] = reporter(model)
+        self.rows += 1
+        self.last_tick = model.steps
+
+    def collectMany(self, model, ticks, values):
+        """
+        Write the rows of several ticks at once.
+        Args:
+            model: Model whose current metrics fill the columns not in values
+            ticks: Array with the ticks of the rows
+            values: Dictionary name -> array with the value of each tick
+        """
+        sampled = ticks % self.interval == 0
+        count = int(sampled.sum())
+        if count == 0:
+            return
+        self.reserve(count)
+
+        end = self.rows + count
+        for name, (reporter, _) in self.model_reporters.items():
+            if name in values:
+                self.columns[name][self.rows:end] = values[name][sampled]
+            else:
+                self.columns[name][self.rows:end] = reporter(model)
+        self.rows = end
+        self.last_tick = int(ticks[sampled][-1])
+
+    def reserve(self, count):
+        """Make room for count more rows."""
+        capacity = len(next(iter(self.columns.values())))
+        if self.rows + count <= capacity:
+            return
+        if self.sink is not None:
+            self.flush()
+            if count <= capacity:
+                return
+        while self.rows + count > capacity:
+            capacity *= 2
+        for name, column in self.columns.items():
+            grown = np.empty(capacity, dtype=column.dtype)
+            grown[:self.rows] = column[:self.rows]
+            self.columns[name] = grown
+
+    def clear(self):
+        """Forget the rows in memory."""
+        self.rows = 0
+        self.last_tick = None
+
+    def flush(self):
+        """Stream the rows in memory to the sink."""
+        if self.sink is None or self.rows == 0:
+            return
+        self.sink.appendMany({name: column[:self.rows] for name, column in self.columns.items()})
+        self.last_streamed = {name: column[self.rows - 1] for name, column in self.columns.items()}
+        self.streamed += self.rows
+        self.rows = 0
+
+    def lastRow(self):
+        """
+        Return the last collected row as a one-row DataFrame.
+
+        Unlike get_model_vars_dataframe, it never reads the sink back, so
+        it can be called at the end of a long streamed run.
+        """
+        if self.rows > 0:
+            row = {name: column[self.rows - 1:self.rows] for name, column in self.columns.items()}
+        elif self.last_streamed is not None:
+            row = {name: [value] for name, value in self.last_streamed.items()}
+        else:
+            return pd.DataFrame({name: column[:0] for name, column in self.columns.items()})
+        return pd.DataFrame(row, index=[self.streamed + self.rows - 1])
+
+    def get_model_vars_dataframe(self):
+        """Return the collected rows as a DataFrame, like mesa's DataCollector."""
+        columns = {name: column[:self.rows] for name, column in self.columns.items()}
+        if self.sink is not None:
+            written = self.sink.written()
+            columns = {name: np.concatenate([written[name], column]) for name, column in columns.items()}
+        return pd.DataFrame(columns)
@@ -1,8 +1,22 @@
+import math
+import random
+
+import numpy as np
 from mesa import Model
 from mesa.discrete_space import OrthogonalMooreGrid
-from mesa.datacollection import DataCollector
 
 from .agent import Roomba, ObstacleAgent, TrashAgent, StationAgent, EmptyAgent
+from .changes import ChangeTracker
+from .coordinator import TaskCoordinator
+from .metrics import ArrayCollector, RunningMetrics
+from .sink import MetricsSink
+from .replay import EventLog
+from .snapshot import ModelSnapshot
+from .profiling import PhaseProfiler
+from .reservation import ReservationTable
+from .maps import loadWorld
+from .pathfinding import CLUSTER_SIZE, GridMap, HierarchicalMap, heuristicFunction
+from .world import World
 
 class RandomModel(Model):
     """
@@ -10,11 +24,44 @@ class RandomModel(Model):
     Args:
         num_agents: Number of agents in the simulation
         height, width: The size of the grid to model
+        coordinated: Whether a central coordinator assigns targets to the roombas
+        cooperative: Whether the roombas plan conflict free paths with a shared reservation table
+        horizon: Number of ticks planned ahead in cooperative mode
+        skip_idle: Whether to jump over ticks where every roomba is recharging or sleeping
+        collect_interval: Ticks between rows of collected metrics
+        sink: Optional directory where the model and per-roomba series are streamed
+        event_log: Optional file where the events of the run are recorded for replay
+        verbose: Whether to print the final stats when the run finishes
+        world: Prebuilt World with the obstacles and trash (rates are then ignored)
+        map_file: ASCII, PGM or PNG map to load the world from, its size replaces
+            width and height and its roomba starts (if any) replace num_agents
+        world_seed: Seed of the obstacles and trash layout, independent of the
+            roombas (default: the layout comes from the model seed)
+        empty_agents: Whether to create an EmptyAgent per cell (only needed to draw visited cells)
+        profile: Whether to time the phases of the roombas and the model, see PhaseProfiler
+        pathfinding: Search used by a_star, "a_star", "jps" (Jump Point Search) or "hpa"
+            (hierarchical, for large maps)
+        heuristic: Heuristic of a_star, "chebyshev" (exact on the Moore grid) or "manhattan"
+            (the original one, it overestimates diagonal moves)
+        cluster_size: Side of the clusters of the hierarchical pathfinding
+        incremental: Whether each roomba keeps a D* Lite planner of its return path, repaired
+            when setPassable changes cells instead of planned again (not used when cooperative)
+        search_budget: Nodes expanded at most by each a_star search ("a_star" pathfinding), a search
+            cut by it returns a partial path and goes on in the next tick (default: no limit)
+        search_weight: Weight of the heuristic of the budgeted searches, > 1 finds paths sooner
+            that are at most this many times longer than the shortest one
+        maps: (GridMap, HierarchicalMap or None) of the world to share instead of building
+            them, copied on the first setPassable (see fromSnapshot)
     """
-    def __init__(self, num_agents=1, rate_obstacles=0.1, rate_trash=0.2, max_steps=3000, width=8, height=8, seed=42):
+    def __init__(self, num_agents=1, rate_obstacles=0.1, rate_trash=0.2, max_steps=3000, width=8, height=8, seed=42, coordinated=False, cooperative=False, horizon=16, skip_idle=True, collect_interval=1, sink=None, event_log=None, verbose=True, world=None, world_seed=None, map_file=None, empty_agents=True, profile=False, pathfinding="a_star", heuristic="chebyshev", cluster_size=CLUSTER_SIZE, incremental=False, search_budget=None, search_weight=1.0, maps=None):
 
         super().__init__(seed=seed)
 
+        # A map file fixes the world and the size of the grid
+        if map_file is not None:
+            world = loadWorld(map_file)
+            width, height = world.shape
+
         # Initialize model parameters
         self.num_agents = num_agents
         self.num_obstacles = int(rate_obstacles * (width - 2) * (height - 2))
@@ -23,57 +70,133 @@ class RandomModel(Model):
         self.seed = seed
         self.width = width
         self.height = height
+        self.horizon = horizon
+        self.skip_idle = skip_idle
+        self.verbose = verbose
+        self.empty_agents = empty_agents
+        if pathfinding not in ("a_star", "jps", "hpa"):
+            raise ValueError(f"unknown pathfinding {pathfinding!r}, expected 'a_star', 'jps' or 'hpa'")
+        heuristicFunction(heuristic)  # Fail early on unknown names
+        if search_budget is not None and search_budget < 1:
+            raise ValueError(f"search_budget must be at least 1, got {search_budget}")
+        if search_weight < 1:
+            raise ValueError(f"search_weight must be at least 1, got {search_weight}")
+        self.pathfinding = pathfinding
+        self.heuristic = heuristic
+        self.cluster_size = cluster_size
+        self.incremental = incremental
+        self.search_budget = search_budget
+        self.search_weight = search_weight
+
+        # Static world (obstacles and trash), generated unless it is given
+        if world is None:
+            world_random = self.random if world_seed is None else random.Random(world_seed)
+            world = World.generate(width, height, self.num_obstacles, self.num_trash, world_random)
+        elif world.shape != (width, height):
+            raise ValueError(f"world of size {world.shape} does not match the grid {(width, height)}")
+        self.world = world
+        self.num_trash = world.num_trash
+
+        # Passability of the cells for the searches that do not read the agents
+        hierarchy = None
+        if maps is None:
+            self.grid_map = GridMap(width, height, world.obstacles)
+        else:
+            self.grid_map, hierarchy = maps
+
+        # Clusters, entrances and their distances, built once for the hierarchical searches
+        if pathfinding != "hpa":
+            hierarchy = None
+        elif hierarchy is None or hierarchy.cluster_size != cluster_size:
+            hierarchy = HierarchicalMap(self.grid_map, cluster_size)
+        self.hierarchy = hierarchy
+
+        # Whether the maps are shared with a snapshot or a fork, they are copied before a change
+        self.shared_maps = maps is not None
+
+        # Roombas by coordinate, used to find communication partners
+        self.roomba_positions = {}
+
+        # Shared space-time reservations for cooperative pathfinding
+        self.reservations = ReservationTable() if cooperative else None
+
+        # Only these agent types have behavior in step, the rest are static
+        self.active_types = [Roomba]
 
         # Initialize grid
-        self.grid = OrthogonalMooreGrid([width, height], torus=False)
+        self.grid = OrthogonalMooreGrid([width, height], torus=False, random=self.random)
+
+        # Running aggregates, updated by the agents when something happens
+        self.metrics = RunningMetrics(self.num_trash)
 
         # Setup data collection
         model_reporters = {
-            "Battery %": lambda m: sum(agent.battery for agent in m.agents_by_type[Roomba]) / len(m.agents_by_type[Roomba]) if len(m.agents_by_type[Roomba]) > 0 else 0,
-            "Trash Collected %": lambda m: (m.num_trash - len(m.agents_by_type[TrashAgent])) / m.num_trash * 100 if m.num_trash > 0 else 100,
-            "Roombas Alive": lambda m: len(m.agents_by_type[Roomba]),
-            "Roomba Steps": lambda m: sum(agent.steps for agent in m.agents_by_type[Roomba]) / len(m.agents_by_type[Roomba]) if len(m.agents_by_type[Roomba]) > 0 else 0,
-            "Time (Steps)": lambda m: m.steps
+            "Battery %": (lambda m: m.metrics.batteryPercent(), float),
+            "Trash Collected %": (lambda m: m.metrics.trashPercent(), float),
+            "Roombas Alive": (lambda m: m.metrics.roombas_alive, int),
+            "Roomba Steps": (lambda m: m.metrics.stepsAverage(), float),
+            "Time (Steps)": (lambda m: m.steps, int)
         }
-        self.datacollector = DataCollector(model_reporters)
-
-        # Identify the coordinates of the border of the grid
-        border = [(x,y)
-                  for y in range(height)
-                  for x in range(width)
-                  if y in [0, height-1] or x in [0, width - 1]]
-
-        # Create the border cells
-        for _, cell in enumerate(self.grid):
-            if cell.coordinate in border:
-                ObstacleAgent(self, cell = cell)
-
-        # Create the roombas and stations randomly
-        roomba_cells = self.random.choices(self.grid.empties.cells, k=self.num_agents)
-        for cell in roomba_cells:
-            Roomba(self, cell=cell)
-            StationAgent(self, cell=cell)
-
-        # Create the obstacles randomly
-        ObstacleAgent.create_agents(
-            self,
-            self.num_obstacles,
-            cell=self.random.choices(self.grid.empties.cells, k=self.num_obstacles)
+
+        # Optional streaming of the series to disk, with bounded memory
+        self.sink = None
+        if sink is not None:
+            self.sink = MetricsSink(sink, {name: dtype for name, (_, dtype) in model_reporters.items()})
+        self.datacollector = ArrayCollector(
+            model_reporters, interval=collect_interval,
+            sink=self.sink.model if self.sink is not None else None
         )
 
+        # Cells in flat index order (x * height + y), the order of the world layers
+        cells = self.grid.all_cells.cells
 
-        TrashAgent.create_agents(
-            self,
-            self.num_trash,
-            cell=self.random.choices(self.grid.empties.cells, k=self.num_trash)
-        )
+        # Place the obstacles (border included) and the trash of the world
+        obstacle_cells = [cells[index] for index in np.flatnonzero(world.obstacles)]
+        ObstacleAgent.create_agents(self, len(obstacle_cells), cell=obstacle_cells)
+        trash_cells = [cells[index] for index in np.repeat(np.arange(len(cells)), world.trash.ravel())]
+        TrashAgent.create_agents(self, len(trash_cells), cell=trash_cells)
+
+        # Create the roombas and stations at the starts of the world, or in distinct free cells
+        starts = np.flatnonzero(world.starts)
+        if starts.size == 0:
+            starts = world.sampleFree(self.num_agents, self.random)
+        self.num_agents = len(starts)
+        roomba_cells = [cells[index] for index in starts]
+        roombas = Roomba.create_agents(self, len(roomba_cells), cell=roomba_cells)
+        stations = StationAgent.create_agents(self, len(roomba_cells), cell=roomba_cells)
+        self.stations = {station.cell.coordinate: station for station in stations}
 
-        for _, cell in enumerate(self.grid):
-            EmptyAgent(self, cell=cell)
+        # Stations of the map without a roomba, known by every roomba from the start
+        station_cells = [cells[index] for index in np.flatnonzero(world.stations)]
+        for station in StationAgent.create_agents(self, len(station_cells), cell=station_cells):
+            self.stations[station.cell.coordinate] = station
+        for roomba in roombas:
+            roomba.stationCells.extend(cell.coordinate for cell in station_cells)
 
+        # Cells visited by any roomba, EmptyAgents only show this layer
+        self.visited = np.zeros((width, height), dtype=bool)
+
+        # Trash left in each cell, kept updated by the trash agents
+        self.trash = np.array(world.trash, dtype=np.uint8)
+        if empty_agents:
+            EmptyAgent.create_agents(self, len(cells), cell=cells)
+
+        # Optional central allocation of trash and frontier targets
+        self.coordinator = TaskCoordinator(self) if coordinated else None
+
+        # Optional event log, records the initial state
+        self.events = EventLog(event_log, self) if event_log is not None else None
+
+        # Change sets of every tick, only tracked once someone subscribes
+        self.changes = None
 
         self.running = True
-        self.datacollector.collect(self)
+        self.collect()
+
+        # Optional timing of the phases, the searches report their expansions to it
+        self.profiler = None
+        if profile:
+            PhaseProfiler(self).attach()
 
 
     def step(self):
@@ -83,19 +206,221 @@ class RandomModel(Model):
         if not self.running:
             return
 
-        self.agents.shuffle_do("step")
+        # Forget reservations of past ticks
+        if self.reservations is not None:
+            self.reservations.prune(self.steps)
+
+        # Assign targets before the roombas decide their moves
+        if self.coordinator is not None:
+            self.coordinator.step()
+
+        # Activate only the agent types with behavior, skipping dormant agents
+        for agent_type in self.active_types:
+            self.agents_by_type[agent_type].select(
+                lambda agent: not agent.dormant
+            ).shuffle_do("step")
         
         # Collect data
-        self.datacollector.collect(self)
+        self.collect()
+        if self.events is not None:
+            self.events.endTick(self.steps)
+        if self.changes is not None:
+            self.changes.publish(self.steps)
 
         # Stop the model if all trash is collected
-        if len(self.agents_by_type[TrashAgent]) == 0 or self.steps >= int(self.max_steps):
+        if self.metrics.trash_left == 0 or self.steps >= int(self.max_steps):
             self.running = False
 
+            # The last tick is always collected
+            self.collect(force=True)
+
             # Only print the last step
-            df = self.datacollector.get_model_vars_dataframe()
-            print(df.tail(1))
+            if self.verbose:
+                print(self.datacollector.lastRow())
+
+                # Add steps by each roomba to the output
+                for agent in self.agents_by_type[Roomba]:
+                    print(f"Roomba {agent.unique_id}: Battery {agent.battery}%, Steps {agent.steps}")
+
+            # Finish the files of the sink and the event log
+            if self.sink is not None:
+                self.datacollector.flush()
+                self.sink.close()
+            if self.events is not None:
+                self.events.close()
+            return
+
+        # Jump to the next event if no roomba can make a decision
+        if self.skip_idle:
+            self.skipIdleTicks()
+
+    def setPassable(self, coords, passable):
+        """
+        Block or open cells during the run, e.g. a door or furniture that was moved.
+
+        The obstacle agents, the searches, the hierarchical graph and the
+        change set see the new cells at once. Each roomba repairs its return
+        path (incremental) or drops the paths that go through a blocked cell.
+        Trash under a blocked cell stays there until the cell is opened.
+        Args:
+            coords: Coordinates of the cells
+            passable: Whether the roombas can go through them
+        """
+        changed = []
+        for coord in dict.fromkeys(map(tuple, coords)):
+            if not (0 <= coord[0] < self.width and 0 <= coord[1] < self.height):
+                raise ValueError(f"cell {coord} is outside the grid")
+            if not passable and (coord in self.stations or self.roomba_positions.get(coord)):
+                raise ValueError(f"cell {coord} has a station or a roomba, it can not be blocked")
+            if self.grid_map.isFree(*coord) != passable:
+                changed.append(coord)
+        if not changed:
+            return
+
+        cells = [self.grid[coord] for coord in changed]
+        if passable:
+            for cell in cells:
+                for agent in [agent for agent in cell.agents if isinstance(agent, ObstacleAgent)]:
+                    agent.remove()
+        else:
+            ObstacleAgent.create_agents(self, len(cells), cell=cells)
+        if self.shared_maps:
+            self.copyMaps()
+        for coord in changed:
+            self.grid_map.setBlocked(*coord, not passable)
+
+        if self.hierarchy is not None:
+            self.hierarchy.update(changed)
+        if self.changes is not None:
+            self.changes.passability(changed, passable)
+        for roomba in self.agents_by_type[Roomba]:
+            roomba.mapChanged(changed)
+
+    def copyMaps(self):
+        """Stop sharing the maps, the searches kept by the roombas read the copies."""
+        self.grid_map = self.grid_map.copy()
+        if self.hierarchy is not None:
+            self.hierarchy = self.hierarchy.copy(self.grid_map)
+        for roomba in self.agents_by_type[Roomba]:
+            if roomba.planner is not None:
+                roomba.planner.grid_map = self.grid_map
+            if roomba.search is not None:
+                roomba.search.grid_map = self.grid_map
+        self.shared_maps = False
+
+    def snapshot(self):
+        """Capture the current state of the run, see ModelSnapshot."""
+        return ModelSnapshot(self)
+
+    def fork(self, **params):
+        """
+        New model that continues this run from the current tick.
+
+        The fork does not change this model, and both continue the same way
+        unless something is changed in one of them (e.g. adding a roomba).
+        Args:
+            params: Constructor parameters to change in the fork (e.g. max_steps, cooperative)
+        """
+        return RandomModel.fromSnapshot(self.snapshot(), **params)
+
+    @classmethod
+    def fromSnapshot(cls, snapshot, **params):
+        """
+        Build a model that continues a run from a snapshot.
+
+        Only the world of the snapshot is placed by the constructor, the
+        roombas and stations are restored afterwards. The passability map
+        and the hierarchical graph are shared with the snapshot until the
+        first setPassable of the model. The collected metrics start at the
+        tick of the snapshot.
+        Args:
+            snapshot: ModelSnapshot to start from
+            params: Constructor parameters that replace the ones of the snapshot
+        """
+        if params.get("event_log") is not None:
+            raise ValueError("an event log must start at tick 0, forks cannot record one")
+        profile = params.pop("profile", False)
+        world = snapshot.forkWorld()
+        width, height = world.shape
+        model = cls(
+            **{**snapshot.params, **params}, num_agents=0, width=width, height=height, world=world,
+            maps=(snapshot.grid_map, snapshot.hierarchy),
+        )
+        snapshot.restore(model)
+        if profile:
+            PhaseProfiler(model).attach()
+        return model
+
+    def subscribe(self, callback):
+        """
+        Call `callback(change_set)` with the ChangeSet of every tick.
+
+        Subscribe after the model is built, the first change set has the
+        changes after the current tick.
+        """
+        if self.changes is None:
+            self.changes = ChangeTracker(self)
+        self.changes.subscribe(callback)
+
+    def collect(self, force=False):
+        """Collect the model metrics, and the per-roomba rows if there is a sink."""
+        if self.datacollector.last_tick == self.steps:
+            return
+        if not force and self.steps % self.datacollector.interval != 0:
+            return
+        self.datacollector.collect(self, force=True)
+        if self.sink is not None:
+            self.sink.collectAgents(self.steps, self.agents_by_type[Roomba])
+
+    def skipIdleTicks(self):
+        """
+        Jump over the ticks where no roomba can make a decision.
+
+        When every roomba is recharging, or sleeping in a station queue, the
+        only thing that changes is the battery of the recharging ones. The
+        clock jumps to the tick before the next event (a recharge finishing,
+        which also frees a station, or max_steps), and the skipped rows are
+        collected in bulk with the values a normal step would report.
+        """
+        roombas = list(self.agents_by_type[Roomba])
+        charging = [roomba for roomba in roombas if not roomba.dormant]
+        if not roombas or any(roomba.state != "recharging" for roomba in charging):
+            return
+
+        # The tick where the first recharge finishes is stepped normally
+        skip = int(self.max_steps) - self.steps - 1
+        for roomba in charging:
+            skip = min(skip, math.ceil((100 - roomba.battery) / 5) - 1)
+        if skip <= 0:
+            return
+
+        # Collect the skipped rows in bulk, only battery and time change
+        first = self.steps
+        ticks = np.arange(first + 1, first + skip + 1)
+        battery = (self.metrics.battery_total + 5 * len(charging) * (ticks - first)) / len(roombas)
+        self.datacollector.collectMany(self, ticks, {"Battery %": battery, "Time (Steps)": ticks})
+        if self.sink is not None:
+            for tick in ticks[ticks % self.datacollector.interval == 0]:
+                self.sink.collectAgents(int(tick), roombas, charging, 5 * (int(tick) - first))
+
+        if self.events is not None:
+            self.events.chargeSpan(charging, first, skip)
+
+        for roomba in charging:
+            roomba.battery += 5 * skip
+            if roomba.info_timer > 0:
+                roomba.info_timer = max(0, roomba.info_timer - skip)
+                if roomba.info_timer == 0:
+                    roomba.hasInfo = False
+
+        # Consume the random numbers the scheduler would have used to shuffle
+        for _ in range(skip):
+            self.random.shuffle([None] * len(charging))
 
-            # Add steps by each roomba to the output
-            for agent in self.agents_by_type[Roomba]:
-                print(f"Roomba {agent.unique_id}: Battery {agent.battery}%, Steps {agent.steps}")
+        self.steps += skip
+        if self.coordinator is not None:
+            self.coordinator.skipTicks(first, self.steps)
+        if self.changes is not None:
+            for roomba in charging:
+                self.changes.status(roomba)
+            self.changes.publish(self.steps)
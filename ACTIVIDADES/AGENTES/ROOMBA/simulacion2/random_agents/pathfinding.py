@@ -0,0 +1,1012 @@
+import heapq
+from collections import deque
+
+import numpy as np
+
+# The 8 moves of the Moore grid, every move costs 1
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+
+# Hierarchical pathfinding: side of the clusters, runs of border cells this
+# long get an entrance at each end instead of one in the middle, and entrances
+# searched at once when computing the intra-cluster distances
+CLUSTER_SIZE = 16
+ENTRANCE_SPLIT = 6
+DISTANCE_BATCH = 4096
+
+
+def manhattan(a, b):
+    """
+    Manhattan distance, the original heuristic of a_star.
+
+    It overestimates when diagonal moves are allowed, so paths found with
+    it on the Moore grid can be longer than the shortest one.
+    """
+    return abs(a[0] - b[0]) + abs(a[1] - b[1])
+
+
+def chebyshev(a, b):
+    """Chebyshev distance, exact on an empty 8-connected grid where every move costs 1."""
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+
+HEURISTICS = {"manhattan": manhattan, "chebyshev": chebyshev}
+
+
+def heuristicFunction(heuristic):
+    """Return the heuristic function of a name in HEURISTICS, or the function itself."""
+    if callable(heuristic):
+        return heuristic
+    if heuristic not in HEURISTICS:
+        raise ValueError(f"unknown heuristic {heuristic!r}, expected one of {list(HEURISTICS)}")
+    return HEURISTICS[heuristic]
+
+
+class GridMap:
+    """
+    Passability of the cells of a grid, one byte per cell.
+
+    The cells are stored x-major with a blocked border of one cell around
+    the grid, so a search can step through flat indexes (stride for x, 1
+    for y) without checking the bounds. Searches read this instead of the
+    agents of the Mesa cells.
+    """
+    def __init__(self, width, height, obstacles):
+        """
+        Args:
+            width, height: The size of the grid
+            obstacles: (width, height) array, nonzero where the cell is blocked
+        """
+        self.width = width
+        self.height = height
+        self.stride = height + 2
+        padded = np.ones((width + 2, height + 2), dtype=bool)
+        padded[1:-1, 1:-1] = np.asarray(obstacles, dtype=bool)
+        self.blocked = bytearray(padded.tobytes())
+        self.labels = None  # Connected components, labeled again after a change when they are needed
+
+    def copy(self):
+        """Independent copy of the map, the labels are only replaced so they are shared."""
+        other = GridMap.__new__(GridMap)
+        other.__dict__.update(self.__dict__)
+        other.blocked = bytearray(self.blocked)
+        return other
+
+    def index(self, x, y):
+        """Flat index of a cell."""
+        return (x + 1) * self.stride + y + 1
+
+    def coordinate(self, index):
+        """Cell of a flat index."""
+        x, y = divmod(index, self.stride)
+        return x - 1, y - 1
+
+    def isFree(self, x, y):
+        """Whether a cell is inside the grid and not blocked."""
+        return 0 <= x < self.width and 0 <= y < self.height and not self.blocked[self.index(x, y)]
+
+    def setBlocked(self, x, y, blocked):
+        """Block or open a cell inside the grid."""
+        self.blocked[self.index(x, y)] = blocked
+        self.labels = None
+
+    def padded(self):
+        """(width + 2, height + 2) boolean view of the blocked cells, border included."""
+        return np.frombuffer(self.blocked, dtype=bool).reshape(self.width + 2, self.stride)
+
+    def obstacles(self):
+        """(width, height) boolean array of the blocked cells."""
+        return self.padded()[1:-1, 1:-1].copy()
+
+    def components(self):
+        """
+        Connected component of every cell, by flat index, 0 for blocked cells.
+
+        The runs of free cells along y are labeled first, and each run is
+        joined with the runs of the next column that it touches (diagonals
+        included). The joins are done by hooking every root to the smallest
+        root it touches and jumping pointers until nothing changes, with
+        numpy, so a 1000x1000 map is labeled in a fraction of a second.
+        """
+        if self.labels is not None:
+            return self.labels
+        free = ~self.padded().ravel()
+        starts = free & ~np.concatenate(([False], free[:-1]))
+        runs = np.cumsum(starts)  # The border is blocked, so no run goes on into the next column
+        runs[~free] = 0
+
+        # Pairs of runs that touch in columns x and x + 1
+        firsts, seconds = [], []
+        for dy in (-1, 0, 1):
+            offset = self.stride + dy
+            cells = np.flatnonzero(free[:-offset] & free[offset:])
+            firsts.append(runs[cells])
+            seconds.append(runs[cells + offset])
+        firsts = np.concatenate(firsts)
+        seconds = np.concatenate(seconds)
+
+        parent = np.arange(np.count_nonzero(starts) + 1)
+        while True:
+            a, b = parent[firsts], parent[seconds]
+            apart = a != b
+            if not apart.any():
+                break
+            a, b = a[apart], b[apart]
+            np.minimum.at(parent, np.maximum(a, b), np.minimum(a, b))
+            while True:
+                jumped = parent[parent]
+                if np.array_equal(jumped, parent):
+                    break
+                parent = jumped
+
+        self.labels = parent[runs]
+        return self.labels
+
+    def connected(self, a, b):
+        """Whether a path joins two cells, in O(1) once the components are labeled."""
+        labels = self.components()
+        label = labels[self.index(*a)]
+        return label != 0 and label == labels[self.index(*b)]
+
+
+def jumpPointSearch(grid_map, start, goal, heuristic=chebyshev):
+    """
+    Jump Point Search on an 8-connected grid where every move costs 1.
+
+    Instead of pushing every neighbor, straight and diagonal runs are
+    followed until a cell with a forced neighbor (or the goal), and only
+    those jump points enter the open list. Pruning only drops neighbors
+    that can be reached from the parent at no extra cost, so the paths
+    have the same length as the ones of A* with an admissible heuristic.
+    Args:
+        grid_map: GridMap of the grid
+        start, goal: Coordinates
+        heuristic: Admissible heuristic of two coordinates
+    Returns the path (without start, with goal, empty if there is none) and
+    the number of jump points expanded.
+    """
+    blocked = grid_map.blocked
+    stride = grid_map.stride
+    target = grid_map.index(*goal)
+    if not grid_map.isFree(*goal):
+        return [], 0
+
+    def straight(index, step, side):
+        """Follow a straight run, side is the offset of the cells beside it."""
+        while True:
+            index += step
+            if blocked[index]:
+                return None
+            if index == target:
+                return index
+            if (blocked[index + side] and not blocked[index + side + step]) or \
+                    (blocked[index - side] and not blocked[index - side + step]):
+                return index
+
+    def jump(node, dx, dy):
+        """Follow a direction from a node until a jump point, returns it or None."""
+        index = grid_map.index(*node)
+        if not dx:
+            index = straight(index, dy, stride)
+        elif not dy:
+            index = straight(index, dx * stride, 1)
+        else:
+            side_x = dx * stride
+            while True:
+                index += side_x + dy
+                if blocked[index]:
+                    return None
+                if index == target:
+                    break
+                if (blocked[index - side_x] and not blocked[index - side_x + dy]) or \
+                        (blocked[index - dy] and not blocked[index + side_x - dy]):
+                    break
+                # A diagonal cell is a jump point if a straight run from it finds one
+                if straight(index, side_x, 1) is not None or straight(index, dy, stride) is not None:
+                    break
+        return grid_map.coordinate(index) if index is not None else None
+
+    def directions(node, parent):
+        """Directions left after pruning the neighbors the parent reaches as cheaply."""
+        if parent is None:
+            return DIRECTIONS
+        x, y = node
+        index = grid_map.index(x, y)
+        dx = (x > parent[0]) - (x < parent[0])
+        dy = (y > parent[1]) - (y < parent[1])
+        result = []
+        if dx and dy:
+            result += [(0, dy), (dx, 0), (dx, dy)]
+            if blocked[index - dx * stride]:
+                result.append((-dx, dy))
+            if blocked[index - dy]:
+                result.append((dx, -dy))
+        elif dx:
+            result.append((dx, 0))
+            if blocked[index + 1]:
+                result.append((dx, 1))
+            if blocked[index - 1]:
+                result.append((dx, -1))
+        else:
+            result.append((0, dy))
+            if blocked[index + stride]:
+                result.append((1, dy))
+            if blocked[index - stride]:
+                result.append((-1, dy))
+        return result
+
+    # Ties of f go to the jump point closest to the goal
+    stack = [(heuristic(start, goal), heuristic(start, goal), start)]
+    costs = {start: 0}
+    fathers = {start: None}
+    closed = set()
+
+    while len(stack) > 0:
+        _, _, current = heapq.heappop(stack)
+        cost = costs[current]
+        if current in closed:
+            continue
+        closed.add(current)
+        if current == goal:
+            break
+
+        for dx, dy in directions(current, fathers[current]):
+            point = jump(current, dx, dy)
+            if point is None:
+                continue
+            new_cost = cost + chebyshev(current, point)  # Straight or diagonal run, one move per cell
+            if new_cost < costs.get(point, float('inf')):
+                costs[point] = new_cost
+                fathers[point] = current
+                estimate = heuristic(point, goal)
+                heapq.heappush(stack, (new_cost + estimate, estimate, point))
+
+    if goal not in closed or goal == start:
+        return [], len(closed)
+
+    # Fill the runs between consecutive jump points
+    points = []
+    current = goal
+    while current is not None:
+        points.append(current)
+        current = fathers[current]
+    points.reverse()
+
+    path = []
+    for (x, y), (tx, ty) in zip(points, points[1:]):
+        dx = (tx > x) - (tx < x)
+        dy = (ty > y) - (ty < y)
+        while (x, y) != (tx, ty):
+            x += dx
+            y += dy
+            path.append((x, y))
+    return path, len(closed)
+
+
+def gridAStar(grid_map, start, goal, heuristic=chebyshev, bounds=None):
+    """
+    A* over a GridMap, optionally without leaving a rectangle.
+    Args:
+        grid_map: GridMap of the grid
+        start, goal: Coordinates
+        heuristic: Admissible heuristic of two coordinates
+        bounds: (x0, y0, x1, y1), only cells with x0 <= x < x1 and y0 <= y < y1 are searched
+    Returns the path (without start, with goal, empty if there is none) and
+    the number of nodes expanded.
+    """
+    if not grid_map.isFree(*goal):
+        return [], 0
+    blocked = grid_map.blocked
+    stride = grid_map.stride
+    offsets = [dx * stride + dy for dx, dy in DIRECTIONS]
+    source = grid_map.index(*start)
+    target = grid_map.index(*goal)
+
+    # Ties of f go to the node closest to the goal
+    estimate = heuristic(start, goal)
+    stack = [(estimate, estimate, source)]
+    costs = {source: 0}
+    fathers = {source: None}
+    closed = set()
+
+    while len(stack) > 0:
+        _, _, current = heapq.heappop(stack)
+        if current in closed:
+            continue
+        closed.add(current)
+        if current == target:
+            break
+
+        new_cost = costs[current] + 1
+        for offset in offsets:
+            neighbor = current + offset
+            if blocked[neighbor] or neighbor in closed:
+                continue
+            point = grid_map.coordinate(neighbor)
+            if bounds is not None and not (bounds[0] <= point[0] < bounds[2] and bounds[1] <= point[1] < bounds[3]):
+                continue
+            if new_cost < costs.get(neighbor, float('inf')):
+                costs[neighbor] = new_cost
+                fathers[neighbor] = current
+                estimate = heuristic(point, goal)
+                heapq.heappush(stack, (new_cost + estimate, estimate, neighbor))
+
+    if target not in closed or target == source:
+        return [], len(closed)
+    path = []
+    current = target
+    while current != source:
+        path.append(grid_map.coordinate(current))
+        current = fathers[current]
+    path.reverse()
+    return path, len(closed)
+
+
+class AnytimeSearch:
+    """
+    Weighted A* over a GridMap that runs a bounded number of expansions per call.
+
+    Between calls the open list and the search tree are kept, so a search
+    cut by its budget goes on where it stopped. Until the goal is reached,
+    path() leads to the most promising open node, so the roomba can move
+    while the search goes on, and any cell of the tree can be the start of
+    the next path. With weight > 1 the search goes greedier to the goal and
+    its paths are at most weight times longer than the shortest one. A goal
+    in another connected component is rejected without expanding anything.
+    """
+    def __init__(self, grid_map, start, goal, heuristic=chebyshev, weight=1.0):
+        """
+        Args:
+            grid_map: GridMap of the grid
+            start, goal: Coordinates
+            heuristic: Admissible heuristic of two coordinates
+            weight: Factor of the heuristic in the priority of the nodes
+        """
+        self.grid_map = grid_map
+        self.start = start
+        self.goal = goal
+        self.heuristic = heuristic
+        self.weight = weight
+        self.source = grid_map.index(*start)
+        self.target = grid_map.index(*goal)
+        self.costs = {self.source: 0}
+        self.fathers = {self.source: None}
+        self.closed = set()
+        self.expanded = 0  # Nodes expanded by all the calls
+        self.found = False
+        self.done = not grid_map.connected(start, goal)
+
+        # Ties of the priority go to the node closest to the goal
+        estimate = heuristic(start, goal)
+        self.stack = [] if self.done else [(weight * estimate, estimate, self.source)]
+
+    def copy(self):
+        """Independent copy of the search."""
+        other = AnytimeSearch.__new__(AnytimeSearch)
+        other.__dict__.update(self.__dict__)
+        other.costs = dict(self.costs)
+        other.fathers = dict(self.fathers)
+        other.closed = set(self.closed)
+        other.stack = list(self.stack)
+        return other
+
+    def run(self, budget=None):
+        """
+        Expand nodes until the goal is reached or the open list is empty.
+        Args:
+            budget: Nodes expanded at most by this call (default: no limit)
+        Returns the number of nodes expanded by this call.
+        """
+        grid_map = self.grid_map
+        blocked = grid_map.blocked
+        offsets = [dx * grid_map.stride + dy for dx, dy in DIRECTIONS]
+        stack = self.stack
+        costs = self.costs
+        fathers = self.fathers
+        closed = self.closed
+        expanded = 0
+
+        while stack and not self.done and (budget is None or expanded < budget):
+            _, _, current = heapq.heappop(stack)
+            if current in closed:
+                continue
+            closed.add(current)
+            expanded += 1
+            if current == self.target:
+                self.found = self.done = True
+                break
+
+            new_cost = costs[current] + 1
+            for offset in offsets:
+                neighbor = current + offset
+                if blocked[neighbor] or neighbor in closed:
+                    continue
+                if new_cost < costs.get(neighbor, float('inf')):
+                    costs[neighbor] = new_cost
+                    fathers[neighbor] = current
+                    estimate = self.heuristic(grid_map.coordinate(neighbor), self.goal)
+                    heapq.heappush(stack, (new_cost + self.weight * estimate, estimate, neighbor))
+
+        if not stack:
+            self.done = True
+        self.expanded += expanded
+        return expanded
+
+    def frontier(self):
+        """Most promising open node, None if there is none."""
+        while self.stack and self.stack[0][2] in self.closed:
+            heapq.heappop(self.stack)
+        return self.stack[0][2] if self.stack else None
+
+    def __contains__(self, coord):
+        """Whether a cell is in the search tree, so paths can start from it."""
+        return self.grid_map.isFree(*coord) and self.grid_map.index(*coord) in self.fathers
+
+    def path(self, coord=None):
+        """
+        Path through the search tree from one of its cells (default: the start).
+
+        It leads to the goal once it is reached, and to the most promising
+        open node before. The path goes up the tree from the cell to the
+        branch of that node and down the branch.
+        Returns the path (without the cell, empty if the goal can not be reached).
+        """
+        if self.found:
+            end = self.target
+        elif self.done:
+            return []
+        else:
+            end = self.frontier()
+            if end is None:
+                return []
+
+        fathers = self.fathers
+        up = []  # Ancestors of the cell, the cell included
+        node = self.source if coord is None else self.grid_map.index(*coord)
+        while node is not None:
+            up.append(node)
+            node = fathers[node]
+        depth = {node: position for position, node in enumerate(up)}
+
+        down = []
+        branch = end
+        while branch not in depth:
+            down.append(branch)
+            branch = fathers[branch]
+        down.reverse()
+        return [self.grid_map.coordinate(node) for node in up[1:depth[branch] + 1] + down]
+
+
+class HierarchicalMap:
+    """
+    Abstract graph of a GridMap for hierarchical pathfinding (HPA*).
+
+    The grid is split in square clusters. Every run of crossings between
+    two clusters gets one entrance in its middle, or one at each end when
+    it is long; an entrance is a pair of cells across the border joined by
+    an edge of cost 1. The entrances of a cluster are joined by the length
+    of the shortest path between them inside the cluster, found with a BFS
+    of all the entrances at once over the cluster blocks. Long queries
+    search this graph and refine the result one segment at a time.
+    """
+    def __init__(self, grid_map, cluster_size=CLUSTER_SIZE):
+        """
+        Args:
+            grid_map: GridMap of the grid
+            cluster_size: Side of the square clusters in cells
+        """
+        self.grid_map = grid_map
+        self.cluster_size = cluster_size
+        self.entrances = {}  # Cluster -> entrance cells in it
+        self.edges = {}  # Entrance cell -> {entrance cell: cost}
+        self.borders = {}  # (cluster, cluster) -> pairs of entrance cells across their border
+        self.uses = {}  # Entrance cell -> pairs that use it
+        self.buildEntrances(*self.crossings())
+        self.buildDistances(list(self.entrances))
+
+    def copy(self, grid_map):
+        """
+        Independent copy of the graph over another GridMap with the same cells.
+        Args:
+            grid_map: GridMap read by the copy
+        """
+        other = HierarchicalMap.__new__(HierarchicalMap)
+        other.__dict__.update(self.__dict__)
+        other.grid_map = grid_map
+        other.entrances = {cluster: list(entrances) for cluster, entrances in self.entrances.items()}
+        other.edges = {entrance: dict(edges) for entrance, edges in self.edges.items()}
+        other.borders = {border: list(pairs) for border, pairs in self.borders.items()}
+        other.uses = dict(self.uses)
+        return other
+
+    def cluster(self, coord):
+        """Cluster key of a coordinate."""
+        return (coord[0] // self.cluster_size, coord[1] // self.cluster_size)
+
+    def bounds(self, cluster):
+        """Rectangle (x0, y0, x1, y1) of the cells of a cluster."""
+        size = self.cluster_size
+        x0, y0 = cluster[0] * size, cluster[1] * size
+        return x0, y0, min(x0 + size, self.grid_map.width), min(y0 + size, self.grid_map.height)
+
+    def clusterBlocks(self, clusters):
+        """Free cells of some clusters, (clusters, size, size) with the cells past the grid blocked."""
+        size = self.cluster_size
+        blocked = self.grid_map.padded()
+        blocks = np.zeros((len(clusters), size, size), dtype=bool)
+        for index, cluster in enumerate(clusters):
+            x0, y0, x1, y1 = self.bounds(cluster)
+            blocks[index, :x1 - x0, :y1 - y0] = ~blocked[x0 + 1:x1 + 1, y0 + 1:y1 + 1]
+        return blocks
+
+    def crossings(self, region=None):
+        """
+        Pairs of neighboring free cells in different clusters.
+        Args:
+            region: (x0, y0, x1, y1) aligned to the clusters, only pairs inside it (default: the grid)
+        Returns four arrays (ax, ay, bx, by), a is the cell of the lower column
+        (or row, for borders between rows) of each pair.
+        """
+        size = self.cluster_size
+        x0, y0, x1, y1 = region if region is not None else (0, 0, self.grid_map.width, self.grid_map.height)
+        free = ~self.grid_map.padded()[x0 + 1:x1 + 1, y0 + 1:y1 + 1]
+        width, height = free.shape
+        found = []
+
+        # Borders between columns x and x + 1, corners included
+        for x in range(size - 1, width - 1, size):
+            for dy in (-1, 0, 1):
+                low, high = max(0, -dy), height - max(0, dy)
+                ys = np.flatnonzero(free[x, low:high] & free[x + 1, low + dy:high + dy]) + low
+                found.append((np.full(ys.size, x), ys, np.full(ys.size, x + 1), ys + dy))
+
+        # Borders between rows y and y + 1, without the corners found above
+        for y in range(size - 1, height - 1, size):
+            for dx in (-1, 0, 1):
+                low, high = max(0, -dx), width - max(0, dx)
+                xs = np.flatnonzero(free[low:high, y] & free[low + dx:high + dx, y + 1]) + low
+                xs = xs[xs // size == (xs + dx) // size]
+                found.append((xs, np.full(xs.size, y), xs + dx, np.full(xs.size, y + 1)))
+
+        if not found:
+            return tuple(np.zeros(0, dtype=int) for _ in range(4))
+        ax, ay, bx, by = (np.concatenate([arrays[i] for arrays in found]) for i in range(4))
+        return ax + x0, ay + y0, bx + x0, by + y0
+
+    def clusterIds(self, xs, ys):
+        """Cluster of each coordinate of two arrays as a single integer."""
+        rows = -(-self.grid_map.height // self.cluster_size)
+        return (xs // self.cluster_size) * rows + ys // self.cluster_size
+
+    def buildEntrances(self, ax, ay, bx, by):
+        """
+        Add the entrances of some crossings and join each pair across its border.
+        Args:
+            ax, ay, bx, by: Crossings of whole borders, as returned by crossings()
+        Returns the borders that got entrances.
+        """
+        borders = set()
+        if ax.size == 0:
+            return borders
+        cluster_a = self.clusterIds(ax, ay)
+        cluster_b = self.clusterIds(bx, by)
+
+        # Crossings in order along each border
+        order = np.lexsort((by, bx, ay, ax, cluster_b, cluster_a))
+        ax, ay, bx, by, cluster_a, cluster_b = (v[order] for v in (ax, ay, bx, by, cluster_a, cluster_b))
+
+        # Consecutive crossings of a border whose cells touch on both sides form a run
+        breaks = np.ones(ax.size, dtype=bool)
+        breaks[1:] = (
+            (cluster_a[1:] != cluster_a[:-1]) | (cluster_b[1:] != cluster_b[:-1])
+            | (np.maximum(np.abs(np.diff(ax)), np.abs(np.diff(ay))) > 1)
+            | (np.maximum(np.abs(np.diff(bx)), np.abs(np.diff(by))) > 1)
+        )
+        starts = np.flatnonzero(breaks)
+        ends = np.append(starts[1:], ax.size) - 1
+        long_runs = ends - starts + 1 >= ENTRANCE_SPLIT
+        chosen = np.concatenate([
+            np.where(long_runs, starts, (starts + ends) // 2),
+            ends[long_runs],
+        ])
+
+        for index in chosen.tolist():
+            a = (int(ax[index]), int(ay[index]))
+            b = (int(bx[index]), int(by[index]))
+            self.addEntrance(a)
+            self.addEntrance(b)
+            self.edges[a][b] = 1
+            self.edges[b][a] = 1
+            border = (self.cluster(a), self.cluster(b))
+            self.borders.setdefault(border, []).append((a, b))
+            borders.add(border)
+        return borders
+
+    def addEntrance(self, coord):
+        """Add an entrance cell to its cluster, or count one more pair that uses it."""
+        if coord not in self.edges:
+            self.edges[coord] = {}
+            self.entrances.setdefault(self.cluster(coord), []).append(coord)
+        self.uses[coord] = self.uses.get(coord, 0) + 1
+
+    def removeEntrance(self, coord):
+        """Count one pair less that uses an entrance cell, removing it with its edges after the last one."""
+        self.uses[coord] -= 1
+        if self.uses[coord] == 0:
+            del self.uses[coord]
+            for other in self.edges.pop(coord):
+                self.edges[other].pop(coord, None)
+            self.entrances[self.cluster(coord)].remove(coord)
+
+    def update(self, coords):
+        """
+        Rebuild the graph around cells whose passability changed.
+
+        Only the borders of the clusters of those cells are searched for
+        entrances again, and only the clusters that gained or lost entrances
+        get their distances computed again.
+        Args:
+            coords: Coordinates of the changed cells
+        """
+        changed = {self.cluster(coord) for coord in coords}
+        if not changed:
+            return
+        touched = set(changed)
+        for border in [border for border in self.borders if border[0] in changed or border[1] in changed]:
+            for a, b in self.borders.pop(border):
+                self.edges[a].pop(b, None)
+                self.edges[b].pop(a, None)
+                self.removeEntrance(a)
+                self.removeEntrance(b)
+            touched.update(border)
+
+        # Crossings of the borders of the changed clusters, in a region one cluster around them
+        size = self.cluster_size
+        region = (
+            max(0, (min(cx for cx, _ in changed) - 1) * size),
+            max(0, (min(cy for _, cy in changed) - 1) * size),
+            min(self.grid_map.width, (max(cx for cx, _ in changed) + 2) * size),
+            min(self.grid_map.height, (max(cy for _, cy in changed) + 2) * size),
+        )
+        ax, ay, bx, by = self.crossings(region)
+        ids = self.clusterIds(np.array([cx * size for cx, _ in changed]), np.array([cy * size for _, cy in changed]))
+        keep = np.isin(self.clusterIds(ax, ay), ids) | np.isin(self.clusterIds(bx, by), ids)
+        for border in self.buildEntrances(ax[keep], ay[keep], bx[keep], by[keep]):
+            touched.update(border)
+        self.buildDistances(sorted(touched))
+
+    def buildDistances(self, clusters):
+        """
+        Join the entrances of some clusters by their distances inside the cluster.
+
+        Each entrance gets a layer with the free cells of its cluster, and
+        the BFS of every layer advances at once one ring per iteration, so
+        the cost is a few array operations per ring instead of Python work
+        per cell.
+        """
+        size = self.cluster_size
+        clusters = [cluster for cluster in clusters if self.entrances.get(cluster)]
+        blocks = self.clusterBlocks(clusters)
+        block_of = {cluster: index for index, cluster in enumerate(clusters)}
+
+        sources = [(cluster, entrance) for cluster in clusters for entrance in self.entrances[cluster]]
+        for entrance_cluster, entrance in sources:
+            for other in [other for other in self.edges[entrance] if self.cluster(other) == entrance_cluster]:
+                del self.edges[entrance][other]
+
+        for first in range(0, len(sources), DISTANCE_BATCH):
+            batch = sources[first:first + DISTANCE_BATCH]
+            layers = np.arange(len(batch))
+            cx = np.array([cluster[0] for cluster, _ in batch])
+            cy = np.array([cluster[1] for cluster, _ in batch])
+            lx = np.array([entrance[0] for _, entrance in batch]) - cx * size
+            ly = np.array([entrance[1] for _, entrance in batch]) - cy * size
+
+            passable = blocks[[block_of[cluster] for cluster, _ in batch]]
+            reached = np.zeros_like(passable)
+            reached[layers, lx, ly] = True
+            distances = np.full(passable.shape, -1, dtype=np.int32)
+            distances[layers, lx, ly] = 0
+            frontier = reached.copy()
+            ring = 0
+            while frontier.any():
+                ring += 1
+                grown = frontier.copy()
+                grown[:, 1:] |= frontier[:, :-1]
+                grown[:, :-1] |= frontier[:, 1:]
+                frontier = grown.copy()
+                frontier[:, :, 1:] |= grown[:, :, :-1]
+                frontier[:, :, :-1] |= grown[:, :, 1:]
+                frontier &= passable & ~reached
+                distances[frontier] = ring
+                reached |= frontier
+
+            # The layers of the entrances of a cluster are consecutive
+            layer = 0
+            while layer < len(batch):
+                cluster = batch[layer][0]
+                entrances = self.entrances[cluster]
+                first_entrance = entrances.index(batch[layer][1])
+                count = min(len(entrances) - first_entrance, len(batch) - layer)
+                ex = np.array([e[0] for e in entrances]) - cluster[0] * size
+                ey = np.array([e[1] for e in entrances]) - cluster[1] * size
+                rows = distances[layer:layer + count][:, ex, ey].tolist()
+                for entrance, row in zip(entrances[first_entrance:first_entrance + count], rows):
+                    edges = self.edges[entrance]
+                    for other, distance in zip(entrances, row):
+                        if distance > 0:
+                            edges[other] = distance
+                layer += count
+
+    def localDistances(self, coord):
+        """
+        Distances from a cell to the entrances of its cluster, without leaving it.
+        Returns the distances by entrance and the number of cells searched.
+        """
+        grid_map = self.grid_map
+        x0, y0, x1, y1 = self.bounds(self.cluster(coord))
+        distances = {coord: 0}
+        queue = deque([coord])
+        while queue:
+            current = queue.popleft()
+            for dx, dy in DIRECTIONS:
+                neighbor = (current[0] + dx, current[1] + dy)
+                if neighbor not in distances and x0 <= neighbor[0] < x1 and y0 <= neighbor[1] < y1 \
+                        and grid_map.isFree(*neighbor):
+                    distances[neighbor] = distances[current] + 1
+                    queue.append(neighbor)
+        entrances = {entrance: distances[entrance] for entrance in self.entrances.get(self.cluster(coord), []) if entrance in distances}
+        return entrances, len(distances)
+
+    def findPath(self, start, goal, heuristic=chebyshev, on_expanded=None):
+        """
+        Path between two cells.
+
+        Queries no longer than a cluster run A* on the grid. Longer ones
+        join start and goal to the entrances of their clusters, search the
+        abstract graph and return a LazyPath.
+        Args:
+            start, goal: Coordinates
+            heuristic: Admissible heuristic of two coordinates
+            on_expanded: Function called with the nodes expanded by each later refinement
+        Returns the path (without start, with goal, empty if there is none) and
+        the number of nodes expanded.
+        """
+        if chebyshev(start, goal) <= self.cluster_size:
+            return gridAStar(self.grid_map, start, goal, heuristic)
+        if not self.grid_map.isFree(*goal):
+            return [], 0
+
+        start_edges, start_cells = self.localDistances(start)
+        goal_edges, goal_cells = self.localDistances(goal)
+
+        estimate = heuristic(start, goal)
+        stack = [(estimate, estimate, start)]
+        costs = {start: 0}
+        fathers = {start: None}
+        closed = set()
+        while len(stack) > 0:
+            _, _, current = heapq.heappop(stack)
+            if current in closed:
+                continue
+            closed.add(current)
+            if current == goal:
+                break
+
+            neighbors = list(self.edges.get(current, {}).items())
+            if current == start:
+                neighbors += start_edges.items()
+            if current in goal_edges:
+                neighbors.append((goal, goal_edges[current]))
+            for neighbor, cost in neighbors:
+                new_cost = costs[current] + cost
+                if new_cost < costs.get(neighbor, float('inf')):
+                    costs[neighbor] = new_cost
+                    fathers[neighbor] = current
+                    estimate = heuristic(neighbor, goal)
+                    heapq.heappush(stack, (new_cost + estimate, estimate, neighbor))
+
+        expanded = len(closed) + start_cells + goal_cells
+        if goal not in closed:
+            return [], expanded
+
+        waypoints = []
+        current = goal
+        while current is not None:
+            waypoints.append(current)
+            current = fathers[current]
+        waypoints.reverse()
+        segments = [(a, b, costs[b] - costs[a]) for a, b in zip(waypoints, waypoints[1:]) if a != b]
+        return LazyPath(self, segments, on_expanded), expanded
+
+    def refine(self, start, goal):
+        """
+        Cells of an abstract edge, without start.
+        Returns the path and the number of nodes expanded.
+        """
+        if self.cluster(start) != self.cluster(goal):
+            return [goal], 0  # Edge across a border, the cells are neighbors
+        return gridAStar(self.grid_map, start, goal, chebyshev, self.bounds(self.cluster(start)))
+
+
+class LazyPath:
+    """
+    Path of a hierarchical search, refined one abstract segment at a time.
+
+    It supports what the roombas do with the lists of a_star (len, truth,
+    indexing and pop) and only refines the segments that are read. The
+    length is known before refining, as the abstract costs are exact.
+    """
+    def __init__(self, hierarchy, segments, on_expanded=None):
+        """
+        Args:
+            hierarchy: HierarchicalMap that found the path
+            segments: List of (start, goal, cost) of the abstract edges
+            on_expanded: Function called with the nodes expanded by each refinement
+        """
+        self.hierarchy = hierarchy
+        self.cells = deque()
+        self.segments = deque(segments)
+        self.pending = sum(cost for _, _, cost in segments)  # Cells of the segments not refined yet
+        self.on_expanded = on_expanded
+
+    def refineNext(self):
+        """Append the cells of the next segment."""
+        start, goal, cost = self.segments.popleft()
+        path, expanded = self.hierarchy.refine(start, goal)
+        self.pending -= cost
+        self.cells.extend(path)
+        if self.on_expanded is not None:
+            self.on_expanded(expanded)
+
+    def __len__(self):
+        return len(self.cells) + self.pending
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        while len(self.cells) <= index and self.segments:
+            self.refineNext()
+        return self.cells[index]
+
+    def pop(self, index=0):
+        item = self[index]
+        del self.cells[index]
+        return item
+
+    def __iter__(self):
+        while self.segments:
+            self.refineNext()
+        return iter(list(self.cells))
+
+
+class DStarLite:
+    """
+    Incremental shortest path to a fixed goal (D* Lite, Koenig and Likhachev).
+
+    The search runs from the goal to the start, so the start can move along
+    the path without invalidating what was searched. When cells are blocked
+    or opened, only the cells around them are queued again and the repair
+    expands the nodes whose distance changed, instead of searching again.
+    Keys are pushed lazily: an entry of the heap is current only while it
+    matches the key recorded for its cell.
+    """
+    def __init__(self, grid_map, start, goal, heuristic=chebyshev):
+        """
+        Args:
+            grid_map: GridMap of the grid, read again on every repair
+            start, goal: Coordinates
+            heuristic: Consistent heuristic of two coordinates
+        """
+        self.grid_map = grid_map
+        self.start = start
+        self.goal = goal
+        self.heuristic = heuristic
+        self.last = start  # Start of the last repair
+        self.km = 0  # Heuristic drift since the first search
+        self.g = {}
+        self.rhs = {goal: 0}
+        self.keys = {goal: self.key(goal)}  # Current key of the queued cells
+        self.queue = [(self.keys[goal], goal)]
+        self.expanded = 0  # Nodes expanded by all the searches
+
+    def copy(self):
+        """Independent copy of the planner."""
+        other = DStarLite.__new__(DStarLite)
+        other.__dict__.update(self.__dict__)
+        other.g = dict(self.g)
+        other.rhs = dict(self.rhs)
+        other.keys = dict(self.keys)
+        other.queue = list(self.queue)
+        return other
+
+    def key(self, coord):
+        """Priority of a cell in the queue."""
+        best = min(self.g.get(coord, float('inf')), self.rhs.get(coord, float('inf')))
+        return (best + self.heuristic(self.start, coord) + self.km, best)
+
+    def neighbors(self, coord):
+        """Free neighbors of a cell."""
+        x, y = coord
+        return [(x + dx, y + dy) for dx, dy in DIRECTIONS if self.grid_map.isFree(x + dx, y + dy)]
+
+    def updateVertex(self, coord):
+        """Recompute the one step lookahead of a cell and queue it if it is inconsistent."""
+        inf = float('inf')
+        if coord != self.goal:
+            if self.grid_map.isFree(*coord):
+                self.rhs[coord] = min((self.g.get(n, inf) + 1 for n in self.neighbors(coord)), default=inf)
+            else:
+                self.rhs[coord] = inf
+        if self.g.get(coord, inf) != self.rhs.get(coord, inf):
+            key = self.key(coord)
+            self.keys[coord] = key
+            heapq.heappush(self.queue, (key, coord))
+        else:
+            self.keys.pop(coord, None)
+
+    def computeShortestPath(self):
+        """Expand the inconsistent cells until the distance of the start is known."""
+        inf = float('inf')
+        g = self.g
+        rhs = self.rhs
+        queue = self.queue
+        while queue:
+            key, coord = queue[0]
+            if self.keys.get(coord) != key:
+                heapq.heappop(queue)  # Outdated entry
+                continue
+            start_key = self.key(self.start)
+            if key >= start_key and rhs.get(self.start, inf) == g.get(self.start, inf):
+                break
+            heapq.heappop(queue)
+            del self.keys[coord]
+            self.expanded += 1
+
+            new_key = self.key(coord)
+            if key < new_key:
+                self.keys[coord] = new_key
+                heapq.heappush(queue, (new_key, coord))
+            elif g.get(coord, inf) > rhs.get(coord, inf):
+                g[coord] = rhs[coord]
+                for neighbor in self.neighbors(coord):
+                    self.updateVertex(neighbor)
+            else:
+                g[coord] = inf
+                self.updateVertex(coord)
+                for neighbor in self.neighbors(coord):
+                    self.updateVertex(neighbor)
+
+    def moveTo(self, coord):
+        """Move the start, the searched distances stay valid."""
+        self.km += self.heuristic(self.last, coord)
+        self.last = coord
+        self.start = coord
+
+    def updateCells(self, coords):
+        """
+        Repair the distances after the passability of some cells changed.
+        Args:
+            coords: Coordinates of the cells blocked or opened
+        """
+        affected = set()
+        for x, y in coords:
+            affected.add((x, y))
+            affected.update((x + dx, y + dy) for dx, dy in DIRECTIONS if self.grid_map.isFree(x + dx, y + dy))
+        for coord in affected:
+            self.updateVertex(coord)
+        self.computeShortestPath()
+
+    def path(self):
+        """Path from the start to the goal (without start, empty if there is none), following the distances."""
+        inf = float('inf')
+        current = self.start
+        remaining = self.g.get(current, inf)
+        if remaining == inf:
+            return []
+        path = []
+        while current != self.goal:
+            current = min(self.neighbors(current), key=lambda n: self.g.get(n, inf))
+            path.append(current)
+            if len(path) > remaining:
+                return []  # Not repaired, the distances are inconsistent
+        return path
@@ -0,0 +1,157 @@
+from time import perf_counter_ns
+
+import pandas as pd
+
+from .agent import Roomba
+
+# Methods timed on each roomba: the state machine phases and the searches
+ROOMBA_PHASES = (
+    "step", "checkBattery", "checkStation", "checkRoombas", "exchangeInfo",
+    "checkTrash", "clean", "checkObstacles", "move", "getNextReturnStep",
+    "calculateReturnPath", "reserveStation", "recharge",
+    "a_star", "cooperative_a_star", "pathToNearestUnvisited", "pathToNearestKnownTrash",
+)
+MODEL_PHASES = ("step", "collect", "skipIdleTicks")
+COORDINATOR_PHASES = ("step", "auction", "nearestTargets")
+
+
+class PhaseProfiler:
+    """
+    Opt-in timing of the phases of a RandomModel.
+
+    attach() replaces the profiled methods of the model, the coordinator
+    and each roomba by timed wrappers on the instances themselves, and
+    detach() removes them, so a model that is not profiled runs the plain
+    class methods. Every call is recorded under its stack of phases (e.g.
+    step;Roomba.step;checkObstacles;a_star) and its owner (the unique_id
+    of the roomba, or None for the model), with the number of calls, the
+    total and self wall time and the nodes expanded by the searches.
+    """
+    def __init__(self, model):
+        """
+        Args:
+            model: Model to profile
+        """
+        self.model = model
+        self.entries = {}  # (owner, stack) -> [calls, total ns, self ns, expansions]
+        self.frames = []  # (owner, stack) of the calls in progress
+        self.children = []  # Time spent in the children of each call in progress
+        self.wrapped = []  # (object, method name) replaced by a wrapper
+        self.original_step = None
+
+    def attach(self):
+        """Wrap the profiled methods, roombas created after a previous attach are also wrapped."""
+        model = self.model
+        model.profiler = self
+        if self.original_step is None:
+            self.original_step = model.step
+            model.step = self.timed(None, "step", model.step)
+            for name in MODEL_PHASES[1:]:
+                self.wrap(model, None, name, name)
+            if model.coordinator is not None:
+                for name in COORDINATOR_PHASES:
+                    self.wrap(model.coordinator, None, name, f"coordinator.{name}")
+
+        for roomba in model.agents_by_type[Roomba]:
+            if "step" not in vars(roomba):
+                for name in ROOMBA_PHASES:
+                    self.wrap(roomba, roomba.unique_id, name, "Roomba.step" if name == "step" else name)
+        return self
+
+    def detach(self):
+        """Remove the wrappers, the recorded data is kept."""
+        for target, name in self.wrapped:
+            if name in vars(target):
+                delattr(target, name)
+        self.wrapped = []
+        if self.original_step is not None:
+            self.model.step = self.original_step
+            self.original_step = None
+        self.model.profiler = None
+
+    def wrap(self, target, owner, name, label):
+        """Replace a method of an object by a timed wrapper."""
+        setattr(target, name, self.timed(owner, label, getattr(target, name)))
+        self.wrapped.append((target, name))
+
+    def timed(self, owner, label, function):
+        """Wrapper of a function that records its calls under the current stack."""
+        def wrapper(*args, **kwargs):
+            parent = self.frames[-1][1] if self.frames else ()
+            if owner is None and self.frames:
+                key = (self.frames[-1][0], parent + (label,))  # Called on behalf of the caller
+            else:
+                key = (owner, parent + (label,))
+            self.frames.append(key)
+            self.children.append(0)
+            start = perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter_ns() - start
+                children = self.children.pop()
+                self.frames.pop()
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = self.entries[key] = [0, 0, 0, 0]
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] += elapsed - children
+                if self.children:
+                    self.children[-1] += elapsed
+        return wrapper
+
+    def expanded(self, nodes):
+        """Called by the searches with the number of nodes they expanded."""
+        if self.frames:
+            key = self.frames[-1]
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [0, 0, 0, 0]
+            entry[3] += nodes
+
+    def reset(self):
+        """Forget the recorded data."""
+        self.entries.clear()
+
+    def table(self, per_roomba=False):
+        """
+        Recorded data as a DataFrame.
+        Args:
+            per_roomba: Whether to keep a row per roomba, instead of adding up the fleet
+        Returns one row per stack of phases, with the calls, the total and self
+        time in seconds and the nodes expanded, sorted by total time.
+        """
+        rows = [
+            {
+                "Roomba": owner, "Stack": ";".join(stack), "Phase": stack[-1],
+                "Calls": calls, "Total (s)": total / 1e9, "Self (s)": own / 1e9, "Expansions": expansions,
+            }
+            for (owner, stack), (calls, total, own, expansions) in self.entries.items()
+        ]
+        columns = ["Roomba", "Stack", "Phase", "Calls", "Total (s)", "Self (s)", "Expansions"]
+        df = pd.DataFrame(rows, columns=columns)
+        if not per_roomba:
+            df = df.groupby(["Stack", "Phase"], as_index=False)[columns[3:]].sum()
+        return df.sort_values("Total (s)", ascending=False, ignore_index=True)
+
+    def folded(self, per_roomba=False):
+        """
+        Lines of the folded stack format read by flamegraph.pl, speedscope and inferno.
+
+        Each line is a stack of phases and its self time in microseconds.
+        Args:
+            per_roomba: Whether to add a frame with the roomba under Roomba.step
+        """
+        totals = {}
+        for (owner, stack), (_, _, own, _) in self.entries.items():
+            if per_roomba and owner is not None and "Roomba.step" in stack:
+                split = stack.index("Roomba.step") + 1
+                stack = stack[:split] + (f"Roomba {owner}",) + stack[split:]
+            totals[stack] = totals.get(stack, 0) + own
+        return [f"{';'.join(stack)} {own // 1000}" for stack, own in totals.items() if own >= 1000]
+
+    def writeFolded(self, path, per_roomba=False):
+        """Write the folded stacks to a file, see folded()."""
+        with open(path, "w") as file:
+            file.write("\n".join(self.folded(per_roomba)) + "\n")
@@ -0,0 +1,436 @@
+import bisect
+import io
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from .sink import STATES, STATE_CODES
+
+MAGIC = b"RMBALOG1"
+FOOTER = struct.Struct("<Q8s")  # offset of the chunk index, magic
+CHUNK = struct.Struct("<QII")  # tick of the keyframe, keyframe bytes, event bytes
+
+# Event codes, followed by the slot of the roomba and the arguments as varints
+TICK = 0x00  # ticks since the previous marker
+MOVE = 0x10  # 0x10 + direction of the move
+POSITION = 0x1F  # cell index, for jumps that are not a neighbor move
+DRAIN = 0x20  # battery - 1
+BATTERY = 0x21  # new battery
+CHARGE_SPAN = 0x22  # ticks in which the battery grows 5% per tick
+STATE = 0x30  # state code
+CLEAN = 0x40  # cell index of the trash cleaned
+EXCHANGE = 0x50  # slot of the other roomba
+DEATH = 0x60
+
+# Neighbor moves, the index is the direction code
+DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+DIRECTION_CODES = {delta: code for code, delta in enumerate(DIRECTIONS)}
+
+
+def writeVarint(buffer, value):
+    """Append an unsigned integer in LEB128 encoding."""
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def readVarint(data, position):
+    """Read a LEB128 integer, returns (value, next position)."""
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+class ReplayState:
+    """
+    State of a run at one tick, rebuilt from the event log.
+
+    Roombas are identified by their slot (the order in which they were
+    created), unique_ids maps each slot to the agent id.
+    """
+    def __init__(self, width, height, unique_ids):
+        count = len(unique_ids)
+        self.tick = 0
+        self.width = width
+        self.height = height
+        self.unique_ids = list(unique_ids)
+        self.alive = np.zeros(count, dtype=bool)
+        self.x = np.zeros(count, dtype=np.int32)
+        self.y = np.zeros(count, dtype=np.int32)
+        self.battery = np.zeros(count, dtype=np.int32)
+        self.state = np.zeros(count, dtype=np.uint8)
+        self.cleaned = np.zeros(count, dtype=np.int64)
+        self.trash = np.zeros((width, height), dtype=np.uint8)
+        self.visited = np.zeros((width, height), dtype=bool)
+        self.exchanges = []  # (slot, other slot) of the current tick
+
+    def copy(self):
+        """Independent copy of the state."""
+        other = ReplayState(self.width, self.height, self.unique_ids)
+        for name in ("alive", "x", "y", "battery", "state", "cleaned", "trash", "visited"):
+            setattr(other, name, getattr(self, name).copy())
+        other.tick = self.tick
+        other.exchanges = list(self.exchanges)
+        return other
+
+    def toKeyframe(self):
+        """Compressed bytes with the whole state."""
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer, alive=self.alive, x=self.x, y=self.y, battery=self.battery,
+            state=self.state, cleaned=self.cleaned, trash=self.trash,
+            visited=np.packbits(self.visited, axis=None),
+        )
+        return buffer.getvalue()
+
+    def loadKeyframe(self, tick, data):
+        """Replace the state by a keyframe."""
+        with np.load(io.BytesIO(data)) as arrays:
+            for name in ("alive", "x", "y", "battery", "state", "cleaned", "trash"):
+                setattr(self, name, arrays[name].copy())
+            visited = np.unpackbits(arrays["visited"], count=self.width * self.height)
+        self.visited = visited.reshape(self.width, self.height).astype(bool)
+        self.tick = tick
+        self.exchanges = []
+
+    def roombas(self):
+        """Roombas alive as a list of dictionaries."""
+        return [
+            {
+                "unique_id": self.unique_ids[slot],
+                "x": int(self.x[slot]),
+                "y": int(self.y[slot]),
+                "battery": int(self.battery[slot]),
+                "state": STATES[self.state[slot]] if self.state[slot] < len(STATES) else None,
+                "trash_cleaned": int(self.cleaned[slot]),
+            }
+            for slot in np.flatnonzero(self.alive)
+        ]
+
+
+class EventLog:
+    """
+    Compact binary log of a run, written while the model runs.
+
+    Every tick the roombas are compared with the last recorded state and
+    only the differences are written: moves as a direction code, battery
+    drains, state changes. Cleans, exchanges and deaths are recorded when
+    they happen. Events are grouped in chunks that start with a keyframe
+    (the whole state), so a replay can seek to any tick by decoding a
+    single chunk. Chunks are zlib compressed.
+    """
+    def __init__(self, path, model, keyframe_interval=1000):
+        """
+        Creates the log file and records the initial state.
+        Args:
+            path: File to write
+            model: Model being recorded, after its agents are placed
+            keyframe_interval: Ticks between keyframes
+        """
+        from .agent import Roomba
+
+        roombas = list(model.agents_by_type[Roomba])
+        self.slots = {roomba.unique_id: slot for slot, roomba in enumerate(roombas)}
+        self.roombas = roombas
+        self.keyframe_interval = keyframe_interval
+        self.height = model.height
+
+        # Last recorded state, events are the differences with it
+        self.state = ReplayState(model.width, model.height, [roomba.unique_id for roomba in roombas])
+        self.state.trash = np.array(model.world.trash, dtype=np.uint8)
+        for slot, roomba in enumerate(roombas):
+            self.state.alive[slot] = True
+            self.state.x[slot], self.state.y[slot] = roomba.cell.coordinate
+            self.state.battery[slot] = roomba.battery
+            self.state.state[slot] = STATE_CODES.get(roomba.state, 255)
+
+        self.events = bytearray()
+        self.tick = model.steps  # Tick of the last marker
+        self.keyframe_tick = model.steps
+        self.keyframe = self.state.toKeyframe()
+        self.chunks = []  # (keyframe tick, offset)
+
+        header = json.dumps({
+            "width": model.width,
+            "height": model.height,
+            "unique_ids": self.state.unique_ids,
+            "keyframe_interval": keyframe_interval,
+            "states": list(STATES),
+        }).encode()
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.file.write(struct.pack("<I", len(header)))
+        self.file.write(header)
+
+    def mark(self, tick):
+        """Start the events of a tick."""
+        if tick != self.tick:
+            self.events.append(TICK)
+            writeVarint(self.events, tick - self.tick)
+            self.tick = tick
+
+    def record(self, code, slot, *arguments):
+        """Append one event of a roomba."""
+        self.events.append(code)
+        writeVarint(self.events, slot)
+        for argument in arguments:
+            writeVarint(self.events, argument)
+
+    def clean(self, roomba, tick, coordinate):
+        """A roomba cleaned the trash of a cell."""
+        self.mark(tick)
+        x, y = coordinate
+        self.record(CLEAN, self.slots[roomba.unique_id], x * self.height + y)
+        self.state.trash[x, y] -= 1
+        self.state.cleaned[self.slots[roomba.unique_id]] += 1
+
+    def exchange(self, roomba, other, tick):
+        """A roomba received the knowledge of another one."""
+        self.mark(tick)
+        self.record(EXCHANGE, self.slots[roomba.unique_id], self.slots[other.unique_id])
+
+    def death(self, roomba, tick):
+        """A roomba ran out of battery."""
+        self.mark(tick)
+        slot = self.slots[roomba.unique_id]
+        self.record(DEATH, slot)
+        self.state.alive[slot] = False
+
+    def chargeSpan(self, roombas, first, ticks):
+        """Roombas recharged 5% per tick during ticks skipped after first."""
+        self.mark(first + 1)
+        for roomba in roombas:
+            slot = self.slots[roomba.unique_id]
+            self.record(CHARGE_SPAN, slot, ticks)
+            self.state.battery[slot] = min(100, self.state.battery[slot] + 5 * ticks)
+
+    def endTick(self, tick):
+        """Record the differences of the roombas alive at the end of a tick."""
+        self.mark(tick)
+        state = self.state
+        for slot, roomba in enumerate(self.roombas):
+            if not state.alive[slot]:
+                continue
+
+            x, y = roomba.cell.coordinate
+            if x != state.x[slot] or y != state.y[slot]:
+                direction = DIRECTION_CODES.get((x - int(state.x[slot]), y - int(state.y[slot])))
+                if direction is None:
+                    self.record(POSITION, slot, x * self.height + y)
+                else:
+                    self.record(MOVE + direction, slot)
+                state.x[slot], state.y[slot] = x, y
+                state.visited[x, y] = True
+
+            battery = roomba.battery
+            if battery != state.battery[slot]:
+                if battery == state.battery[slot] - 1:
+                    self.record(DRAIN, slot)
+                else:
+                    self.record(BATTERY, slot, battery)
+                state.battery[slot] = battery
+
+            code = STATE_CODES.get(roomba.state, 255)
+            if code != state.state[slot]:
+                self.record(STATE, slot, code)
+                state.state[slot] = code
+
+        if tick - self.keyframe_tick >= self.keyframe_interval:
+            self.writeChunk()
+            self.keyframe_tick = tick
+            self.keyframe = state.toKeyframe()
+
+    def writeChunk(self):
+        """Write the current keyframe and the events recorded after it."""
+        events = zlib.compress(bytes(self.events))
+        self.chunks.append((self.keyframe_tick, self.file.tell()))
+        self.file.write(CHUNK.pack(self.keyframe_tick, len(self.keyframe), len(events)))
+        self.file.write(self.keyframe)
+        self.file.write(events)
+        self.events = bytearray()
+
+    def close(self):
+        """Write the last chunk and the index of chunks."""
+        if self.file.closed:
+            return
+        self.writeChunk()
+        index_offset = self.file.tell()
+        index = json.dumps({"chunks": self.chunks, "last_tick": self.tick}).encode()
+        self.file.write(struct.pack("<I", len(index)))
+        self.file.write(index)
+        self.file.write(FOOTER.pack(index_offset, MAGIC))
+        self.file.close()
+
+
+class Replay:
+    """
+    Rebuilds the state of a recorded run at any tick, without running the
+    agents. Seeking finds the last keyframe before the tick with a binary
+    search and decodes only the events of its chunk.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a Roomba event log")
+            (length,) = struct.unpack("<I", file.read(4))
+            self.header = json.loads(file.read(length))
+            self.data_start = file.tell()
+            self.chunks, self.last_tick = self.readIndex(file)
+        self.ticks = [tick for tick, _ in self.chunks]
+
+    def readIndex(self, file):
+        """Read the chunk index, or rebuild it if the log was not closed."""
+        size = os.path.getsize(self.path)
+        if size >= self.data_start + FOOTER.size:
+            file.seek(size - FOOTER.size)
+            index_offset, magic = FOOTER.unpack(file.read(FOOTER.size))
+            if magic == MAGIC:
+                file.seek(index_offset)
+                (length,) = struct.unpack("<I", file.read(4))
+                index = json.loads(file.read(length))
+                return [tuple(chunk) for chunk in index["chunks"]], index["last_tick"]
+
+        # Unfinished log (e.g. the run crashed), walk the complete chunks
+        chunks = []
+        offset = self.data_start
+        while offset + CHUNK.size <= size:
+            file.seek(offset)
+            tick, keyframe_size, events_size = CHUNK.unpack(file.read(CHUNK.size))
+            end = offset + CHUNK.size + keyframe_size + events_size
+            if end > size:
+                break
+            chunks.append((tick, offset))
+            offset = end
+        last_tick = chunks[-1][0] if chunks else 0
+        return chunks, last_tick
+
+    def emptyState(self):
+        """State object of the size of the recorded run."""
+        return ReplayState(self.header["width"], self.header["height"], self.header["unique_ids"])
+
+    def readChunk(self, index):
+        """Return (keyframe tick, keyframe bytes, decompressed event bytes) of a chunk."""
+        _, offset = self.chunks[index]
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            tick, keyframe_size, events_size = CHUNK.unpack(file.read(CHUNK.size))
+            keyframe = file.read(keyframe_size)
+            events = zlib.decompress(file.read(events_size))
+        return tick, keyframe, events
+
+    def state(self, tick):
+        """State of the run at the end of a tick."""
+        tick = min(max(tick, self.ticks[0]), self.last_tick)
+        state = self.emptyState()
+        decoder = self.seek(state, bisect.bisect_right(self.ticks, tick) - 1)
+        decoder.advance(state, tick)
+        return state
+
+    def seek(self, state, index):
+        """Load the keyframe of a chunk into the state, returns the decoder of its events."""
+        keyframe_tick, keyframe, events = self.readChunk(index)
+        state.loadKeyframe(keyframe_tick, keyframe)
+        return ChunkDecoder(events, keyframe_tick, self.path)
+
+    def frames(self, start=0, stop=None):
+        """
+        Yield the state at every tick from start to stop, decoding each
+        chunk once. The same state object is updated and yielded.
+        """
+        start = max(start, self.ticks[0])
+        stop = self.last_tick if stop is None else min(stop, self.last_tick)
+        state = self.emptyState()
+        index = bisect.bisect_right(self.ticks, start) - 1
+        decoder = self.seek(state, index)
+        for tick in range(start, stop + 1):
+            if index + 1 < len(self.chunks) and tick >= self.ticks[index + 1]:
+                index += 1
+                decoder = self.seek(state, index)
+            decoder.advance(state, tick)
+            yield state
+
+
+class ChunkDecoder:
+    """Applies the events of one chunk to a ReplayState, tick by tick."""
+    def __init__(self, events, tick, path):
+        """
+        Args:
+            events: Decompressed events of the chunk
+            tick: Tick of the keyframe of the chunk
+            path: Log file, for error messages
+        """
+        self.events = events
+        self.position = 0
+        self.tick = tick  # Tick of the events being decoded
+        self.spans = []  # (slot, first tick, ticks, battery before) of charge spans
+        self.path = path
+
+    def advance(self, state, target):
+        """Apply the events of every tick up to target."""
+        events = self.events
+        height = state.height
+        while self.position < len(events):
+            code = events[self.position]
+            if code == TICK:
+                delta, position = readVarint(events, self.position + 1)
+                if self.tick + delta > target:
+                    break
+                self.position = position
+                self.tick += delta
+                self.settleSpans(state, self.tick - 1)
+                state.exchanges = []
+                continue
+
+            slot, self.position = readVarint(events, self.position + 1)
+            if MOVE <= code < MOVE + len(DIRECTIONS):
+                dx, dy = DIRECTIONS[code - MOVE]
+                state.x[slot] += dx
+                state.y[slot] += dy
+                state.visited[state.x[slot], state.y[slot]] = True
+            elif code == POSITION:
+                cell, self.position = readVarint(events, self.position)
+                state.x[slot], state.y[slot] = divmod(cell, height)
+                state.visited[state.x[slot], state.y[slot]] = True
+            elif code == DRAIN:
+                state.battery[slot] -= 1
+            elif code == BATTERY:
+                state.battery[slot], self.position = readVarint(events, self.position)
+            elif code == CHARGE_SPAN:
+                ticks, self.position = readVarint(events, self.position)
+                self.spans.append((slot, self.tick, ticks, int(state.battery[slot])))
+            elif code == STATE:
+                state.state[slot], self.position = readVarint(events, self.position)
+            elif code == CLEAN:
+                cell, self.position = readVarint(events, self.position)
+                state.trash[divmod(cell, height)] -= 1
+                state.cleaned[slot] += 1
+            elif code == DEATH:
+                state.alive[slot] = False
+            elif code == EXCHANGE:
+                other, self.position = readVarint(events, self.position)
+                state.exchanges.append((slot, other))
+            else:
+                raise ValueError(f"unknown event code {code:#x} in {self.path}")
+
+        if self.tick < target:
+            state.exchanges = []
+        self.settleSpans(state, target)
+        state.tick = target
+
+    def settleSpans(self, state, now):
+        """Set the battery of the charge spans at the end of tick now."""
+        for slot, first, ticks, battery in self.spans:
+            if now >= first:
+                state.battery[slot] = min(100, battery + 5 * min(ticks, now - first + 1))
+        self.spans = [span for span in self.spans if now < span[1] + span[2] - 1]
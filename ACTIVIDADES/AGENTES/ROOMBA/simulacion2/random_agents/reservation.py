@@ -0,0 +1,100 @@
+class ReservationTable:
+    """
+    Shared space-time reservation table for cooperative pathfinding.
+
+    Every entry says that a cell is taken by a roomba at a given tick, so
+    paths planned against the table do not collide with the ones already
+    reserved. Moves are also recorded to forbid two roombas swapping cells.
+    """
+    def __init__(self):
+        self.cells = {}  # (coordinate, tick) -> owner
+        self.moves = {}  # (from, to, tick) -> owner, the move ends at tick
+        self.by_owner = {}  # owner -> keys reserved by it
+        self.by_tick = {}  # tick -> keys reserved at that tick
+
+    def copy(self, owners=None):
+        """
+        Independent copy of the table.
+        Args:
+            owners: Optional dictionary old owner -> new owner, to rename the owners
+        """
+        owners = owners or {}
+        rename = lambda owner: owners.get(owner, owner)
+        other = ReservationTable()
+        other.cells = {key: rename(owner) for key, owner in self.cells.items()}
+        other.moves = {key: rename(owner) for key, owner in self.moves.items()}
+        other.by_owner = {rename(owner): list(keys) for owner, keys in self.by_owner.items()}
+        other.by_tick = {tick: list(keys) for tick, keys in self.by_tick.items()}
+        return other
+
+    def reserve(self, coord, tick, owner):
+        """Reserve a cell at a tick, returns False if someone else has it."""
+        key = (coord, tick)
+        holder = self.cells.get(key)
+        if holder is not None and holder != owner:
+            return False
+        if holder is None:
+            self.cells[key] = owner
+            self.by_owner.setdefault(owner, []).append(("cell", key))
+            self.by_tick.setdefault(tick, []).append(("cell", key))
+        return True
+
+    def reserveMove(self, origin, target, tick, owner):
+        """Record a move from origin to target that ends at tick."""
+        key = (origin, target, tick)
+        self.moves[key] = owner
+        self.by_owner.setdefault(owner, []).append(("move", key))
+        self.by_tick.setdefault(tick, []).append(("move", key))
+
+    def reservePath(self, owner, start, path, tick):
+        """
+        Reserve a path that begins at start on tick.
+        Args:
+            owner: Id of the roomba that owns the path
+            start: Coordinate where the roomba is at tick
+            path: Coordinates of the following ticks (repeated for waits)
+            tick: Current tick
+        """
+        self.reserve(start, tick, owner)
+        previous = start
+        for i, coord in enumerate(path):
+            self.reserve(coord, tick + i + 1, owner)
+            if coord != previous:
+                self.reserveMove(previous, coord, tick + i + 1, owner)
+            previous = coord
+
+    def reserveInterval(self, coord, first, last, owner):
+        """Reserve a cell for every tick between first and last (inclusive)."""
+        for tick in range(first, last + 1):
+            self.reserve(coord, tick, owner)
+
+    def isFree(self, coord, tick, owner):
+        """Whether the cell is free, or already owned by the owner, at tick."""
+        holder = self.cells.get((coord, tick))
+        return holder is None or holder == owner
+
+    def isFreeInterval(self, coord, first, last, owner):
+        """Whether the cell is free for every tick between first and last (inclusive)."""
+        return all(self.isFree(coord, tick, owner) for tick in range(first, last + 1))
+
+    def canMove(self, origin, target, tick, owner):
+        """Whether a move from origin to target ending at tick is conflict free."""
+        if not self.isFree(target, tick, owner):
+            return False
+        # Another roomba doing the opposite move would swap cells with us
+        holder = self.moves.get((target, origin, tick))
+        return holder is None or holder == owner
+
+    def release(self, owner):
+        """Remove every reservation of an owner."""
+        for kind, key in self.by_owner.pop(owner, []):
+            table = self.cells if kind == "cell" else self.moves
+            if table.get(key) == owner:
+                del table[key]
+
+    def prune(self, tick):
+        """Forget reservations of ticks before tick."""
+        for old_tick in [t for t in self.by_tick if t < tick]:
+            for kind, key in self.by_tick.pop(old_tick):
+                table = self.cells if kind == "cell" else self.moves
+                table.pop(key, None)
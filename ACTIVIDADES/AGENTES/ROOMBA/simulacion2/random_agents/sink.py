@@ -0,0 +1,259 @@
+import json
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+
+# Roomba states are stored as small integer codes
+STATES = (
+    "idle", "ready", "returning", "recharging", "waiting", "moving",
+    "cleaning", "checkObstacles", "checkTrash", "communicating",
+)
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+
+MAGIC = b"RMBACOL1"
+FOOTER = struct.Struct("<Q8s")  # offset of the group index, magic
+
+
+class ColumnarWriter:
+    """
+    Append-only columnar file written in fixed-size row groups.
+
+    Rows are buffered in preallocated NumPy columns and written as a group
+    (the raw bytes of each column, one after the other) when the buffer is
+    full, so memory stays bounded whatever the length of the run. The file
+    starts with the schema and ends with an index of the groups.
+    """
+    def __init__(self, path, schema, group_size=4096, metadata=None):
+        """
+        Creates the file and writes its header.
+        Args:
+            path: File to write
+            schema: Dictionary column name -> NumPy dtype
+            group_size: Rows per group
+            metadata: Extra JSON serializable information for the reader
+        """
+        self.path = path
+        self.schema = {name: np.dtype(dtype) for name, dtype in schema.items()}
+        self.group_size = group_size
+        self.buffer = {name: np.empty(group_size, dtype=dtype) for name, dtype in self.schema.items()}
+        self.rows = 0
+        self.groups = []  # (offset, rows) of each group written
+
+        header = json.dumps({
+            "schema": {name: dtype.str for name, dtype in self.schema.items()},
+            "metadata": metadata or {},
+        }).encode()
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.file.write(struct.pack("<I", len(header)))
+        self.file.write(header)
+
+    def append(self, row):
+        """Add one row, given as a dictionary column name -> value."""
+        for name, column in self.buffer.items():
+            column[self.rows] = row[name]
+        self.rows += 1
+        if self.rows == self.group_size:
+            self.flush()
+
+    def appendMany(self, columns):
+        """Add several rows, given as a dictionary column name -> array."""
+        count = len(next(iter(columns.values())))
+        start = 0
+        while start < count:
+            size = min(count - start, self.group_size - self.rows)
+            for name, column in self.buffer.items():
+                column[self.rows:self.rows + size] = columns[name][start:start + size]
+            self.rows += size
+            start += size
+            if self.rows == self.group_size:
+                self.flush()
+
+    def flush(self):
+        """Write the buffered rows as a group."""
+        if self.rows == 0:
+            return
+        self.groups.append((self.file.tell(), self.rows))
+        self.file.write(struct.pack("<I", self.rows))
+        for column in self.buffer.values():
+            self.file.write(column[:self.rows].tobytes())
+        self.rows = 0
+
+    def written(self):
+        """Every row added so far (the groups in the file and the buffer) as a dictionary of arrays."""
+        if not self.file.closed:
+            self.file.flush()
+        stored = ColumnarReader(self.path).read() if self.groups else None
+        return {
+            name: buffer[:self.rows].copy() if stored is None else np.concatenate([stored[name], buffer[:self.rows]])
+            for name, buffer in self.buffer.items()
+        }
+
+    def close(self):
+        """Write the last group and the index of groups."""
+        if self.file.closed:
+            return
+        self.flush()
+        index_offset = self.file.tell()
+        index = json.dumps(self.groups).encode()
+        self.file.write(struct.pack("<I", len(index)))
+        self.file.write(index)
+        self.file.write(FOOTER.pack(index_offset, MAGIC))
+        self.file.close()
+
+
+class ColumnarReader:
+    """
+    Reader of the files written by ColumnarWriter.
+
+    Only the header and the group index are read when opening. Columns are
+    read on demand, seeking directly to their bytes in every group.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            if file.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a columnar metrics file")
+            (length,) = struct.unpack("<I", file.read(4))
+            header = json.loads(file.read(length))
+            self.data_start = file.tell()
+
+            self.schema = {name: np.dtype(dtype) for name, dtype in header["schema"].items()}
+            self.metadata = header["metadata"]
+            self.groups = self.readIndex(file)
+
+    def readIndex(self, file):
+        """Read the group index, or rebuild it if the file was not closed."""
+        size = os.path.getsize(self.path)
+        if size >= self.data_start + FOOTER.size:
+            file.seek(size - FOOTER.size)
+            index_offset, magic = FOOTER.unpack(file.read(FOOTER.size))
+            if magic == MAGIC:
+                file.seek(index_offset)
+                (length,) = struct.unpack("<I", file.read(4))
+                return [tuple(group) for group in json.loads(file.read(length))]
+
+        # Unfinished file (e.g. the run crashed), walk the complete groups
+        row_size = sum(dtype.itemsize for dtype in self.schema.values())
+        groups = []
+        offset = self.data_start
+        while offset + 4 <= size:
+            file.seek(offset)
+            (rows,) = struct.unpack("<I", file.read(4))
+            if offset + 4 + rows * row_size > size:
+                break
+            groups.append((offset, rows))
+            offset += 4 + rows * row_size
+        return groups
+
+    @property
+    def columns(self):
+        """Names of the columns in the file."""
+        return list(self.schema)
+
+    def __len__(self):
+        return sum(rows for _, rows in self.groups)
+
+    def read(self, columns=None):
+        """Read the selected columns (all by default) as a dictionary of arrays."""
+        columns = self.columns if columns is None else columns
+        result = {name: np.empty(len(self), dtype=self.schema[name]) for name in columns}
+
+        with open(self.path, "rb") as file:
+            start = 0
+            for offset, rows in self.groups:
+                column_offset = offset + 4
+                for name, dtype in self.schema.items():
+                    if name in result:
+                        file.seek(column_offset)
+                        result[name][start:start + rows] = np.fromfile(file, dtype=dtype, count=rows)
+                    column_offset += rows * dtype.itemsize
+                start += rows
+        return result
+
+    def dataframe(self, columns=None):
+        """Read the selected columns as a DataFrame."""
+        return pd.DataFrame(self.read(columns))
+
+
+class MetricsSink:
+    """
+    Streams the model series and the per-roomba series of a run to disk.
+
+    Writes `model.col` with one row per collected tick and `agents.col`
+    with one row per roomba and collected tick.
+    """
+    AGENT_SCHEMA = {
+        "Time (Steps)": np.int64,
+        "unique_id": np.int64,
+        "x": np.int32,
+        "y": np.int32,
+        "battery": np.int32,
+        "steps": np.int64,
+        "trash_cleaned": np.int64,
+        "state": np.uint8,
+    }
+
+    def __init__(self, directory, model_schema, group_size=4096):
+        """
+        Creates the files of the sink.
+        Args:
+            directory: Directory where the files are written
+            model_schema: Dictionary column name -> dtype of the model series
+            group_size: Rows per group in both files
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.model = ColumnarWriter(os.path.join(directory, "model.col"), model_schema, group_size)
+        self.agents = ColumnarWriter(
+            os.path.join(directory, "agents.col"), self.AGENT_SCHEMA, group_size,
+            metadata={"states": list(STATES)}
+        )
+
+    def collectAgents(self, tick, roombas, charging=(), charged=0):
+        """
+        Write one row for every roomba.
+        Args:
+            tick: Tick of the rows
+            roombas: Roombas alive
+            charging, charged: Roombas whose battery is reported with `charged`
+                more percent (used for ticks skipped by the model)
+        """
+        for roomba in roombas:
+            x, y = roomba.cell.coordinate
+            self.agents.append({
+                "Time (Steps)": tick,
+                "unique_id": roomba.unique_id,
+                "x": x,
+                "y": y,
+                "battery": roomba.battery + (charged if roomba in charging else 0),
+                "steps": roomba.steps,
+                "trash_cleaned": roomba.trash_cleaned,
+                "state": STATE_CODES.get(roomba.state, 255),
+            })
+
+    def close(self):
+        """Finish both files."""
+        self.model.close()
+        self.agents.close()
+
+
+class MetricsReader:
+    """Lazy reader of the files written by MetricsSink."""
+    def __init__(self, directory):
+        self.model = ColumnarReader(os.path.join(directory, "model.col"))
+        self.agents = ColumnarReader(os.path.join(directory, "agents.col"))
+
+    def modelDataframe(self, columns=None):
+        """Model series, only the selected columns are read."""
+        return self.model.dataframe(columns)
+
+    def agentsDataframe(self, columns=None):
+        """Per-roomba series, states are decoded to their names."""
+        df = self.agents.dataframe(columns)
+        if "state" in df:
+            states = self.agents.metadata["states"]
+            df["state"] = [states[code] if code < len(states) else None for code in df["state"]]
+        return df
@@ -0,0 +1,182 @@
+from .agent import Roomba, StationAgent
+from .world import World
+
+# Roomba attributes that hold immutable values, copied as they are
+ROOMBA_VALUES = (
+    "state", "battery", "steps", "trash_cleaned", "distance_to_station",
+    "hasInfo", "info_timer", "hasBattery", "assigned_target", "dormant",
+    "frontier_version",
+)
+
+
+class ModelSnapshot:
+    """
+    State of a RandomModel at a tick, enough to continue the run from it.
+
+    The World is shared with the model, and so are the passability map and
+    the hierarchical graph until one of the models that use them calls
+    setPassable. The cells blocked or opened with setPassable are kept as
+    the current obstacles. Everything else is copied: the trash and visited layers, every roomba
+    alive (in scheduler order), the station queues, the reservations and
+    assignments, and the state of both random generators. A snapshot can
+    be forked any number of times, and a fork continues exactly as the
+    original model would.
+    """
+    def __init__(self, model):
+        """
+        Args:
+            model: Model to capture
+        """
+        self.world = model.world
+        self.params = {
+            "max_steps": model.max_steps,
+            "seed": model.seed,
+            "coordinated": model.coordinator is not None,
+            "cooperative": model.reservations is not None,
+            "horizon": model.horizon,
+            "skip_idle": model.skip_idle,
+            "collect_interval": model.datacollector.interval,
+            "verbose": model.verbose,
+            "empty_agents": model.empty_agents,
+            "pathfinding": model.pathfinding,
+            "heuristic": model.heuristic,
+            "cluster_size": model.cluster_size,
+            "incremental": model.incremental,
+            "search_budget": model.search_budget,
+            "search_weight": model.search_weight,
+        }
+        self.steps = model.steps
+        self.running = model.running
+        self.random_state = model.random.getstate()
+        self.rng_state = model.rng.bit_generator.state
+        self.num_agents = model.num_agents
+        self.num_trash = model.num_trash
+
+        self.obstacles = model.grid_map.obstacles()
+        self.grid_map = model.grid_map
+        self.hierarchy = model.hierarchy
+        model.shared_maps = True  # The model copies them before its next change
+        self.trash = model.trash.copy()
+        self.visited = model.visited.copy()
+        self.roombas = [self.roombaState(roomba) for roomba in model.agents_by_type[Roomba]]
+        self.positions = {
+            coord: [roomba.unique_id for roomba in roombas]
+            for coord, roombas in model.roomba_positions.items()
+        }
+        self.stations = [self.stationState(station) for station in model.stations.values()]
+
+        self.reservations = model.reservations.copy() if model.reservations is not None else None
+        self.assignments = None
+        if model.coordinator is not None:
+            self.assignments = (
+                {roomba.unique_id: target for roomba, target in model.coordinator.assignments.items()},
+                {roomba.unique_id for roomba in model.coordinator.without_targets},
+            )
+
+    def roombaState(self, roomba):
+        """Copy of the attributes of a roomba."""
+        state = {name: getattr(roomba, name) for name in ROOMBA_VALUES}
+        state.update(
+            unique_id=roomba.unique_id,
+            coordinate=roomba.cell.coordinate,
+            station=roomba.station.cell.coordinate if roomba.station is not None else None,
+            stationCells=list(roomba.stationCells),
+            visited_cells=roomba.visited_cells.copy(),
+            partner_versions=dict(roomba.partner_versions),
+            trash_known_cells=roomba.trash_known_cells.copy(),
+            frontier=roomba.frontier.copy(),
+            path_back_to_station=list(roomba.path_back_to_station),
+            assigned_path=list(roomba.assigned_path),
+            planner=roomba.planner.copy() if roomba.planner is not None else None,
+            search=roomba.search.copy() if roomba.search is not None else None,
+        )
+        return state
+
+    def stationState(self, station):
+        """Copy of the queue of a station, roombas are kept by unique_id."""
+        def uid(roomba):
+            return roomba.unique_id if roomba is not None else None
+
+        return {
+            "coordinate": station.cell.coordinate,
+            "charging": uid(station.charging),
+            "called": uid(station.called),
+            "queue": [(arrival, roomba.unique_id) for arrival, _, roomba in station.queue],
+            "sleeping": {roomba.unique_id for roomba in station.sleeping},
+        }
+
+    def forkWorld(self):
+        """World of a fork: the obstacles and the trash left at the snapshot."""
+        return World(self.obstacles.astype(self.world.obstacles.dtype), self.trash)
+
+    def restore(self, model):
+        """
+        Load the snapshot into a model built from forkWorld() without roombas.
+
+        The roombas get new unique_ids in the same order as the original
+        ones, and every reference by unique_id is renamed.
+        """
+        cells = model.grid.all_cells.cells
+        height = model.height
+
+        def cell(coord):
+            return cells[coord[0] * height + coord[1]]
+
+        model.world = self.world
+        model.num_agents = self.num_agents
+        model.num_trash = self.num_trash
+        model.metrics.num_trash = self.num_trash
+        model.visited[:] = self.visited
+
+        # Stations first, the roombas point to them
+        stations = StationAgent.create_agents(model, len(self.stations), cell=[cell(s["coordinate"]) for s in self.stations])
+        model.stations = {station.cell.coordinate: station for station in stations}
+
+        roombas = Roomba.create_agents(model, len(self.roombas), cell=[cell(r["coordinate"]) for r in self.roombas])
+        by_uid = {state["unique_id"]: roomba for state, roomba in zip(self.roombas, roombas)}
+        owners = {uid: roomba.unique_id for uid, roomba in by_uid.items()}
+
+        for state, roomba in zip(self.roombas, roombas):
+            for name in ROOMBA_VALUES:
+                setattr(roomba, name, state[name])
+            roomba.station = model.stations[state["station"]] if state["station"] is not None else None
+            roomba.stationCells = list(state["stationCells"])
+            roomba.visited_cells = state["visited_cells"].copy()
+            roomba.partner_versions = {owners[uid]: version for uid, version in state["partner_versions"].items() if uid in owners}
+            roomba.trash_known_cells = state["trash_known_cells"].copy()
+            roomba.frontier = state["frontier"].copy()
+            roomba.path_back_to_station = list(state["path_back_to_station"])
+            roomba.assigned_path = list(state["assigned_path"])
+            if state["planner"] is not None:
+                roomba.planner = state["planner"].copy()
+                roomba.planner.grid_map = model.grid_map
+            if state["search"] is not None:
+                roomba.search = state["search"].copy()
+                roomba.search.grid_map = model.grid_map
+
+        # Same order of the roombas in each cell, it decides communication partners
+        model.roomba_positions = {
+            coord: [by_uid[uid] for uid in uids] for coord, uids in self.positions.items()
+        }
+
+        for state, station in zip(self.stations, stations):
+            station.charging = by_uid.get(state["charging"])
+            station.called = by_uid.get(state["called"])
+            station.queue = [(arrival, owners[uid], by_uid[uid]) for arrival, uid in state["queue"]]
+            station.sleeping = {by_uid[uid] for uid in state["sleeping"]}
+
+        if model.reservations is not None and self.reservations is not None:
+            model.reservations = self.reservations.copy(owners)
+        if model.coordinator is not None and self.assignments is not None:
+            assignments, without_targets = self.assignments
+            model.coordinator.assignments = {by_uid[uid]: target for uid, target in assignments.items()}
+            model.coordinator.without_targets = {by_uid[uid] for uid in without_targets}
+
+        model.steps = self.steps
+        model.running = self.running
+        model.random.setstate(self.random_state)
+        model.rng.bit_generator.state = self.rng_state
+
+        # The collected rows start at the fork
+        model.datacollector.clear()
+        model.collect()
@@ -0,0 +1,111 @@
+class TrashIndex:
+    """
+    Spatial index of known trash coordinates.
+
+    Coordinates are stored in square buckets of the grid, so the nearest
+    known trash to a cell can be found looking only at the buckets around it
+    instead of every known coordinate.
+    """
+    def __init__(self, bucket_size=8):
+        """
+        Creates an empty index.
+        Args:
+            bucket_size: Side of the square buckets in cells
+        """
+        self.bucket_size = bucket_size
+        self.buckets = {}
+        self.size = 0
+
+    def copy(self):
+        """Independent copy of the index."""
+        other = TrashIndex(self.bucket_size)
+        other.buckets = {key: set(cells) for key, cells in self.buckets.items()}
+        other.size = self.size
+        return other
+
+    def bucket(self, coord):
+        """Return the bucket key of a coordinate."""
+        return (coord[0] // self.bucket_size, coord[1] // self.bucket_size)
+
+    def add(self, coord):
+        """Add a known trash coordinate."""
+        cells = self.buckets.setdefault(self.bucket(coord), set())
+        if coord not in cells:
+            cells.add(coord)
+            self.size += 1
+
+    def discard(self, coord):
+        """Remove a coordinate if it is known, e.g. when the trash was cleaned."""
+        key = self.bucket(coord)
+        cells = self.buckets.get(key)
+        if cells and coord in cells:
+            cells.remove(coord)
+            self.size -= 1
+            if not cells:
+                del self.buckets[key]
+
+    def clear(self):
+        """Forget all known trash."""
+        self.buckets.clear()
+        self.size = 0
+
+    def nearest(self, coord):
+        """
+        Find the nearest known trash using Chebyshev distance.
+
+        Buckets are visited in rings around the bucket of the coordinate,
+        stopping once no farther ring can contain a closer coordinate.
+        Between coordinates at the same distance the smallest one is chosen.
+        Returns (distance, coordinate), or (inf, None) if the index is empty.
+        """
+        best_distance = float('inf')
+        best_coord = None
+        if self.size == 0:
+            return best_distance, best_coord
+
+        x, y = coord
+        bx, by = self.bucket(coord)
+        seen = 0
+        ring = 0
+
+        while seen < self.size:
+            # Every cell in this ring is at least this far from the coordinate
+            if best_distance <= (ring - 1) * self.bucket_size:
+                break
+
+            for key in self.ringKeys(bx, by, ring):
+                for cx, cy in self.buckets.get(key, ()):
+                    seen += 1
+                    distance = max(abs(cx - x), abs(cy - y))
+                    # Ties go to the smallest coordinate, not to the order of the set,
+                    # so a copy of the index (e.g. in a fork) finds the same one
+                    if distance < best_distance or (distance == best_distance and (cx, cy) < best_coord):
+                        best_distance = distance
+                        best_coord = (cx, cy)
+            ring += 1
+
+        return best_distance, best_coord
+
+    def ringKeys(self, bx, by, ring):
+        """Return the bucket keys at exactly `ring` buckets from (bx, by)."""
+        if ring == 0:
+            return [(bx, by)]
+        keys = []
+        for dx in range(-ring, ring + 1):
+            keys.append((bx + dx, by - ring))
+            keys.append((bx + dx, by + ring))
+        for dy in range(-ring + 1, ring):
+            keys.append((bx - ring, by + dy))
+            keys.append((bx + ring, by + dy))
+        return keys
+
+    def __contains__(self, coord):
+        cells = self.buckets.get(self.bucket(coord))
+        return cells is not None and coord in cells
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for cells in self.buckets.values():
+            yield from cells
@@ -0,0 +1,116 @@
+import struct
+
+import numpy as np
+
+from .agent import Roomba
+from .sink import STATE_CODES
+
+# Message types
+KEYFRAME = 0
+DELTA = 1
+
+# Bits of the cell codes sent to the viewer
+CELL_OBSTACLE = 1
+CELL_STATION = 2
+CELL_TRASH = 4
+CELL_VISITED = 8
+
+DEAD = 255  # State code of roombas that ran out of battery
+
+KEYFRAME_HEADER = struct.Struct("<BIHHI")  # type, tick, width, height, roombas
+DELTA_HEADER = struct.Struct("<BIIIIII")  # type, tick, roombas, cleaned, visited, blocked and opened cells
+ROOMBA_RECORD = np.dtype([
+    ("slot", "<u4"), ("x", "<u2"), ("y", "<u2"), ("battery", "u1"), ("state", "u1"),
+])
+
+
+class StateEncoder:
+    """
+    Encodes the state of a RandomModel as binary messages for a viewer.
+
+    A keyframe has every cell (one byte with obstacle, station, trash and
+    visited bits) and every roomba. A delta only has the roombas that
+    changed since the previous delta, the cells cleaned, the cells visited
+    for the first time and the cells blocked or opened, taken from the
+    change sets of the model.
+    Cell indexes are x * height + y and everything is little-endian.
+    """
+    def __init__(self, model):
+        """
+        Args:
+            model: Model to encode, after its agents are placed
+        """
+        self.model = model
+        self.roombas = list(model.agents_by_type[Roomba])  # The slot of a roomba is its index
+        self.slots = {roomba: slot for slot, roomba in enumerate(self.roombas)}
+        self.static_cells = np.zeros((model.width, model.height), dtype=np.uint8)
+        self.static_cells[model.grid_map.obstacles()] |= CELL_OBSTACLE
+        for x, y in model.stations:
+            self.static_cells[x, y] |= CELL_STATION
+
+        # Changes since the last delta
+        self.changed = set()
+        self.cleaned = set()
+        self.visited = []
+        self.passability = {}
+        model.subscribe(self.addChanges)
+
+    def addChanges(self, changes):
+        """Accumulate the change set of a tick until the next delta."""
+        self.changed.update(self.slots[roomba] for roomba, _, _ in changes.moves)
+        self.changed.update(self.slots[roomba] for roomba in changes.status)
+        self.changed.update(self.slots[roomba] for roomba in changes.deaths)
+        self.cleaned.update(changes.cleaned)
+        self.visited.extend(changes.visited)
+        for (x, y), blocked in changes.passability.items():
+            if blocked:
+                self.static_cells[x, y] |= CELL_OBSTACLE
+            else:
+                self.static_cells[x, y] &= 0xFF ^ CELL_OBSTACLE
+            self.passability[(x, y)] = blocked
+
+    def roombaRecords(self, slots=None):
+        """Current record of the roomba slots (all of them by default)."""
+        roombas = self.roombas if slots is None else [self.roombas[slot] for slot in slots]
+        records = np.zeros(len(roombas), dtype=ROOMBA_RECORD)
+        records["slot"] = np.arange(len(roombas)) if slots is None else slots
+        records["state"] = DEAD
+        for index, roomba in enumerate(roombas):
+            if roomba.cell is None:  # Removed from the model
+                continue
+            records["x"][index], records["y"][index] = roomba.cell.coordinate
+            records["battery"][index] = max(0, min(255, roomba.battery))
+            records["state"][index] = STATE_CODES.get(roomba.state, 254)
+        return records
+
+    def cellIndexes(self, coordinates):
+        """Flat indexes of coordinates, x * height + y."""
+        indexes = np.array(coordinates, dtype=np.int64).reshape(-1, 2)
+        return (indexes[:, 0] * self.model.height + indexes[:, 1]).astype("<u4")
+
+    def keyframe(self):
+        """Full state of the model, for a viewer that just connected."""
+        model = self.model
+        cells = self.static_cells.copy()
+        cells[model.trash > 0] |= CELL_TRASH
+        cells[model.visited] |= CELL_VISITED
+        header = KEYFRAME_HEADER.pack(KEYFRAME, model.steps, model.width, model.height, len(self.roombas))
+        return header + cells.tobytes() + self.roombaRecords().tobytes()
+
+    def delta(self):
+        """Changes since the previous delta, call it once per model step."""
+        model = self.model
+        changed = self.roombaRecords(sorted(self.changed))
+
+        # A cell keeps its trash bit until its last trash is removed
+        cleaned = self.cellIndexes([coord for coord in self.cleaned if model.trash[coord] == 0])
+        visited = self.cellIndexes(self.visited)
+        blocked = self.cellIndexes([coord for coord, value in self.passability.items() if value])
+        opened = self.cellIndexes([coord for coord, value in self.passability.items() if not value])
+        self.changed.clear()
+        self.cleaned.clear()
+        self.visited.clear()
+        self.passability.clear()
+
+        header = DELTA_HEADER.pack(DELTA, model.steps, len(changed), len(cleaned), len(visited), len(blocked), len(opened))
+        return header + changed.tobytes() + cleaned.tobytes() + visited.tobytes() + blocked.tobytes() + opened.tobytes()
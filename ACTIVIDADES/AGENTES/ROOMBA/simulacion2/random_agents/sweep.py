@@ -0,0 +1,393 @@
+import csv
+import inspect
+import itertools
+import json
+import math
+import os
+import random
+import zlib
+from statistics import NormalDist
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.stats import t as student_t
+except ImportError:  # Normal quantiles are used instead
+    student_t = None
+
+from .model import RandomModel
+from .world import World
+
+# Final metrics written for every run
+RESULT_COLUMNS = [
+    "Steps to Clean", "Time (Steps)", "Trash Collected %", "Roombas Alive", "Battery %",
+]
+
+# RandomModel parameters that every run of a sweep sets itself
+RESERVED_PARAMETERS = ("verbose", "collect_interval", "world", "empty_agents", "maps")
+
+
+def configurations(grid):
+    """
+    Expand a parameter grid into the list of configurations.
+
+    A seed in the grid is the base seed of the runs of its configurations,
+    see runSeed. The parameters in RESERVED_PARAMETERS raise a ValueError.
+    Args:
+        grid: Dictionary parameter name -> list of values, or a list of
+            such dictionaries whose configurations are concatenated
+    """
+    if isinstance(grid, (list, tuple)):
+        return [config for subgrid in grid for config in configurations(subgrid)]
+    reserved = [name for name in RESERVED_PARAMETERS if name in grid]
+    if reserved:
+        raise ValueError(f"{', '.join(reserved)} can not be swept, the sweep sets them for every run")
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def parameterColumns(configs):
+    """Columns of the parameters in the results file, a swept seed is written as base_seed."""
+    names = sorted({name for config in configs for name in config})
+    return ["base_seed" if name == "seed" else name for name in names]
+
+
+def configKey(config):
+    """Text that identifies a configuration in the results file."""
+    return json.dumps(config, sort_keys=True)
+
+
+def runSeed(base_seed, config, replication):
+    """
+    Seed of one run, from an independent stream of the base seed.
+
+    The stream depends on the configuration and the replication, not on
+    the order in which runs are executed, so a resumed sweep gets the same
+    seeds.
+    """
+    key = zlib.crc32(configKey(config).encode())
+    sequence = np.random.SeedSequence(entropy=base_seed, spawn_key=(key, replication))
+    return int(sequence.generate_state(1)[0])
+
+
+def worldKey(config):
+    """
+    Parameters that define the static world of a configuration, or None
+    if its world depends on the seed of each run (no world_seed).
+    """
+    if config.get("world_seed") is None:
+        return None
+    defaults = {
+        name: parameter.default
+        for name, parameter in inspect.signature(RandomModel).parameters.items()
+    }
+    return tuple(
+        config.get(name, defaults[name])
+        for name in ("width", "height", "rate_obstacles", "rate_trash", "world_seed")
+    )
+
+
+def shareWorlds(configs):
+    """
+    Generate once the world of every configuration with a world_seed and
+    put it in shared memory.
+    Returns a dictionary world key -> shared World.
+    """
+    worlds = {}
+    for config in configs:
+        key = worldKey(config)
+        if key is not None and key not in worlds:
+            width, height, rate_obstacles, rate_trash, world_seed = key
+            world = World.fromRates(width, height, rate_obstacles, rate_trash, random.Random(world_seed))
+            worlds[key] = world.share()
+    return worlds
+
+
+# Worlds attached by this worker process, by shared memory name
+attached_worlds = {}
+
+
+def attachedWorld(handle):
+    """Attach to a shared world once per worker process."""
+    if handle not in attached_worlds:
+        attached_worlds[handle] = World.attach(handle)
+    return attached_worlds[handle]
+
+
+def runOnce(config, seed, world=None):
+    """
+    Run one model headless until it stops and return its final metrics.
+
+    The seed of the run replaces the base seed of the configuration, if it has one.
+    """
+    max_steps = int(config.get("max_steps", 3000))
+    params = {name: value for name, value in config.items() if name != "seed"}
+    model = RandomModel(
+        **params, seed=seed, verbose=False, collect_interval=max_steps, world=world, empty_agents=False
+    )
+    while model.running:
+        model.step()
+
+    metrics = model.metrics
+    return {
+        "Steps to Clean": model.steps if metrics.trash_left == 0 else None,
+        "Time (Steps)": model.steps,
+        "Trash Collected %": metrics.trashPercent(),
+        "Roombas Alive": metrics.roombas_alive,
+        "Battery %": metrics.batteryPercent(),
+    }
+
+
+def runTask(task):
+    """Worker entry point: (config, replication, seed, world handle) -> result row."""
+    config, replication, seed, handle = task
+    world = attachedWorld(handle) if handle is not None else None
+    row = {"config": configKey(config), "replication": replication, "seed": seed}
+    row.update(("base_seed" if name == "seed" else name, value) for name, value in config.items())
+    row.update(runOnce(config, seed, world))
+    return row
+
+
+def makeTask(config, replication, base_seed, worlds):
+    """Task of one run, with the handle of its shared world if it has one, a seed in the config replaces base_seed."""
+    world = worlds.get(worldKey(config))
+    handle = world.handle if world is not None else None
+    return (config, replication, runSeed(config.get("seed", base_seed), config, replication), handle)
+
+
+def completedRuns(path):
+    """Return the (config, replication) pairs already in a results file."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline="") as file:
+        return {(row["config"], int(row["replication"])) for row in csv.DictReader(file)}
+
+
+def resultsWriter(file, columns, new_file):
+    """CSV writer of result rows, writes the header on new files."""
+    writer = csv.DictWriter(file, fieldnames=columns, extrasaction="ignore")
+    if new_file:
+        writer.writeheader()
+    return writer
+
+
+def runTasks(pool, tasks, writer, file):
+    """Run tasks on the pool, writing each row as soon as it finishes."""
+    for future in as_completed([pool.submit(runTask, task) for task in tasks]):
+        writer.writerow(future.result())
+        file.flush()
+
+
+def sweep(grid, replications=1, base_seed=42, workers=None, out="sweep.csv"):
+    """
+    Run every configuration of a grid several times over a process pool.
+
+    Each row of the results file is written as soon as its run finishes,
+    and runs already in the file are skipped, so an interrupted sweep can
+    be resumed by calling it again with the same arguments.
+
+    Configurations with a world_seed share a fixed map: it is generated
+    once and attached read-only by the workers from shared memory.
+    Args:
+        grid: Dictionary RandomModel parameter -> list of values (or a list of them)
+        replications: Runs of each configuration
+        base_seed: Seed of the streams of the runs whose configuration has no seed
+        workers: Number of processes (default: number of CPUs)
+        out: CSV file with one row per run
+    Returns:
+        DataFrame with all the rows of the results file
+    """
+    configs = configurations(grid)
+    done = completedRuns(out)
+    pending = [
+        (config, replication)
+        for config in configs
+        for replication in range(replications)
+        if (configKey(config), replication) not in done
+    ]
+
+    parameters = parameterColumns(configs)
+    columns = ["config", "replication", "seed"] + parameters + RESULT_COLUMNS
+    new_file = not os.path.exists(out)
+    with open(out, "a", newline="") as file:
+        writer = resultsWriter(file, columns, new_file)
+        if pending:
+            worlds = shareWorlds(config for config, _ in pending)
+            try:
+                tasks = [makeTask(config, replication, base_seed, worlds) for config, replication in pending]
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    runTasks(pool, tasks, writer, file)
+            finally:
+                for world in worlds.values():
+                    world.unlink()
+
+    return pd.read_csv(out)
+
+
+# Metrics of the adaptive sweep: name -> True if larger is better
+ADAPTIVE_METRICS = {"Time (Steps)": False, "Trash Collected %": True}
+
+# Parameters of the strategy and the planner of the roombas, the rest define
+# the scenario (world, fleet, length of the run)
+STRATEGY_PARAMETERS = (
+    "coordinated", "cooperative", "horizon", "skip_idle", "pathfinding", "heuristic",
+    "cluster_size", "incremental", "search_budget", "search_weight",
+)
+
+
+def quantile(confidence, samples):
+    """Two-sided critical value of a mean estimated from samples runs."""
+    level = 1 - (1 - confidence) / 2
+    if student_t is not None and samples > 1:
+        return float(student_t.ppf(level, samples - 1))
+    return NormalDist().inv_cdf(level)
+
+
+def intervals(rows, metrics, confidence):
+    """
+    Confidence interval of the mean of every metric.
+    Returns a dictionary metric -> (mean, half width, samples).
+    """
+    result = {}
+    for name in metrics:
+        values = rows[name].to_numpy(dtype=float)
+        samples = len(values)
+        mean = float(values.mean())
+        if samples < 2:
+            result[name] = (mean, math.inf, samples)
+            continue
+        error = float(values.std(ddof=1)) / math.sqrt(samples)
+        result[name] = (mean, quantile(confidence, samples) * error, samples)
+    return result
+
+
+def precise(interval, width, relative_width):
+    """Whether a confidence interval is narrow enough to stop replicating."""
+    mean, half, _ = interval
+    return 2 * half <= max(width, relative_width * abs(mean))
+
+
+def comparable(config, other):
+    """Whether two configurations share their scenario and only differ in strategy parameters."""
+    def scenario(config):
+        return {name: value for name, value in config.items() if name not in STRATEGY_PARAMETERS}
+
+    return scenario(config) == scenario(other)
+
+
+def dominates(better, worse, metrics):
+    """
+    Whether a configuration is clearly better than another.
+
+    It has to be at least as good in every metric and strictly better in
+    one, comparing the bounds of the confidence intervals (so overlapping
+    intervals never prune anything).
+    """
+    strictly = False
+    for name, larger in metrics.items():
+        mean_b, half_b, _ = better[name]
+        mean_w, half_w, _ = worse[name]
+        if larger:
+            gap = (mean_b - half_b) - (mean_w + half_w)
+        else:
+            gap = (mean_w - half_w) - (mean_b + half_b)
+        if gap < 0:
+            return False
+        strictly = strictly or gap > 0
+    return strictly
+
+
+def adaptiveSweep(grid, metrics=None, width=0.0, relative_width=0.05, confidence=0.95,
+                  min_replications=3, max_replications=50, wave=None, prune=True,
+                  base_seed=42, workers=None, out="sweep.csv"):
+    """
+    Sweep that decides how many replications each configuration needs.
+
+    Replications run in waves. After every wave each active configuration
+    stops if the confidence interval of every metric is narrow enough, or
+    if another configuration of the same scenario clearly dominates it
+    (configurations of different worlds or fleets are not compared); the
+    rest get one more wave. Replication numbers and seeds are the same as in sweep(), so the
+    results file can be shared and resumed by both.
+    Args:
+        grid: Dictionary RandomModel parameter -> list of values (or a list of them)
+        metrics: Dictionary result column -> True if larger is better
+        width: Absolute width of the intervals that is precise enough
+        relative_width: Width relative to the mean that is precise enough
+        confidence: Confidence level of the intervals
+        min_replications: Runs of every configuration before stopping or pruning
+        max_replications: Runs after which a configuration always stops
+        wave: Runs added to each active configuration per wave (default: min_replications)
+        prune: Whether dominated configurations stop early
+        base_seed: Seed of the streams of the runs whose configuration has no seed
+        workers: Number of processes (default: number of CPUs)
+        out: CSV file with one row per run
+    Returns:
+        DataFrame with one row per configuration: its parameters, the mean
+        and half width of every metric, the runs used and why it stopped
+    """
+    metrics = ADAPTIVE_METRICS if metrics is None else metrics
+    wave = wave or min_replications
+    configs = {configKey(config): config for config in configurations(grid)}
+    parameters = parameterColumns(configs.values())
+    columns = ["config", "replication", "seed"] + parameters + RESULT_COLUMNS
+
+    target = {key: min_replications for key in configs}
+    status = {}  # config key -> reason it stopped
+    stats = {}
+
+    new_file = not os.path.exists(out)
+    worlds = shareWorlds(configs.values())
+    try:
+        with open(out, "a", newline="") as file, ProcessPoolExecutor(max_workers=workers) as pool:
+            writer = resultsWriter(file, columns, new_file)
+            while True:
+                active = [key for key in configs if key not in status]
+                if not active:
+                    break
+
+                done = completedRuns(out)
+                tasks = [
+                    makeTask(configs[key], replication, base_seed, worlds)
+                    for key in active
+                    for replication in range(target[key])
+                    if (key, replication) not in done
+                ]
+                runTasks(pool, tasks, writer, file)
+                file.flush()
+
+                # Only the replications of this sweep count, not extra ones in the file
+                results = pd.read_csv(out)
+                results = results[results["replication"] < results["config"].map(target).fillna(0)]
+                groups = dict(tuple(results.groupby("config")))
+                for key in configs:
+                    stats[key] = intervals(groups[key], metrics, confidence)
+
+                for key in active:
+                    if all(precise(stats[key][name], width, relative_width) for name in metrics):
+                        status[key] = "precise"
+                    elif prune and any(dominates(stats[other], stats[key], metrics)
+                                       for other in configs
+                                       if other != key and comparable(configs[other], configs[key])):
+                        status[key] = "dominated"
+                    elif target[key] >= max_replications:
+                        status[key] = "max replications"
+                    else:
+                        target[key] = min(target[key] + wave, max_replications)
+    finally:
+        for world in worlds.values():
+            world.unlink()
+
+    summary = []
+    for key, config in configs.items():
+        row = dict(config)
+        for name in metrics:
+            mean, half, samples = stats[key][name]
+            row[name] = mean
+            row[f"{name} ±"] = half
+        row["Replications"] = target[key]
+        row["Stopped"] = status[key]
+        summary.append(row)
+    return pd.DataFrame(summary)
@@ -0,0 +1,147 @@
+import sys
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class World:
+    """
+    Static part of a map: the obstacles (border included) and the trash layout.
+
+    The world is generated once and stored as (width, height) uint8 layers,
+    so it can be reused by every run of a sweep that only changes the
+    roombas or their strategy. Random worlds leave the roombas and their
+    stations to the model; worlds loaded from a map file can also fix the
+    stations and the roomba starts.
+
+    A world can be moved to a shared memory block with share(), and other
+    processes attach to it read-only with attach(handle) without copying.
+    """
+    LAYERS = ("obstacles", "trash", "stations", "starts")
+
+    def __init__(self, obstacles, trash, stations=None, starts=None, shared=None):
+        """
+        Creates a world from its layers.
+        Args:
+            obstacles: (width, height) array, 1 where there is an obstacle
+            trash: (width, height) array with the number of trash objects of each cell
+            stations: (width, height) array, 1 where there is a station without a roomba
+            starts: (width, height) array, 1 where a roomba starts (on its own station)
+            shared: SharedMemory block that holds the layers, if any
+        """
+        self.obstacles = obstacles
+        self.trash = trash
+        self.stations = np.zeros_like(obstacles) if stations is None else stations
+        self.starts = np.zeros_like(obstacles) if starts is None else starts
+        self.shared = shared
+
+    @property
+    def shape(self):
+        """Size (width, height) of the world."""
+        return self.obstacles.shape
+
+    @property
+    def num_trash(self):
+        """Number of trash objects in the world."""
+        return int(self.trash.sum())
+
+    @classmethod
+    def generate(cls, width, height, num_obstacles, num_trash, random):
+        """
+        Generate a world with random obstacles and trash.
+
+        Obstacles and trash are sampled together without replacement from
+        the cells inside the border, so they never share a cell and their
+        counts are exact (capped at the free cells).
+        Args:
+            width, height: The size of the grid
+            num_obstacles: Obstacles placed inside the border
+            num_trash: Trash objects placed in free cells
+            random: Random number generator that seeds the sampling
+        """
+        obstacles = np.zeros((width, height), dtype=np.uint8)
+        obstacles[[0, -1], :] = 1
+        obstacles[:, [0, -1]] = 1
+        trash = np.zeros((width, height), dtype=np.uint8)
+
+        rng = np.random.default_rng(random.getrandbits(128))
+        free = np.flatnonzero(obstacles.ravel() == 0)
+        num_obstacles = min(num_obstacles, free.size)
+        num_trash = min(num_trash, free.size - num_obstacles)
+        chosen = free[rng.choice(free.size, num_obstacles + num_trash, replace=False)]
+        obstacles.ravel()[chosen[:num_obstacles]] = 1
+        trash.ravel()[chosen[num_obstacles:]] = 1
+
+        return cls(obstacles, trash)
+
+    def sampleFree(self, count, random):
+        """
+        Sample distinct cells without obstacles, trash or stations.
+        Args:
+            count: Number of cells
+            random: Random number generator that seeds the sampling
+        Returns an array with the flat index (x * height + y) of each cell.
+        """
+        free = np.flatnonzero((self.obstacles == 0) & (self.trash == 0) & (self.stations == 0) & (self.starts == 0))
+        if count > free.size:
+            raise ValueError(f"{count} cells requested but only {free.size} are free")
+        rng = np.random.default_rng(random.getrandbits(128))
+        return free[rng.choice(free.size, count, replace=False)]
+
+    @classmethod
+    def fromRates(cls, width, height, rate_obstacles, rate_trash, random):
+        """Generate a world with the obstacle and trash rates of RandomModel."""
+        num_obstacles = int(rate_obstacles * (width - 2) * (height - 2))
+        num_trash = int(rate_trash * (width - 2) * (height - 2))
+        return cls.generate(width, height, num_obstacles, num_trash, random)
+
+    def share(self):
+        """
+        Copy the layers to a new shared memory block.
+        Returns the shared world, its handle is passed to attach() in other
+        processes. The owner has to call unlink() when it is not needed.
+        """
+        size = self.obstacles.size
+        block = shared_memory.SharedMemory(create=True, size=len(self.LAYERS) * size)
+        layers = np.ndarray((len(self.LAYERS), *self.shape), dtype=np.uint8, buffer=block.buf)
+        for layer, name in zip(layers, self.LAYERS):
+            layer[:] = getattr(self, name)
+        return World(*layers, shared=block)
+
+    @property
+    def handle(self):
+        """Picklable reference to the shared layers."""
+        if self.shared is None:
+            raise ValueError("the world is not in shared memory, call share() first")
+        return (self.shared.name, *self.shape)
+
+    @classmethod
+    def attach(cls, handle):
+        """Attach read-only to a world shared by another process."""
+        name, width, height = handle
+        # The owner unlinks the block, not the processes that attach to it.
+        # Before 3.13 attaching registers the block again, which is harmless:
+        # workers started with fork, spawn or forkserver all report to the
+        # resource tracker of the owner, and unlink() unregisters it there.
+        if sys.version_info >= (3, 13):
+            block = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            block = shared_memory.SharedMemory(name=name)
+        layers = np.ndarray((len(cls.LAYERS), width, height), dtype=np.uint8, buffer=block.buf)
+        layers.flags.writeable = False
+        return cls(*layers, shared=block)
+
+    def close(self):
+        """Detach from the shared memory block."""
+        if self.shared is not None:
+            for name in self.LAYERS:
+                setattr(self, name, np.array(getattr(self, name)))
+            self.shared.close()
+            self.shared = None
+
+    def unlink(self):
+        """Detach and free the shared memory block (owner only)."""
+        if self.shared is not None:
+            block = self.shared
+            self.close()
+            block.unlink()
@@ -0,0 +1,66 @@
+from matplotlib.colors import to_rgba
+
+from mesa.visualization import SpaceRenderer
+
+from random_agents.agent import Roomba
+from random_agents.layers import MapLayers
+
+
+class LayeredRenderer(SpaceRenderer):
+    """
+    SpaceRenderer that draws the Roomba world as cached image layers.
+
+    The map is the image of MapLayers, which rasterizes the static cells
+    once and repaints only the cells in the change sets of the model. The
+    whole map is shown with a single imshow.
+    Only the roombas go through the agent portrayal, so the Python work of
+    a frame depends on the number of roombas and not on the map area.
+    Other backends fall back to the default SpaceRenderer.
+    """
+    COLORS = {
+        "empty": "white",
+        "visited": "lightgray",
+        "obstacle": "#8C8888",
+        "station": "#FFC107",
+        "trash": "#FF0000",
+    }
+
+    def __init__(self, model, backend="matplotlib"):
+        super().__init__(model, backend=backend)
+        self.model = model
+        self.layers = MapLayers(model, {name: to_rgba(color) for name, color in self.COLORS.items()})
+
+    def draw_agents(self, agent_portrayal, **kwargs):
+        """Draw the map layers and the roombas."""
+        if self.backend != "matplotlib":
+            return super().draw_agents(agent_portrayal, **kwargs)
+
+        self.agent_portrayal = agent_portrayal
+        self.agent_kwargs = kwargs
+
+        model = self.model
+        ax = self.canvas
+        artists = [ax.imshow(
+            self.layers.mapImage(), origin="lower", interpolation="nearest", zorder=0,
+            extent=(-0.5, model.width - 0.5, -0.5, model.height - 0.5),
+        )]
+
+        # Roombas grouped by marker, one scatter per group
+        groups = {}
+        for roomba in model.agents_by_type[Roomba]:
+            portrayal = agent_portrayal(roomba)
+            if portrayal is None:
+                continue
+            x, y = roomba.cell.coordinate
+            group = groups.setdefault(portrayal.marker, ([], [], [], []))
+            group[0].append(x)
+            group[1].append(y)
+            group[2].append(portrayal.color)
+            group[3].append(portrayal.size)
+        for marker, (xs, ys, colors, sizes) in groups.items():
+            artists.append(ax.scatter(xs, ys, c=colors, s=sizes, marker=marker, zorder=2, **kwargs))
+
+        ax.set_xlim(-0.5, model.width - 0.5)
+        ax.set_ylim(-0.5, model.height - 0.5)
+        self.agent_mesh = artists
+        return self.agent_mesh
@@ -0,0 +1,74 @@
+import argparse
+import asyncio
+
+import websockets
+
+from random_agents.model import RandomModel
+from random_agents.stream import StateEncoder
+
+# Viewers connected, each one gets every delta
+clients = set()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stream a Roomba simulation to the WebGL viewer")
+    parser.add_argument("--num-agents", type=int, default=2)
+    parser.add_argument("--rate-obstacles", type=float, default=0.1)
+    parser.add_argument("--rate-trash", type=float, default=0.2)
+    parser.add_argument("--width", type=int, default=28)
+    parser.add_argument("--height", type=int, default=28)
+    parser.add_argument("--map-file", default=None, help="ASCII, PGM or PNG map (replaces the random world)")
+    parser.add_argument("--max-steps", type=int, default=3000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--coordinated", action="store_true")
+    parser.add_argument("--cooperative", action="store_true")
+    parser.add_argument("--tps", type=float, default=10, help="Ticks per second")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    return parser.parse_args()
+
+async def handler(websocket, encoder):
+    """Send the full state to a new viewer, then it receives the deltas."""
+    await websocket.send(encoder.keyframe())
+    clients.add(websocket)
+    try:
+        await websocket.wait_closed()
+    finally:
+        clients.discard(websocket)
+
+async def simulate(model, encoder, tps):
+    """Step the model at a fixed rate and broadcast the delta of every step."""
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    while model.running:
+        model.step()
+        websockets.broadcast(clients, encoder.delta())
+
+        next_tick += 1 / tps
+        await asyncio.sleep(max(0, next_tick - loop.time()))
+
+async def main():
+    args = parse_args()
+    model = RandomModel(
+        num_agents=args.num_agents,
+        rate_obstacles=args.rate_obstacles,
+        rate_trash=args.rate_trash,
+        max_steps=args.max_steps,
+        width=args.width,
+        height=args.height,
+        seed=args.seed,
+        coordinated=args.coordinated,
+        cooperative=args.cooperative,
+        map_file=args.map_file,
+        empty_agents=False,
+        verbose=False,
+    )
+    encoder = StateEncoder(model)
+
+    async with websockets.serve(lambda websocket: handler(websocket, encoder), args.host, args.port):
+        print(f"Streaming on ws://{args.host}:{args.port}")
+        await simulate(model, encoder, args.tps)
+        print(f"Simulation finished at step {model.steps}")
+        await asyncio.Future()  # Keep serving the final state
+
+if __name__ == "__main__":
+    asyncio.run(main())
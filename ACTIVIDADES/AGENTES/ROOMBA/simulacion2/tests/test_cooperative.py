@@ -0,0 +1,32 @@
+import pytest
+
+from random_agents.agent import Roomba
+
+from conftest import run
+
+
+def chebyshev(a, b):
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+
+@pytest.mark.parametrize("num_agents, seed", [(8, 1), (8, 2), (16, 3)])
+def test_no_roomba_runs_out_of_battery(make_model, num_agents, seed):
+    # Seeds where the return paths used to be longer than the battery
+    model = run(make_model(num_agents=num_agents, width=40, height=40, rate_obstacles=0.2, seed=seed, cooperative=True))
+    assert len(model.agents_by_type[Roomba]) == num_agents
+
+
+def test_waits_in_place_when_no_station_can_be_reached(make_model):
+    model = make_model(num_agents=1, width=30, height=30, cooperative=True)
+    roomba = model.agents_by_type[Roomba][0]
+    while min(chebyshev(roomba.cell.coordinate, station) for station in roomba.stationCells) < 8:
+        run(model, ticks=1)
+    start = roomba.cell.coordinate
+    roomba.battery = 8
+    roomba.state = "returning"
+    roomba.calculateCooperativeReturnPath()
+    assert roomba.path_back_to_station and set(roomba.path_back_to_station) == {start}
+
+    # Waiting does not use battery
+    run(model, ticks=2)
+    assert roomba.cell.coordinate == start and roomba.battery == 8
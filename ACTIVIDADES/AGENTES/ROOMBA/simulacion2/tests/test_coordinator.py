@@ -0,0 +1,50 @@
+from random_agents.agent import Roomba
+
+from conftest import run
+
+
+def assigned(model, length=3):
+    """Step a coordinated model until a roomba has an assigned path of some length."""
+    while model.running:
+        for roomba in model.agents_by_type[Roomba]:
+            if len(roomba.assigned_path) >= length:
+                return roomba
+        model.step()
+    raise AssertionError("no roomba got a long enough assignment")
+
+
+def chebyshev(a, b):
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+
+def test_following_the_path_keeps_the_assignment(make_model):
+    model = make_model(num_agents=4, coordinated=True)
+    roomba = assigned(model)
+    target = roomba.assigned_target
+    while roomba.assigned_path:
+        roomba.move(model.grid[roomba.assigned_path[0]])
+        if roomba.assigned_path:
+            assert model.coordinator.assignments[roomba] == target
+
+    # Reaching the target ends the assignment
+    assert roomba.cell.coordinate == target
+    assert roomba.assigned_target is None and roomba not in model.coordinator.assignments
+
+
+def test_leaving_the_path_ends_the_assignment(make_model):
+    model = make_model(num_agents=4, coordinated=True)
+    roomba = assigned(model)
+    following = roomba.assigned_path[0]
+    away = [
+        cell for cell in roomba.cell.neighborhood
+        if model.grid_map.isFree(*cell.coordinate) and chebyshev(cell.coordinate, following) > 1
+    ]
+    assert away
+    roomba.move(away[0])
+    assert roomba.assigned_path == [] and roomba.assigned_target is None
+    assert roomba not in model.coordinator.assignments
+
+    # It can bid again in the next round
+    run(model, ticks=1)
+    assert roomba in model.coordinator.assignments or roomba in model.coordinator.without_targets \
+        or not model.coordinator.available(roomba)
@@ -0,0 +1,89 @@
+import os
+
+from random_agents import spatial
+from random_agents.agent import Roomba
+from random_agents.spatial import TrashIndex
+
+from conftest import run
+
+
+def unvisited(roomba):
+    """Every unvisited cell that the roomba can reach, scanning the whole map."""
+    model = roomba.model
+    start = roomba.cell.coordinate
+    return {
+        (x, y)
+        for x in range(model.width)
+        for y in range(model.height)
+        if (x, y) not in roomba.visited_cells and model.grid_map.connected(start, (x, y))
+    }
+
+
+def distance(a, b):
+    return max(abs(a[0] - b[0]), abs(a[1] - b[1]))
+
+
+def checkFrontier(model):
+    """The frontier finds a nearest reachable unvisited cell, or None if there is none."""
+    for roomba in model.agents_by_type[Roomba]:
+        left = unvisited(roomba)
+        target = roomba.nearestUnvisited()
+        if not left:
+            assert target is None
+            continue
+        assert target in left
+        start = roomba.cell.coordinate
+        assert distance(start, target) == min(distance(start, cell) for cell in left)
+
+
+def test_nearest_ties_do_not_depend_on_the_order():
+    cells = [(4, 0), (0, 4), (4, 4), (0, 0), (2, 6)]
+    index = TrashIndex()
+    for cell in cells:
+        index.add(cell)
+    reversed_index = TrashIndex()
+    for cell in [(1, 1), *reversed(cells)]:
+        reversed_index.add(cell)
+    reversed_index.discard((1, 1))
+    assert index.nearest((2, 2)) == reversed_index.nearest((2, 2)) == reversed_index.copy().nearest((2, 2)) == (2, (0, 0))
+
+
+def test_single_roomba_simulation_has_the_same_index():
+    copy = os.path.join(os.path.dirname(spatial.__file__), "..", "..", "simulacion1", "random_agents", "spatial.py")
+    with open(spatial.__file__) as file:
+        original = file.read()
+    with open(copy) as file:
+        assert file.read().endswith(original)
+
+
+def test_frontier_matches_a_full_scan(make_model):
+    model = make_model(num_agents=3, width=16, height=16, search_budget=32)
+    for _ in range(120):
+        if not model.running:
+            break
+        run(model, ticks=1)
+        checkFrontier(model)
+
+
+def test_frontier_follows_the_map_changes(make_model):
+    model = make_model(num_agents=1, width=12, height=12)
+    roomba = model.agents_by_type[Roomba][0]
+    x, y = roomba.cell.coordinate
+    far = (11 if x < 6 else 0, 11 if y < 6 else 0)
+
+    # Every free cell is visited but one, far from the roomba
+    for cx in range(model.width):
+        for cy in range(model.height):
+            if (cx, cy) != far:
+                roomba.visited_cells.add((cx, cy))
+    model.setPassable([far], True)
+    assert roomba.nearestUnvisited() == far
+
+    # Walled in it can not be reached, and once opened again it can
+    around = [(far[0] + dx, far[1] + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if (dx, dy) != (0, 0)]
+    around = [cell for cell in around if 0 <= cell[0] < model.width and 0 <= cell[1] < model.height]
+    model.setPassable(around, False)
+    assert roomba.nearestUnvisited() is None
+    model.setPassable(around, True)
+    assert roomba.nearestUnvisited() == far
+    checkFrontier(model)
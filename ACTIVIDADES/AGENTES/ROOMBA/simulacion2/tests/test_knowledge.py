@@ -0,0 +1,51 @@
+from random_agents.agent import Roomba
+from random_agents.knowledge import KnowledgeMap
+
+from conftest import run
+
+
+def test_add_and_contains():
+    known = KnowledgeMap(5, 4, [(1, 2)])
+    known.add((1, 2))
+    known.add((4, 3))
+    assert (1, 2) in known and (4, 3) in known and (0, 0) not in known
+    assert len(known) == known.version == 2
+    assert list(known) == [(1, 2), (4, 3)]
+
+
+def test_merge_only_adds_new_cells():
+    mine = KnowledgeMap(6, 6, [(0, 0), (1, 1)])
+    other = KnowledgeMap(6, 6, [(1, 1), (2, 2), (5, 5)])
+    assert mine.merge(other.deltaSince(0)) == 2
+    assert set(mine) == {(0, 0), (1, 1), (2, 2), (5, 5)}
+    assert mine.merge(other.deltaSince(other.version)) == 0
+
+    # A delta only has what was learned after the version received
+    version = other.version
+    other.add((3, 4))
+    assert mine.merge(other.deltaSince(version)) == 1
+    assert (3, 4) in mine
+
+
+def test_copy_is_independent():
+    known = KnowledgeMap(4, 4, [(1, 1)])
+    copy = known.copy()
+    copy.add((2, 2))
+    copy.merge([known.index((3, 3))])
+    assert (2, 2) not in known and (3, 3) not in known
+    assert len(known) == 1 and len(copy) == 3
+
+
+def test_auction_merges_the_fleet_incrementally(make_model):
+    model = run(make_model(num_agents=4, coordinated=True), ticks=40)
+    roombas = list(model.agents_by_type[Roomba])
+    expected = set().union(*(set(roomba.visited_cells) for roomba in roombas))
+    visited = model.coordinator.fleetVisited(roombas)
+    assert set(visited) == expected
+    assert all(model.coordinator.versions[roomba] == roomba.visited_cells.version for roomba in roombas)
+
+    # A dead roomba's cells leave the fleet map
+    gone = roombas.pop()
+    visited = model.coordinator.fleetVisited(roombas)
+    assert set(visited) == set().union(*(set(roomba.visited_cells) for roomba in roombas))
+    assert gone not in model.coordinator.versions
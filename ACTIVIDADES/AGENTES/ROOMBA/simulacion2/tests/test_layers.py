@@ -0,0 +1,49 @@
+import random
+
+import numpy as np
+
+from conftest import run
+from random_agents.layers import MapLayers
+
+COLORS = {
+    "empty": (1.0, 1.0, 1.0, 1.0),
+    "visited": (0.8, 0.9, 1.0, 1.0),
+    "obstacle": (0.2, 0.2, 0.2, 1.0),
+    "station": (0.0, 0.6, 0.0, 1.0),
+    "trash": (0.6, 0.4, 0.2, 1.0),
+}
+
+
+def toggleCell(model, rng):
+    """Block a free cell without a station or roomba, or open a blocked one."""
+    cells = [(x, y) for x in range(model.width) for y in range(model.height)]
+    rng.shuffle(cells)
+    for coord in cells:
+        if not model.grid_map.isFree(*coord):
+            model.setPassable([coord], True)
+            return
+        if coord not in model.stations and not model.roomba_positions.get(coord):
+            model.setPassable([coord], False)
+            return
+
+
+def test_incremental_layers_match_a_full_redraw(make_model):
+    model = make_model(num_agents=3, width=16, height=16, rate_trash=0.4, max_steps=300)
+    layers = MapLayers(model, COLORS)
+    layers.mapImage()
+    rng = random.Random(5)
+    cleaned = blocked = 0
+    for tick in range(150):
+        if tick % 10 == 5:
+            toggleCell(model, rng)
+            blocked += 1
+        before = int(model.trash.sum())
+        run(model, ticks=1)
+        cleaned += before > int(model.trash.sum())
+        redraw = MapLayers(model, COLORS)
+        model.changes.unsubscribe(redraw.applyChanges)
+        expected = redraw.mapImage()
+        assert np.array_equal(layers.mapImage(), expected), f"tick {tick}"
+        if not model.running:
+            break
+    assert cleaned and blocked
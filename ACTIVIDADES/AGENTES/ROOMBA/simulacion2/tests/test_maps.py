@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pytest
+
+from random_agents.maps import (
+    FREE, OBSTACLE, START, STATION, TRASH, CACHE_SUFFIX, loadWorld, parseAscii, parseMap, readPgm,
+)
+
+# First line at the top: the cell of "R" is (0, 0), the one of "S" is (3, 2)
+ROWS = ["#..S", ".T#.", "R..T"]
+EXPECTED = np.array([
+    [START, FREE, OBSTACLE],
+    [FREE, TRASH, FREE],
+    [FREE, OBSTACLE, FREE],
+    [TRASH, FREE, STATION],
+], dtype=np.uint8)
+
+# Gray level of each code, as drawn in an image
+GRAYS = {FREE: 255, OBSTACLE: 0, TRASH: 192, STATION: 64, START: 128}
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def image(codes_per_row, gray=GRAYS):
+    """Pixels of the rows of a map, first row at the top."""
+    return np.array([[gray[code] for code in row] for row in codes_per_row], dtype=np.uint8)
+
+
+@pytest.mark.parametrize("ending, last", [(b"\n", b"\n"), (b"\r\n", b"\r\n"), (b"\n", b""), (b"\r\n", b"")])
+def test_ascii_line_endings(tmp_path, ending, last):
+    data = ending.join(row.encode() for row in ROWS) + last
+    codes = parseAscii(write(tmp_path, "map.txt", data))
+    assert codes.shape == (4, 3)
+    assert np.array_equal(codes, EXPECTED)
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"", "empty"),
+    (b"#..S\n.T#\nR..T\n", "same length"),
+    (b"#..S\n.T#..\nR..T\n", "same length"),
+    (b"#..S\r\n.T#.\nR..T\r\n", "same length"),
+    (b"#..S\n.T#.\nR.xT\n", r"unknown character 'x' .* line 3"),
+])
+def test_invalid_ascii(tmp_path, data, message):
+    with pytest.raises(ValueError, match=message):
+        parseAscii(write(tmp_path, "map.txt", data))
+
+
+def test_binary_pgm(tmp_path):
+    rows = EXPECTED.T[::-1]
+    pixels = image(rows)
+    header = f"P5\n# a comment\n{pixels.shape[1]} {pixels.shape[0]}\n255\n".encode()
+    path = write(tmp_path, "map.pgm", header + pixels.tobytes())
+    assert np.array_equal(readPgm(path), pixels)
+    assert np.array_equal(parseMap(path), EXPECTED)
+
+
+def test_plain_pgm_with_another_maximum(tmp_path):
+    # Levels out of 15, and slightly off the exact gray: the nearest level wins
+    rows = EXPECTED.T[::-1]
+    gray = {FREE: 15, OBSTACLE: 1, TRASH: 11, STATION: 4, START: 8}
+    pixels = image(rows, gray)
+    body = "\n".join(" ".join(str(value) for value in row) for row in pixels)
+    path = write(tmp_path, "map.pgm", f"P2 {pixels.shape[1]} {pixels.shape[0]} 15\n{body}\n".encode())
+    assert np.array_equal(parseMap(path), EXPECTED)
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"P6\n2 2\n255\n", "not a PGM"),
+    (b"P5\n2 2\n", "incomplete"),
+])
+def test_invalid_pgm(tmp_path, data, message):
+    with pytest.raises(ValueError, match=message):
+        readPgm(write(tmp_path, "map.pgm", data))
+
+
+def test_png(tmp_path):
+    pillow = pytest.importorskip("PIL.Image")
+    path = str(tmp_path / "map.png")
+    pillow.fromarray(image(EXPECTED.T[::-1])).save(path)
+    assert np.array_equal(parseMap(path), EXPECTED)
+
+
+def test_world_is_cached(tmp_path):
+    path = write(tmp_path, "map.txt", "\n".join(ROWS).encode())
+    world = loadWorld(path)
+    assert os.path.exists(path + CACHE_SUFFIX)
+    assert np.array_equal(world.obstacles, EXPECTED == OBSTACLE)
+    assert np.array_equal(world.trash, EXPECTED == TRASH)
+    assert np.array_equal(world.stations, EXPECTED == STATION)
+    assert np.array_equal(world.starts, EXPECTED == START)
+
+    # The cache is read while it is newer than the map, and rebuilt after the map changes
+    assert np.array_equal(loadWorld(path).obstacles, world.obstacles)
+    with open(path, "w") as file:
+        file.write("\n".join(row.replace("#", ".") for row in ROWS))
+    os.utime(path, (os.path.getmtime(path + CACHE_SUFFIX) + 10,) * 2)
+    assert not loadWorld(path).obstacles.any()
+
+
+def test_model_from_a_map(make_model, tmp_path):
+    path = write(tmp_path, "map.txt", "\n".join(ROWS).encode())
+    model = make_model(map_file=path, num_agents=1)
+    assert (model.width, model.height) == (4, 3)
+    assert not model.grid_map.isFree(0, 2) and not model.grid_map.isFree(2, 1)
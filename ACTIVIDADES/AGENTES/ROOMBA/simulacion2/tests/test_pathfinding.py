@@ -0,0 +1,192 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+from random_agents.pathfinding import DIRECTIONS, AnytimeSearch, DStarLite, GridMap, HierarchicalMap, chebyshev, gridAStar, jumpPointSearch
+
+
+def randomMap(seed, width=23, height=17, density=0.3):
+    """
+    GridMap with random obstacles, not square so x and y can not be swapped.
+
+    A wall splits the map in two, closed for even seeds (half the queries
+    have no path) and with a door for odd seeds (long detours).
+    """
+    rng = np.random.default_rng(seed)
+    obstacles = rng.random((width, height)) < density
+    obstacles[width // 2, :] = True
+    if seed % 2:
+        obstacles[width // 2, rng.integers(height)] = False
+    return GridMap(width, height, obstacles)
+
+
+def distances(grid_map, start):
+    """Oracle: BFS distance of every reachable cell from start, with the 8 moves."""
+    found = {start: 0}
+    queue = deque([start])
+    while queue:
+        x, y = queue.popleft()
+        for dx, dy in DIRECTIONS:
+            neighbor = (x + dx, y + dy)
+            if neighbor not in found and grid_map.isFree(*neighbor):
+                found[neighbor] = found[(x, y)] + 1
+                queue.append(neighbor)
+    return found
+
+
+def queries(grid_map, seed, count=40):
+    """Random pairs of free cells, with the BFS distances from the start."""
+    rng = np.random.default_rng(seed)
+    free = [(x, y) for x in range(grid_map.width) for y in range(grid_map.height) if grid_map.isFree(x, y)]
+    for _ in range(count):
+        start, goal = (free[i] for i in rng.choice(len(free), 2, replace=False))
+        yield start, goal, distances(grid_map, start)
+
+
+def checkPath(grid_map, start, goal, path):
+    """The path moves one free cell at a time from start to goal."""
+    previous = start
+    for cell in path:
+        assert grid_map.isFree(*cell)
+        assert chebyshev(previous, cell) == 1
+        previous = cell
+    assert previous == goal
+
+
+@pytest.mark.parametrize("search", [gridAStar, jumpPointSearch])
+@pytest.mark.parametrize("seed", range(4))
+def test_shortest_paths_match_bfs(search, seed):
+    grid_map = randomMap(seed)
+    for start, goal, oracle in queries(grid_map, seed):
+        path, _ = search(grid_map, start, goal)
+        if goal not in oracle:
+            assert path == []
+            continue
+        checkPath(grid_map, start, goal, path)
+        assert len(path) == oracle[goal]
+
+
+def test_bounded_search_stays_inside():
+    grid_map = GridMap(12, 12, np.zeros((12, 12)))
+    grid_map.setBlocked(2, 0, True)
+    path, _ = gridAStar(grid_map, (0, 0), (4, 0), bounds=(0, 0, 6, 1))
+    assert path == []  # The only way in the row is blocked
+    path, _ = gridAStar(grid_map, (0, 0), (4, 0), bounds=(0, 0, 6, 2))
+    checkPath(grid_map, (0, 0), (4, 0), path)
+    assert all(x < 6 and y < 2 for x, y in path)
+
+
+def checkHierarchical(hierarchy, seed):
+    """Hierarchical paths exist exactly when BFS finds one, and their length is known before refining."""
+    grid_map = hierarchy.grid_map
+    for start, goal, oracle in queries(grid_map, seed):
+        path, _ = hierarchy.findPath(start, goal)
+        if goal not in oracle:
+            assert len(path) == 0
+            continue
+        length = len(path)
+        cells = list(path)
+        checkPath(grid_map, start, goal, cells)
+        assert len(cells) == length >= oracle[goal]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_hierarchical_paths_match_bfs(seed):
+    checkHierarchical(HierarchicalMap(randomMap(seed), cluster_size=5), seed)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_hierarchical_update_matches_a_rebuild(seed):
+    grid_map = randomMap(seed)
+    hierarchy = HierarchicalMap(grid_map, cluster_size=5)
+    rng = np.random.default_rng(seed)
+    for _ in range(5):
+        changed = [(int(x), int(y)) for x, y in zip(rng.integers(grid_map.width, size=6), rng.integers(grid_map.height, size=6))]
+        for x, y in changed:
+            grid_map.setBlocked(x, y, grid_map.isFree(x, y))
+        hierarchy.update(changed)
+        assert hierarchy.edges == HierarchicalMap(grid_map, cluster_size=5).edges
+    checkHierarchical(hierarchy, seed)
+
+
+def checkPlanner(planner):
+    """The planner path from its start is a shortest one, or empty without a path."""
+    grid_map = planner.grid_map
+    oracle = distances(grid_map, planner.start)
+    path = planner.path()
+    if planner.goal not in oracle:
+        assert path == []
+        return
+    checkPath(grid_map, planner.start, planner.goal, path)
+    assert len(path) == oracle[planner.goal]
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_dstar_lite_repairs_match_bfs(seed):
+    rng = np.random.default_rng(seed)
+    for start, goal, _ in queries(randomMap(seed), seed, count=8):
+        grid_map = randomMap(seed)  # Each query toggles the cells of its own map
+        planner = DStarLite(grid_map, start, goal)
+        planner.computeShortestPath()
+        checkPlanner(planner)
+
+        # Move along the path and toggle cells around, repairing after each change
+        for _ in range(4):
+            path = planner.path()
+            if path:
+                planner.moveTo(path[min(2, len(path) - 1)])
+            # A cell in the middle of the path is always blocked, so the repair has to go around
+            path = planner.path()
+            changed = [path[len(path) // 2]] if len(path) > 2 else []
+            if changed:
+                grid_map.setBlocked(*changed[0], True)
+            for x, y in zip(rng.integers(grid_map.width, size=5), rng.integers(grid_map.height, size=5)):
+                cell = (int(x), int(y))
+                if cell not in (planner.start, goal) and cell not in changed:
+                    grid_map.setBlocked(*cell, grid_map.isFree(*cell))
+                    changed.append(cell)
+            planner.updateCells(changed)
+            checkPlanner(planner)
+            assert planner.copy().path() == planner.path()
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_components_match_bfs(seed):
+    grid_map = randomMap(seed)
+    rng = np.random.default_rng(seed)
+    for _ in range(3):
+        for start, goal, oracle in queries(grid_map, seed, count=15):
+            assert grid_map.connected(start, goal) == (goal in oracle)
+        # The labels are computed again after a change
+        for x, y in zip(rng.integers(grid_map.width, size=8), rng.integers(grid_map.height, size=8)):
+            grid_map.setBlocked(int(x), int(y), grid_map.isFree(int(x), int(y)))
+
+
+@pytest.mark.parametrize("weight", [1.0, 1.5])
+@pytest.mark.parametrize("seed", range(4))
+def test_anytime_search_matches_bfs(seed, weight):
+    grid_map = randomMap(seed)
+    for start, goal, oracle in queries(grid_map, seed, count=20):
+        search = AnytimeSearch(grid_map, start, goal, weight=weight)
+        if goal not in oracle:
+            assert search.run() == 0 and search.path() == []
+            continue
+
+        # Cut by its budget, it always leads somewhere and goes on where it stopped
+        while not search.done:
+            assert search.run(budget=7) <= 7
+            path = search.path()
+            end = path[-1] if path else start
+            checkPath(grid_map, start, end, path)
+            if not search.done:
+                assert grid_map.index(*end) == search.frontier()
+
+        path = search.path()
+        checkPath(grid_map, start, goal, path)
+        assert oracle[goal] <= len(path) <= weight * oracle[goal]
+
+        # Any cell of the tree can start the path to the goal
+        middle = path[len(path) // 2]
+        assert middle in search
+        checkPath(grid_map, middle, goal, search.path(middle))
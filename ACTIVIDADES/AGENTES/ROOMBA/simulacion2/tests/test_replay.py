@@ -0,0 +1,84 @@
+import pytest
+
+from random_agents.agent import Roomba, TrashAgent
+from random_agents.replay import Replay, readVarint, writeVarint
+
+
+def roombas(model):
+    """Roombas of a running model, as the replay describes them."""
+    return sorted(
+        (roomba.unique_id, *roomba.cell.coordinate, roomba.battery, roomba.state, roomba.trash_cleaned)
+        for roomba in model.agents_by_type[Roomba]
+    )
+
+
+def replayed(state):
+    return sorted(
+        (roomba["unique_id"], roomba["x"], roomba["y"], roomba["battery"], roomba["state"], roomba["trash_cleaned"])
+        for roomba in state.roombas()
+    )
+
+
+def trash(model):
+    """Trash agents in each cell of a running model."""
+    counts = {}
+    for agent in model.agents_by_type[TrashAgent]:
+        counts[agent.cell.coordinate] = counts.get(agent.cell.coordinate, 0) + 1
+    return counts
+
+
+def record(model):
+    """Run a recorded model to the end, returns the roombas and trash at every tick."""
+    model.events.keyframe_interval = 25  # Several chunks in a short run
+    ticks = {model.steps: (roombas(model), trash(model))}
+    while model.running:
+        model.step()
+        ticks[model.steps] = (roombas(model), trash(model))
+    return ticks
+
+
+def test_varints():
+    buffer = bytearray()
+    values = [0, 1, 127, 128, 300, 2**40]
+    for value in values:
+        writeVarint(buffer, value)
+    position = 0
+    for value in values:
+        decoded, position = readVarint(buffer, position)
+        assert decoded == value
+    assert position == len(buffer)
+
+
+@pytest.mark.parametrize("params", [{"skip_idle": False}, {"skip_idle": True}])
+def test_replay_matches_the_run(make_model, tmp_path, params):
+    path = tmp_path / "run.log"
+    # Long enough for the roombas to recharge, which skip_idle records as spans
+    model = make_model(num_agents=2, width=24, height=24, max_steps=400, event_log=str(path), **params)
+    ticks = record(model)
+
+    replay = Replay(str(path))
+    assert len(replay.chunks) > 1
+    assert replay.last_tick == model.steps
+
+    # Seeking to a tick and playing every frame give the same states
+    frames = {state.tick: (replayed(state), state.trash.copy()) for state in replay.frames()}
+    for tick, (expected, cells) in ticks.items():
+        state = replay.state(tick)
+        assert replayed(state) == expected
+        assert frames[tick][0] == expected
+        assert {(int(x), int(y)): int(state.trash[x, y]) for x, y in zip(*state.trash.nonzero())} == cells
+
+
+def test_unfinished_log_is_readable(make_model, tmp_path):
+    path = tmp_path / "run.log"
+    model = make_model(num_agents=2, width=24, height=24, event_log=str(path))
+    model.events.keyframe_interval = 10
+    for _ in range(35):
+        model.step()
+    assert model.running
+    model.events.file.flush()
+
+    # No footer yet, the complete chunks are found by walking the file
+    replay = Replay(str(path))
+    assert replay.ticks == [0, 10, 20]
+    assert replay.state(20).tick == 20
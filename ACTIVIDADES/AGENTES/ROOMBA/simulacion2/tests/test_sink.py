@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from random_agents.metrics import ArrayCollector
+from random_agents.sink import ColumnarReader, ColumnarWriter, MetricsReader
+
+from conftest import run
+
+SCHEMA = {"tick": np.int64, "value": np.float64}
+
+
+class Ticker:
+    """Stand-in model for the collector, only steps is read."""
+    def __init__(self):
+        self.steps = 0
+
+
+def collector(sink=None, capacity=4, interval=1):
+    reporters = {
+        "tick": (lambda model: model.steps, np.int64),
+        "value": (lambda model: model.steps / 2, np.float64),
+    }
+    return ArrayCollector(reporters, interval=interval, capacity=capacity, sink=sink)
+
+
+def test_writer_and_reader_round_trip(tmp_path):
+    path = tmp_path / "series.col"
+    writer = ColumnarWriter(path, SCHEMA, group_size=3, metadata={"run": 7})
+    writer.appendMany({"tick": np.arange(5), "value": np.arange(5) * 0.5})
+    writer.append({"tick": 5, "value": 2.5})
+    writer.append({"tick": 6, "value": 3.0})
+    writer.close()
+
+    reader = ColumnarReader(path)
+    assert reader.metadata == {"run": 7}
+    assert len(reader) == 7
+    data = reader.read()
+    assert data["tick"].tolist() == list(range(7))
+    assert data["value"].tolist() == [tick * 0.5 for tick in range(7)]
+    assert reader.read(["value"]).keys() == {"value"}
+
+
+def test_reader_of_an_unfinished_file(tmp_path):
+    path = tmp_path / "series.col"
+    writer = ColumnarWriter(path, SCHEMA, group_size=2)
+    writer.appendMany({"tick": np.arange(5), "value": np.zeros(5)})
+    writer.file.flush()  # Two groups are written, the last row is still buffered
+    assert ColumnarReader(path).read()["tick"].tolist() == [0, 1, 2, 3]
+    assert writer.written()["tick"].tolist() == [0, 1, 2, 3, 4]
+
+
+def test_collector_without_sink_grows():
+    model = Ticker()
+    rows = collector(capacity=2)
+    for model.steps in range(10):
+        rows.collect(model)
+    rows.collect(model)  # The same tick is only collected once
+    df = rows.get_model_vars_dataframe()
+    assert df["tick"].tolist() == list(range(10))
+
+
+def test_collector_with_sink_keeps_every_row(tmp_path):
+    model = Ticker()
+    writer = ColumnarWriter(tmp_path / "model.col", SCHEMA, group_size=3)
+    rows = collector(writer, capacity=4, interval=2)
+    for model.steps in range(21):
+        rows.collect(model)
+        assert rows.get_model_vars_dataframe()["tick"].tolist() == list(range(0, model.steps + 1, 2))
+    assert rows.rows < 4  # Only the rows not streamed yet are in memory
+
+    rows.flush()
+    writer.close()
+    expected = pd.DataFrame({"tick": np.arange(0, 21, 2), "value": np.arange(0, 21, 2) / 2})
+    pd.testing.assert_frame_equal(rows.get_model_vars_dataframe(), expected)
+    pd.testing.assert_frame_equal(ColumnarReader(tmp_path / "model.col").dataframe(), expected)
+
+
+def test_last_row_does_not_read_the_sink(tmp_path, monkeypatch):
+    model = Ticker()
+    plain = collector(capacity=2)
+    writer = ColumnarWriter(tmp_path / "model.col", SCHEMA, group_size=3)
+    streamed = collector(writer, capacity=4)
+    assert plain.lastRow().empty and streamed.lastRow().empty
+
+    monkeypatch.setattr(writer, "written", lambda: pytest.fail("the sink was read back"))
+    for model.steps in range(13):
+        plain.collect(model)
+        streamed.collect(model)
+        pd.testing.assert_frame_equal(streamed.lastRow(), plain.lastRow())
+        pd.testing.assert_frame_equal(plain.lastRow(), plain.get_model_vars_dataframe().tail(1))
+    streamed.flush()  # Every row is in the sink now
+    pd.testing.assert_frame_equal(streamed.lastRow(), plain.lastRow())
+
+
+def test_verbose_run_with_sink_prints_the_same(make_model, tmp_path, capsys):
+    # Longer than the rows the collector keeps in memory, so some are streamed
+    params = {"num_agents": 1, "width": 30, "height": 30, "max_steps": 1100, "verbose": True}
+    plain = run(make_model(**params))
+    expected = capsys.readouterr().out
+    streamed = run(make_model(**params, sink=str(tmp_path / "run")))
+    assert streamed.datacollector.streamed > 0
+    assert capsys.readouterr().out == expected
+    assert str(plain.steps) in expected
+
+
+def test_model_with_sink_matches_model_without(make_model, tmp_path):
+    plain = run(make_model(max_steps=300))
+    streamed = run(make_model(max_steps=300, sink=str(tmp_path / "run")))
+    expected = plain.datacollector.get_model_vars_dataframe()
+    assert len(expected) == plain.steps + 1
+
+    pd.testing.assert_frame_equal(streamed.datacollector.get_model_vars_dataframe(), expected)
+    reader = MetricsReader(str(tmp_path / "run"))
+    pd.testing.assert_frame_equal(reader.modelDataframe(), expected)
+
+    agents = reader.agentsDataframe()
+    assert set(agents["Time (Steps)"]) == set(expected["Time (Steps)"])
+    assert set(agents["state"]) <= {"idle", "ready", "returning", "recharging", "waiting", "moving",
+                                    "cleaning", "checkObstacles", "checkTrash", "communicating"}
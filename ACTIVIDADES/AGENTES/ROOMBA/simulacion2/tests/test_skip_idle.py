@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from random_agents.agent import Roomba
+from random_agents.sink import MetricsReader
+
+
+def stepped(model):
+    """Run a model to the end, returns the number of calls to step."""
+    calls = 0
+    while model.running:
+        model.step()
+        calls += 1
+    return calls
+
+
+@pytest.mark.parametrize("params", [{}, {"cooperative": True}, {"collect_interval": 3}])
+def test_skipping_idle_ticks_keeps_the_series(make_model, tmp_path, params):
+    # Long enough for the roombas to recharge together
+    config = {"num_agents": 2, "width": 24, "height": 24, "max_steps": 400, **params}
+    plain = make_model(skip_idle=False, sink=str(tmp_path / "plain"), **config)
+    skipping = make_model(skip_idle=True, sink=str(tmp_path / "skipping"), **config)
+    assert stepped(plain) == plain.steps
+    assert stepped(skipping) < skipping.steps == plain.steps
+
+    pd.testing.assert_frame_equal(
+        skipping.datacollector.get_model_vars_dataframe(), plain.datacollector.get_model_vars_dataframe()
+    )
+    expected = MetricsReader(str(tmp_path / "plain"))
+    reader = MetricsReader(str(tmp_path / "skipping"))
+    pd.testing.assert_frame_equal(reader.modelDataframe(), expected.modelDataframe())
+    pd.testing.assert_frame_equal(reader.agentsDataframe(), expected.agentsDataframe())
+
+    def roombas(model):
+        return [(roomba.cell.coordinate, roomba.battery, roomba.state, roomba.steps, roomba.trash_cleaned)
+                for roomba in model.agents_by_type[Roomba]]
+
+    assert roombas(skipping) == roombas(plain)
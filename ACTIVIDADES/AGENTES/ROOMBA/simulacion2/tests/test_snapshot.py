@@ -0,0 +1,118 @@
+import pytest
+
+from random_agents.agent import Roomba
+
+from conftest import run
+
+CONFIGS = [
+    {"skip_idle": False},
+    {"cooperative": True},
+    {"coordinated": True},
+    {"skip_idle": True},
+    {"incremental": True, "search_budget": 32},
+    {"pathfinding": "hpa", "cluster_size": 8},
+]
+
+
+def roombas(model):
+    """Roombas in scheduler order, a fork gives them new unique_ids."""
+    return [
+        (roomba.cell.coordinate, roomba.battery, roomba.state, roomba.steps, roomba.trash_cleaned)
+        for roomba in model.agents_by_type[Roomba]
+    ]
+
+
+def history(model):
+    """Run a model to the end, returns the roombas at every tick."""
+    ticks = []
+    while model.running:
+        model.step()
+        ticks.append((model.steps, roombas(model)))
+    return ticks
+
+
+@pytest.mark.parametrize("params", CONFIGS)
+def test_fork_continues_like_the_original(make_model, params):
+    model = run(make_model(num_agents=4, width=24, height=24, **params), ticks=60)
+    assert model.running
+
+    fork = model.fork()
+    second = fork.fork()  # Fork of a fork
+    assert roombas(fork) == roombas(second) == roombas(model)
+
+    expected = history(model)
+    assert history(fork) == expected
+    assert history(second) == expected
+
+    # The rows of a fork start at the tick it was forked
+    rows = model.datacollector.get_model_vars_dataframe()
+    forked = fork.datacollector.get_model_vars_dataframe()
+    assert forked.equals(rows.iloc[-len(forked):].reset_index(drop=True))
+
+
+def test_forking_does_not_change_the_model(make_model):
+    model = run(make_model(cooperative=True), ticks=40)
+    model.fork()
+    model.snapshot()
+    untouched = run(make_model(cooperative=True), ticks=40)
+    assert history(model) == history(untouched)
+
+
+def test_snapshot_forks_many_times(make_model):
+    model = run(make_model(), ticks=30)
+    snapshot = model.snapshot()
+    first = type(model).fromSnapshot(snapshot)
+    expected = history(first)
+    assert history(type(model).fromSnapshot(snapshot)) == expected
+    assert history(model) == expected
+
+
+def test_fork_with_other_parameters(make_model):
+    model = run(make_model(), ticks=30)
+    fork = model.fork(max_steps=45, cooperative=True)
+    assert fork.reservations is not None
+    run(fork)
+    assert fork.steps == 45
+
+
+def freeCells(model, count):
+    """Free cells without a station or a roomba, that setPassable can block."""
+    cells = [
+        (x, y) for x in range(model.width) for y in range(model.height)
+        if model.grid_map.isFree(x, y) and (x, y) not in model.stations and not model.roomba_positions.get((x, y))
+    ]
+    return cells[::len(cells) // count][:count]
+
+
+def test_forks_share_the_maps_until_a_change(make_model):
+    params = {"num_agents": 4, "width": 24, "height": 24, "pathfinding": "hpa", "cluster_size": 8}
+    model = run(make_model(**params), ticks=30)
+    fork = model.fork()
+    assert fork.grid_map is model.grid_map and fork.hierarchy is model.hierarchy
+
+    blocked = freeCells(fork, 3)
+    fork.setPassable(blocked, False)
+    assert fork.grid_map is not model.grid_map and fork.hierarchy.grid_map is fork.grid_map
+    assert all(model.grid_map.isFree(*coord) and not fork.grid_map.isFree(*coord) for coord in blocked)
+
+    # The fork goes on like a model that was never forked
+    untouched = run(make_model(**params), ticks=30)
+    untouched.setPassable(blocked, False)
+    assert history(fork) == history(untouched)
+    assert fork.hierarchy.edges == untouched.hierarchy.edges
+
+    # A change in the original does not reach its snapshot
+    snapshot = model.snapshot()
+    model.setPassable(blocked, False)
+    assert all(snapshot.grid_map.isFree(*coord) for coord in blocked)
+    assert all(type(model).fromSnapshot(snapshot).grid_map.isFree(*coord) for coord in blocked)
+
+
+def test_kept_planners_read_the_copied_map(make_model):
+    model = make_model(num_agents=4, width=24, height=24, incremental=True)
+    while not any(roomba.planner is not None and roomba.path_back_to_station for roomba in model.agents_by_type[Roomba]):
+        run(model, ticks=1)
+    fork = model.fork()
+    fork.setPassable(freeCells(fork, 3), False)
+    planners = [roomba.planner for roomba in fork.agents_by_type[Roomba] if roomba.planner is not None]
+    assert planners and all(planner.grid_map is fork.grid_map for planner in planners)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from random_agents.stream import (
+    CELL_OBSTACLE, CELL_TRASH, CELL_VISITED, DELTA, DELTA_HEADER, KEYFRAME, KEYFRAME_HEADER, ROOMBA_RECORD,
+    StateEncoder,
+)
+
+
+def readKeyframe(message):
+    """Decode a keyframe as the viewer does, returns (tick, cells, roomba records)."""
+    kind, tick, width, height, count = KEYFRAME_HEADER.unpack_from(message)
+    assert kind == KEYFRAME
+    start = KEYFRAME_HEADER.size
+    cells = np.frombuffer(message, dtype=np.uint8, count=width * height, offset=start).reshape(width, height)
+    roombas = np.frombuffer(message, dtype=ROOMBA_RECORD, count=count, offset=start + width * height)
+    return tick, cells.copy(), roombas.copy()
+
+
+def applyDelta(message, cells, roombas):
+    """Apply a delta to a decoded keyframe, returns its tick."""
+    kind, tick, changed, cleaned, visited, blocked, opened = DELTA_HEADER.unpack_from(message)
+    assert kind == DELTA
+    position = DELTA_HEADER.size
+    records = np.frombuffer(message, dtype=ROOMBA_RECORD, count=changed, offset=position)
+    roombas[records["slot"]] = records
+    position += records.nbytes
+
+    flat = cells.reshape(-1)
+    for count, set_bits, clear_bits in ((cleaned, 0, CELL_TRASH), (visited, CELL_VISITED, 0),
+                                        (blocked, CELL_OBSTACLE, 0), (opened, 0, CELL_OBSTACLE)):
+        indexes = np.frombuffer(message, dtype="<u4", count=count, offset=position)
+        flat[indexes] = (flat[indexes] | set_bits) & (0xFF ^ clear_bits)
+        position += indexes.nbytes
+    assert position == len(message)
+    return tick
+
+
+@pytest.mark.parametrize("params", [{"skip_idle": False}, {"skip_idle": True}])
+def test_deltas_rebuild_the_keyframes(make_model, params):
+    model = make_model(num_agents=3, width=20, height=20, max_steps=300, **params)
+    encoder = StateEncoder(model)
+    tick, cells, roombas = readKeyframe(encoder.keyframe())
+    assert tick == 0
+
+    rng = np.random.default_rng(0)
+    while model.running:
+        model.step()
+        if model.steps % 25 == 0:
+            # Block or open a cell without a station or a roomba on it
+            coord = tuple(int(value) for value in rng.integers(model.width, size=2))
+            if coord not in model.stations and not model.roomba_positions.get(coord):
+                model.setPassable([coord], not model.grid_map.isFree(*coord))
+        tick = applyDelta(encoder.delta(), cells, roombas)
+        assert tick == model.steps
+
+        expected_tick, expected_cells, expected_roombas = readKeyframe(encoder.keyframe())
+        assert expected_tick == tick
+        assert np.array_equal(cells, expected_cells)
+        assert np.array_equal(roombas, expected_roombas)
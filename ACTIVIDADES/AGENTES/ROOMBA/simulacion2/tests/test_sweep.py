@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from random_agents.sweep import adaptiveSweep, comparable, configurations, dominates, runSeed, sweep
+
+# Small runs, every configuration ends by max_steps
+BASE = {"height": [8], "num_agents": [2], "max_steps": [40]}
+
+
+def test_configurations_expand_the_grid():
+    configs = configurations([{"width": [8, 10], "coordinated": [False, True]}, {"width": [12]}])
+    assert len(configs) == 5
+    assert configs[-1] == {"width": 12}
+
+
+def test_reserved_parameters_can_not_be_swept():
+    for name in ("verbose", "collect_interval", "world", "empty_agents"):
+        with pytest.raises(ValueError, match=name):
+            configurations([{"width": [8]}, {name: [None]}])
+
+
+def test_sweep_of_the_seed(tmp_path):
+    grid = {**BASE, "width": [8], "seed": [1, 2]}
+    results = sweep(grid, replications=2, workers=2, out=str(tmp_path / "runs.csv"))
+    assert len(results) == 4
+    assert sorted(set(results["base_seed"])) == [1, 2]
+
+    # A swept seed is the base seed of its runs
+    for _, row in results.iterrows():
+        config = {"height": 8, "max_steps": 40, "num_agents": 2, "seed": int(row["base_seed"]), "width": 8}
+        assert row["seed"] == runSeed(config["seed"], config, row["replication"])
+    assert results["seed"].nunique() == 4
+
+
+def test_seeds_do_not_depend_on_the_order():
+    assert runSeed(42, {"width": 8}, 0) == runSeed(42, {"width": 8}, 0)
+    assert runSeed(42, {"width": 8}, 0) != runSeed(42, {"width": 8}, 1)
+    assert runSeed(42, {"width": 8}, 0) != runSeed(42, {"width": 10}, 0)
+
+
+def test_only_the_strategy_may_differ_to_compare():
+    assert comparable({"width": 16, "coordinated": False}, {"width": 16, "coordinated": True})
+    assert comparable({"width": 16, "pathfinding": "jps"}, {"width": 16, "search_budget": 64})
+    assert not comparable({"width": 16, "coordinated": True}, {"width": 30, "coordinated": True})
+    assert not comparable({"num_agents": 2}, {"num_agents": 4})
+
+
+def test_dominates_needs_separated_intervals():
+    metrics = {"Time (Steps)": False, "Trash Collected %": True}
+    fast = {"Time (Steps)": (100, 5, 3), "Trash Collected %": (100, 0, 3)}
+    slow = {"Time (Steps)": (200, 5, 3), "Trash Collected %": (100, 0, 3)}
+    close = {"Time (Steps)": (108, 5, 3), "Trash Collected %": (100, 0, 3)}
+    assert dominates(fast, slow, metrics)
+    assert not dominates(slow, fast, metrics)
+    assert not dominates(fast, close, metrics)
+
+
+def test_adaptive_sweep_does_not_prune_across_scenarios(tmp_path):
+    grid = {**BASE, "width": [8, 16]}
+    summary = adaptiveSweep(grid, min_replications=3, max_replications=3, workers=2, out=str(tmp_path / "runs.csv"))
+    assert len(summary) == 2
+    assert "dominated" not in set(summary["Stopped"])
+    assert (summary["Replications"] == 3).all()
+
+
+def test_sweep_with_shared_worlds_repeats_the_world(tmp_path, capfd):
+    grid = {**BASE, "width": [8], "world_seed": [5], "coordinated": [False, True]}
+    results = sweep(grid, replications=2, workers=2, out=str(tmp_path / "runs.csv"))
+    assert len(results) == 4
+    assert "Traceback" not in capfd.readouterr().err
+
+    # Resuming the same sweep runs nothing new
+    again = sweep(grid, replications=2, workers=2, out=str(tmp_path / "runs.csv"))
+    pd.testing.assert_frame_equal(results, again)
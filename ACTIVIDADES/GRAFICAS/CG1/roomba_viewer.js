@@ -0,0 +1,394 @@
+/*
+ * Viewer of the Roomba simulation streamed by simulacion2/server.py
+ *
+ * The map is a single quad textured with the code of every cell, and
+ * all the roombas are drawn with one instanced call, so a frame costs
+ * the same number of draw calls for any map size.
+ * Connect with ?server=ws://host:port (default ws://localhost:8765)
+ */
+
+
+'use strict';
+
+import * as twgl from 'twgl-base.js';
+import { M3 } from './A01785378-2d-libs.js';
+import GUI from 'lil-gui';
+
+// Message types and layout, must match random_agents/stream.py
+const KEYFRAME = 0;
+const DELTA = 1;
+const KEYFRAME_HEADER = 17; // type u8, tick u32, width u16, height u16, roombas u32
+const DELTA_HEADER = 25; // type u8, tick u32, roombas u32, cleaned u32, visited u32, blocked u32, opened u32
+const ROOMBA_RECORD = 10; // slot u32, x u16, y u16, battery u8, state u8
+
+const CELL_OBSTACLE = 1;
+const CELL_TRASH = 4;
+const CELL_VISITED = 8;
+const DEAD = 255;
+const RECHARGING = 3; // Code of "recharging" in random_agents/sink.py
+
+// Shader of the map: every fragment reads the code of its cell
+const mapVsGLSL = `#version 300 es
+in vec2 a_position;
+
+uniform vec2 u_resolution;
+uniform mat3 u_transforms;
+
+out vec2 v_cell;
+
+void main() {
+    // Positions are in cells, the transforms take them to pixels
+    v_cell = a_position;
+    vec2 position = (u_transforms * vec3(a_position, 1)).xy;
+
+    // Convert from pixels to clip space, inverting the Y axis
+    vec2 clipSpace = position / u_resolution * 2.0 - 1.0;
+    gl_Position = vec4(clipSpace * vec2(1, -1), 0, 1);
+}
+`;
+
+const mapFsGLSL = `#version 300 es
+precision highp float;
+precision highp usampler2D;
+
+uniform usampler2D u_cells;
+uniform vec4 u_empty;
+uniform vec4 u_visited;
+uniform vec4 u_obstacle;
+uniform vec4 u_station;
+uniform vec4 u_trash;
+
+in vec2 v_cell;
+
+out vec4 outColor;
+
+void main() {
+    uint code = texelFetch(u_cells, ivec2(floor(v_cell)), 0).r;
+
+    // Same priority as the matplotlib renderer: trash over stations over obstacles
+    if ((code & 4u) != 0u) {
+        outColor = u_trash;
+    } else if ((code & 2u) != 0u) {
+        outColor = u_station;
+    } else if ((code & 1u) != 0u) {
+        outColor = u_obstacle;
+    } else if ((code & 8u) != 0u) {
+        outColor = u_visited;
+    } else {
+        outColor = u_empty;
+    }
+}
+`;
+
+// Shader of the roombas: one quad per instance, cut as a circle
+const roombaVsGLSL = `#version 300 es
+in vec2 a_position;
+in vec2 a_offset;
+in vec4 a_color;
+
+uniform vec2 u_resolution;
+uniform mat3 u_transforms;
+uniform float u_size;
+
+out vec2 v_local;
+out vec4 v_color;
+
+void main() {
+    v_local = a_position;
+    v_color = a_color;
+
+    // Center of the cell of the roomba
+    vec2 cell = a_offset + 0.5 + a_position * u_size;
+    vec2 position = (u_transforms * vec3(cell, 1)).xy;
+
+    vec2 clipSpace = position / u_resolution * 2.0 - 1.0;
+    gl_Position = vec4(clipSpace * vec2(1, -1), 0, 1);
+}
+`;
+
+const roombaFsGLSL = `#version 300 es
+precision highp float;
+
+in vec2 v_local;
+in vec4 v_color;
+
+out vec4 outColor;
+
+void main() {
+    if (dot(v_local, v_local) > 0.25) {
+        discard;
+    }
+    outColor = v_color;
+}
+`;
+
+// Colors of the cells and the roombas, editable in the UI
+const settings = {
+    empty: [1, 1, 1, 1],
+    visited: [0.83, 0.83, 0.83, 1],
+    obstacle: [0.549, 0.533, 0.533, 1],
+    station: [1, 0.757, 0.027, 1],
+    trash: [1, 0, 0, 1],
+    roomba: [0, 0.478, 1, 1],
+    recharging: [0.298, 0.686, 0.314, 1],
+    dead: [0.2, 0.2, 0.2, 1],
+    size: 0.8,
+};
+
+// State of the simulation, as received from the server
+const simulation = {
+    tick: 0,
+    width: 0,
+    height: 0,
+    cells: null,     // Codes in texture order, y * width + x
+    offsets: null,   // Cell of every roomba slot
+    colors: null,    // Color of every roomba slot
+    count: 0,
+    cellsDirty: false,
+    roombasDirty: false,
+};
+
+// Write the records of some roombas in the instance arrays
+function applyRoombas(view, offset, count) {
+    for (let i = 0; i < count; i++) {
+        const record = offset + i * ROOMBA_RECORD;
+        const slot = view.getUint32(record, true);
+        const state = view.getUint8(record + 9);
+        simulation.offsets[slot * 2] = view.getUint16(record + 4, true);
+        simulation.offsets[slot * 2 + 1] = view.getUint16(record + 6, true);
+
+        const color = state === DEAD ? settings.dead
+            : state === RECHARGING ? settings.recharging
+            : settings.roomba;
+        simulation.colors.set(color, slot * 4);
+    }
+    simulation.roombasDirty = true;
+}
+
+// Convert a cell index of the server (x * height + y) to the texture index
+function textureIndex(index) {
+    const x = Math.floor(index / simulation.height);
+    const y = index % simulation.height;
+    return y * simulation.width + x;
+}
+
+// Decode a keyframe, replacing the whole state
+function readKeyframe(view) {
+    simulation.tick = view.getUint32(1, true);
+    simulation.width = view.getUint16(5, true);
+    simulation.height = view.getUint16(7, true);
+    simulation.count = view.getUint32(9, true);
+
+    const size = simulation.width * simulation.height;
+    simulation.cells = new Uint8Array(size);
+    for (let index = 0; index < size; index++) {
+        simulation.cells[textureIndex(index)] = view.getUint8(KEYFRAME_HEADER + index);
+    }
+    simulation.offsets = new Float32Array(simulation.count * 2);
+    simulation.colors = new Float32Array(simulation.count * 4);
+    applyRoombas(view, KEYFRAME_HEADER + size, simulation.count);
+    simulation.cellsDirty = true;
+}
+
+// Decode a delta over the current state
+function readDelta(view) {
+    if (simulation.cells === null) {
+        return; // Deltas before the keyframe are useless
+    }
+    simulation.tick = view.getUint32(1, true);
+    const roombas = view.getUint32(5, true);
+    const cleaned = view.getUint32(9, true);
+    const visited = view.getUint32(13, true);
+    const blocked = view.getUint32(17, true);
+    const opened = view.getUint32(21, true);
+
+    let offset = DELTA_HEADER;
+    applyRoombas(view, offset, roombas);
+    offset += roombas * ROOMBA_RECORD;
+
+    for (let i = 0; i < cleaned; i++, offset += 4) {
+        simulation.cells[textureIndex(view.getUint32(offset, true))] &= ~CELL_TRASH;
+    }
+    for (let i = 0; i < visited; i++, offset += 4) {
+        simulation.cells[textureIndex(view.getUint32(offset, true))] |= CELL_VISITED;
+    }
+    for (let i = 0; i < blocked; i++, offset += 4) {
+        simulation.cells[textureIndex(view.getUint32(offset, true))] |= CELL_OBSTACLE;
+    }
+    for (let i = 0; i < opened; i++, offset += 4) {
+        simulation.cells[textureIndex(view.getUint32(offset, true))] &= ~CELL_OBSTACLE;
+    }
+    if (cleaned + visited + blocked + opened > 0) {
+        simulation.cellsDirty = true;
+    }
+}
+
+function connect(url, status) {
+    const socket = new WebSocket(url);
+    socket.binaryType = 'arraybuffer';
+    socket.onopen = () => { status.connection = 'connected'; };
+    socket.onclose = () => { status.connection = 'closed'; };
+    socket.onmessage = (event) => {
+        const view = new DataView(event.data);
+        const type = view.getUint8(0);
+        if (type === KEYFRAME) {
+            readKeyframe(view);
+        } else if (type === DELTA) {
+            readDelta(view);
+        }
+        status.tick = simulation.tick;
+    };
+}
+
+// Create or resize the texture of the cell codes
+function createCellTexture(gl) {
+    const texture = gl.createTexture();
+    gl.bindTexture(gl.TEXTURE_2D, texture);
+    gl.texParameteri(gl.TEXTURE_2D, gl.TEXTURE_MIN_FILTER, gl.NEAREST);
+    gl.texParameteri(gl.TEXTURE_2D, gl.TEXTURE_MAG_FILTER, gl.NEAREST);
+    gl.texParameteri(gl.TEXTURE_2D, gl.TEXTURE_WRAP_S, gl.CLAMP_TO_EDGE);
+    gl.texParameteri(gl.TEXTURE_2D, gl.TEXTURE_WRAP_T, gl.CLAMP_TO_EDGE);
+    return texture;
+}
+
+// Upload the cells when they changed, the whole map is a single call
+function uploadCells(gl, map) {
+    if (!simulation.cellsDirty) {
+        return;
+    }
+    gl.bindTexture(gl.TEXTURE_2D, map.texture);
+    gl.pixelStorei(gl.UNPACK_ALIGNMENT, 1);
+    if (map.width !== simulation.width || map.height !== simulation.height) {
+        // New map, allocate the texture and the quad
+        map.width = simulation.width;
+        map.height = simulation.height;
+        gl.texImage2D(gl.TEXTURE_2D, 0, gl.R8UI, map.width, map.height, 0,
+            gl.RED_INTEGER, gl.UNSIGNED_BYTE, simulation.cells);
+        twgl.setAttribInfoBufferFromArray(gl, map.bufferInfo.attribs.a_position,
+            [0, 0, map.width, 0, map.width, map.height, 0, map.height]);
+    } else {
+        gl.texSubImage2D(gl.TEXTURE_2D, 0, 0, 0, map.width, map.height,
+            gl.RED_INTEGER, gl.UNSIGNED_BYTE, simulation.cells);
+    }
+    simulation.cellsDirty = false;
+}
+
+// Upload the per instance data of the roombas
+function uploadRoombas(gl, roombas) {
+    if (!simulation.roombasDirty) {
+        return;
+    }
+    twgl.setAttribInfoBufferFromArray(gl, roombas.bufferInfo.attribs.a_offset, simulation.offsets);
+    twgl.setAttribInfoBufferFromArray(gl, roombas.bufferInfo.attribs.a_color, simulation.colors);
+    simulation.roombasDirty = false;
+}
+
+// Transform from cells to pixels: fit the map in the canvas, y growing upwards
+function mapTransforms(gl) {
+    const cell = Math.min(gl.canvas.width / simulation.width, gl.canvas.height / simulation.height);
+    const left = (gl.canvas.width - cell * simulation.width) / 2;
+    const top = (gl.canvas.height - cell * simulation.height) / 2;
+
+    let transforms = M3.identity();
+    transforms = M3.multiply(M3.scale([cell, -cell]), transforms);
+    transforms = M3.multiply(M3.translation([left, top + cell * simulation.height]), transforms);
+    return transforms;
+}
+
+function main() {
+    const canvas = document.querySelector('canvas');
+    const gl = canvas.getContext('webgl2');
+    twgl.resizeCanvasToDisplaySize(gl.canvas);
+    gl.viewport(0, 0, gl.canvas.width, gl.canvas.height);
+
+    const mapProgram = twgl.createProgramInfo(gl, [mapVsGLSL, mapFsGLSL]);
+    const roombaProgram = twgl.createProgramInfo(gl, [roombaVsGLSL, roombaFsGLSL]);
+
+    // A single quad for the map, resized when a keyframe arrives
+    const mapBufferInfo = twgl.createBufferInfoFromArrays(gl, {
+        a_position: { numComponents: 2, data: new Float32Array(8) },
+        indices: { numComponents: 3, data: [0, 1, 2, 0, 2, 3] },
+    });
+    const map = {
+        texture: createCellTexture(gl),
+        bufferInfo: mapBufferInfo,
+        vao: twgl.createVAOFromBufferInfo(gl, mapProgram, mapBufferInfo),
+        width: 0,
+        height: 0,
+    };
+
+    // A unit quad shared by all the roombas, offset and color are per instance
+    const roombaBufferInfo = twgl.createBufferInfoFromArrays(gl, {
+        a_position: { numComponents: 2, data: [-0.5, -0.5, 0.5, -0.5, 0.5, 0.5, -0.5, 0.5] },
+        a_offset: { numComponents: 2, data: new Float32Array(2), divisor: 1 },
+        a_color: { numComponents: 4, data: new Float32Array(4), divisor: 1 },
+        indices: { numComponents: 3, data: [0, 1, 2, 0, 2, 3] },
+    });
+    const roombas = {
+        bufferInfo: roombaBufferInfo,
+        vao: twgl.createVAOFromBufferInfo(gl, roombaProgram, roombaBufferInfo),
+    };
+
+    const params = new URLSearchParams(window.location.search);
+    const status = { connection: 'connecting', tick: 0 };
+    setupUI(status);
+    connect(params.get('server') || 'ws://localhost:8765', status);
+
+    drawScene(gl, mapProgram, roombaProgram, map, roombas);
+}
+
+function drawScene(gl, mapProgram, roombaProgram, map, roombas) {
+    gl.clearColor(1, 1, 1, 1);
+    gl.clear(gl.COLOR_BUFFER_BIT);
+
+    if (simulation.cells !== null) {
+        uploadCells(gl, map);
+        uploadRoombas(gl, roombas);
+        const transforms = mapTransforms(gl);
+
+        gl.useProgram(mapProgram.program);
+        twgl.setUniforms(mapProgram, {
+            u_resolution: [gl.canvas.width, gl.canvas.height],
+            u_transforms: transforms,
+            u_cells: map.texture,
+            u_empty: settings.empty,
+            u_visited: settings.visited,
+            u_obstacle: settings.obstacle,
+            u_station: settings.station,
+            u_trash: settings.trash,
+        });
+        gl.bindVertexArray(map.vao);
+        twgl.drawBufferInfo(gl, map.bufferInfo);
+
+        gl.useProgram(roombaProgram.program);
+        twgl.setUniforms(roombaProgram, {
+            u_resolution: [gl.canvas.width, gl.canvas.height],
+            u_transforms: transforms,
+            u_size: settings.size,
+        });
+        gl.bindVertexArray(roombas.vao);
+        twgl.drawBufferInfo(gl, roombas.bufferInfo, gl.TRIANGLES, 6, 0, simulation.count);
+    }
+
+    requestAnimationFrame(() => drawScene(gl, mapProgram, roombaProgram, map, roombas));
+}
+
+function setupUI(status) {
+    const gui = new GUI();
+
+    const simFolder = gui.addFolder('Simulation');
+    simFolder.add(status, 'connection').listen().disable();
+    simFolder.add(status, 'tick').listen().disable();
+
+    const colFolder = gui.addFolder('Colors');
+    for (const name of ['empty', 'visited', 'obstacle', 'station', 'trash']) {
+        colFolder.addColor(settings, name);
+    }
+    // Roomba colors are baked in the instance data, so they apply from the next update
+    for (const name of ['roomba', 'recharging', 'dead']) {
+        colFolder.addColor(settings, name);
+    }
+    gui.add(settings, 'size', 0.2, 1).name('Roomba size');
+}
+
+main()